@@ -0,0 +1,89 @@
+"""Player accounts (users.json), kept in memory.
+
+The file is read once at startup into a dict keyed by lowercase name. Logins
+never touch the disk. A registration updates the dict straight away and
+wakes a writer thread, which waits FLUSH_INTERVAL so a burst of
+registrations shares one write, then replaces the file atomically (temp
+file, fsync, rename). A crash loses at most the last FLUSH_INTERVAL of
+registrations, never the file.
+
+Hashing and verification run on a small dedicated thread pool, so a burst of
+logins can't starve the event loop or the default executor the level
+stream uses.
+"""
+import asyncio, hashlib, hmac, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+import ujson as json
+
+HASH_WORKERS = min(4, os.cpu_count() or 1)
+FLUSH_INTERVAL = 1.0  # seconds a registration may wait before it is on disk
+
+
+def hash_password(password):
+    return hashlib.sha512(password.encode()).hexdigest()
+
+
+def check_password(password, expected):
+    return hmac.compare_digest(hash_password(password), expected)
+
+
+class AccountStore:
+    def __init__(self, path, workers=HASH_WORKERS):
+        self.path = path
+        self.users = {}  # lowercase name -> password hash
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.users = {name.lower(): pw_hash for name, pw_hash in json.load(f).items()}
+        self.lock = threading.Lock()  # guards users against the writer's copy
+        self.dirty = threading.Event()
+        self.flush_lock = threading.Lock()  # flushes share users.json.tmp, one at a time
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="hash")
+
+    def __len__(self):
+        return len(self.users)
+
+    def __contains__(self, name):
+        return name.lower() in self.users
+
+    def start(self):
+        threading.Thread(target=self._writer, name="accounts", daemon=True).start()
+
+    async def register(self, name, password):
+        """Add an account; False if the name is taken (checked again after hashing,
+        so two racing registrations can't both win)"""
+        if name in self: return False
+        pw_hash = await asyncio.get_running_loop().run_in_executor(self.pool, hash_password, password)
+        with self.lock:
+            if name.lower() in self.users: return False
+            self.users[name.lower()] = pw_hash
+        self.dirty.set()
+        return True
+
+    async def verify(self, name, password):
+        expected = self.users.get(name.lower())
+        if expected is None: return False
+        return await asyncio.get_running_loop().run_in_executor(self.pool, check_password, password, expected)
+
+    def flush(self):
+        """Write the accounts out if anything changed since the last flush"""
+        with self.flush_lock:
+            if not self.dirty.is_set(): return
+            self.dirty.clear()
+            with self.lock:
+                users = dict(self.users)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(users, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+    def _writer(self):
+        while True:
+            self.dirty.wait()
+            time.sleep(FLUSH_INTERVAL)  # let a burst of registrations share the write
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[ERROR] Saving {self.path} failed: {e}")
+                self.dirty.set()
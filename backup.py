@@ -0,0 +1,300 @@
+"""Point-in-time world backups, deduplicated by region.
+
+A snapshot is the region table and the pending block changes of one moment
+(see server.take_backup). Every region is kept as the same encoded payload
+the world file uses, and payloads are content-addressed. One that an earlier
+snapshot already stored is referenced, not written again. A region whose
+table entry hasn't moved since the previous snapshot isn't even re-read.
+Terrain and uniform regions have no payload at all, so a backup costs
+roughly the regions edited since the last one.
+
+    backups/pack-000003.dat       payloads first stored by snapshot 3
+    backups/snapshot-000003.hbs   header + zlib'd table of references into packs
+
+Retention (prune) drops the oldest snapshots, deletes packs nobody references
+any more and rewrites packs that are mostly dead. Restore writes a fresh
+world.rgn by streaming payloads pack by pack, in file order.
+
+    python backup.py list
+    python backup.py restore latest world.rgn      # with the server stopped
+    python backup.py prune --keep 24
+"""
+import argparse, hashlib, os, re, struct, threading, time, zlib
+import numpy as np
+import region, rle
+
+MAGIC = b'HBBK'
+VERSION = 1
+HEADER = struct.Struct('<4sHHHHBBBxdQ')  # magic, version, dims, rdims, created (unix time), generation
+REF = np.dtype([('pack', '<u4'), ('offset', '<u8'), ('length', '<u4'), ('codec', 'u1'), ('fill', 'u1'),
+                ('pad', 'V2'), ('digest', 'V16')])
+
+BACKUP_DIR = "backups"
+KEEP = 24  # snapshots kept by prune()
+REPACK_FRACTION = 0.5  # packs with less than this share of live bytes are rewritten on prune
+
+
+def digest_of(payload):
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+
+class BackupStore:
+    def __init__(self, directory=BACKUP_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.dir = directory
+        self.lock = threading.Lock()  # one create/prune/restore at a time
+        self.objects = {}  # payload digest -> (pack, offset, length)
+        self.last = None  # (reader, refs, touched regions) of the newest snapshot made here
+        self._index()
+
+    def _path(self, kind, n):
+        return os.path.join(self.dir, f"{kind}-{n:06d}.{'dat' if kind == 'pack' else 'hbs'}")
+
+    def _ids(self, kind):
+        pattern = re.compile(rf"{kind}-(\d+)\.(dat|hbs)$")
+        return sorted(int(m.group(1)) for m in map(pattern.match, os.listdir(self.dir)) if m)
+
+    def snapshots(self):
+        return self._ids('snapshot')
+
+    def _next_id(self):
+        return max(self._ids('snapshot') + self._ids('pack'), default=0) + 1
+
+    def load(self, n):
+        """-> (info dict, refs) of snapshot n"""
+        with open(self._path('snapshot', n), 'rb') as f:
+            magic, version, X, Y, Z, RX, RY, RZ, created, generation = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"snapshot {n} is not a version {VERSION} backup")
+            refs = np.frombuffer(zlib.decompress(f.read()), dtype=REF).copy()
+        info = {"id": n, "dims": (X, Y, Z), "rdims": (RX, RY, RZ), "created": created, "generation": generation}
+        return info, refs
+
+    def _write_manifest(self, info, refs):
+        path = self._path('snapshot', info["id"])
+        with open(path + ".tmp", 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, *info["dims"], *info["rdims"], info["created"], info["generation"]))
+            f.write(zlib.compress(refs.tobytes(), 6))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _index(self):
+        self.objects = {}
+        for n in self.snapshots():
+            refs = self.load(n)[1]
+            stored = refs[~np.isin(refs['codec'], region.NO_PAYLOAD)]
+            for digest, pack, offset, length in zip(stored['digest'].tolist(), stored['pack'].tolist(),
+                                                    stored['offset'].tolist(), stored['length'].tolist()):
+                self.objects[digest] = (pack, offset, length)
+
+    def create(self, reader, changes=None, generation=0):
+        """Store the world `reader` (a frozen RegionReader) shows with `changes`
+        (sorted index/block arrays) overlaid -> (snapshot id, new payloads, new bytes)"""
+        with self.lock:
+            n = self._next_id()
+            table = reader.table
+            refs = np.zeros(len(table), dtype=REF)
+            refs['codec'] = table['codec']
+            refs['fill'] = table['fill']
+            terrain = table['codec'] == region.TERRAIN
+            refs['offset'][terrain] = table['offset'][terrain]  # the seed
+
+            idx, vals = rle.sorted_changes(changes)
+            rid, local = reader.locate(idx)
+            order = np.argsort(rid, kind='stable')
+            rid, local, vals = rid[order], local[order], vals[order]
+            starts = np.flatnonzero(np.concatenate(([True], rid[1:] != rid[:-1]))) if len(rid) else rid
+            touched = rid[starts]
+
+            # Unchanged since the last snapshot: same open file, same table entry, no overlay then or now
+            reuse = np.zeros(len(table), dtype=bool)
+            if self.last is not None and self.last[0].f is reader.f and len(self.last[1]) == len(table):
+                last_reader, last_refs, last_touched = self.last
+                old = last_reader.table
+                reuse = ((table['offset'] == old['offset']) & (table['length'] == old['length'])
+                         & (table['codec'] == old['codec']) & (table['fill'] == old['fill']))
+                reuse[last_touched] = False
+                reuse[touched] = False
+                refs[reuse] = last_refs[reuse]
+
+            pack_path = self._path('pack', n)
+            new = []
+            try:
+                with open(pack_path + ".tmp", 'wb') as pack:
+                    def store(r, payload):
+                        digest = digest_of(payload)
+                        ref = self.objects.get(digest)
+                        if ref is None:
+                            ref = self.objects[digest] = (n, pack.tell(), len(payload))
+                            new.append(digest)
+                            pack.write(payload)
+                        refs['pack'][r], refs['offset'][r], refs['length'][r] = ref
+                        refs['digest'][r] = digest
+
+                    # Untouched regions with a payload: copied encoded as they are, in file order
+                    todo = ~np.isin(table['codec'], region.NO_PAYLOAD) & ~reuse
+                    todo[touched] = False
+                    todo = np.flatnonzero(todo)
+                    for r in todo[np.argsort(table['offset'][todo], kind='stable')].tolist():
+                        store(r, reader.read_payload(int(table['offset'][r]), int(table['length'][r])))
+                    # Regions with pending changes are decoded, patched and encoded again
+                    ends = np.append(starts[1:], len(rid))
+                    for s, e in zip(starts.tolist(), ends.tolist()):
+                        r = int(rid[s])
+                        blocks = reader.read_region(r)
+                        blocks[local[s:e]] = vals[s:e]
+                        codec, fill, payload = region.encode_region(blocks)
+                        refs['codec'][r], refs['fill'][r] = codec, fill
+                        refs['offset'][r] = 0
+                        if codec != region.UNIFORM:
+                            store(r, payload)
+                    written = pack.tell()
+                    pack.flush()
+                    os.fsync(pack.fileno())
+                if new:
+                    os.replace(pack_path + ".tmp", pack_path)
+                else:
+                    os.remove(pack_path + ".tmp")
+                info = {"id": n, "dims": (reader.X, reader.Y, reader.Z), "rdims": (reader.RX, reader.RY, reader.RZ),
+                        "created": time.time(), "generation": generation}
+                self._write_manifest(info, refs)
+            except BaseException:
+                for digest in new:
+                    del self.objects[digest]
+                for path in (pack_path + ".tmp", pack_path):
+                    if os.path.exists(path): os.remove(path)
+                raise
+            self.last = (reader, refs, touched)
+            return n, len(new), written
+
+    def prune(self, keep=KEEP):
+        """Keep the newest `keep` snapshots, drop packs only the others used and
+        rewrite packs that are mostly dead -> snapshots removed"""
+        with self.lock:
+            ids = self.snapshots()
+            dropped = ids[:-keep] if keep > 0 else ids
+            for n in dropped:
+                os.remove(self._path('snapshot', n))
+            manifests = {n: self.load(n) for n in self.snapshots()}
+            live = {}  # pack -> {offset: length}
+            for info, refs in manifests.values():
+                stored = refs[~np.isin(refs['codec'], region.NO_PAYLOAD)]
+                for pack, offset, length in zip(stored['pack'].tolist(), stored['offset'].tolist(),
+                                                stored['length'].tolist()):
+                    live.setdefault(pack, {})[offset] = length
+            for pack in self._ids('pack'):
+                path = self._path('pack', pack)
+                if pack not in live:
+                    os.remove(path)
+                elif sum(live[pack].values()) < os.path.getsize(path) * REPACK_FRACTION:
+                    self._repack(pack, live[pack], manifests)
+            self._index()
+            return dropped
+
+    def _repack(self, pack, spans, manifests):
+        """Copy the live payloads of one pack into a new one and repoint the snapshots"""
+        m = self._next_id()
+        old_offsets = np.array(sorted(spans), dtype=np.uint64)
+        new_offsets = np.zeros(len(old_offsets), dtype=np.uint64)
+        with open(self._path('pack', pack), 'rb') as src, open(self._path('pack', m) + ".tmp", 'wb') as out:
+            for k, offset in enumerate(old_offsets.tolist()):
+                src.seek(offset)
+                new_offsets[k] = out.tell()
+                out.write(src.read(spans[offset]))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(self._path('pack', m) + ".tmp", self._path('pack', m))
+        for info, refs in manifests.values():
+            mine = (refs['pack'] == pack) & ~np.isin(refs['codec'], region.NO_PAYLOAD)
+            if not mine.any(): continue
+            refs['offset'][mine] = new_offsets[np.searchsorted(old_offsets, refs['offset'][mine])]
+            refs['pack'][mine] = m
+            self._write_manifest(info, refs)
+        os.remove(self._path('pack', pack))
+        self.last = None  # its references may point into the old pack
+
+    def restore(self, n, out_path):
+        """Write snapshot n as a region file at out_path (atomically) -> info"""
+        with self.lock:
+            info, refs = self.load(n)
+            table = np.zeros(len(refs), dtype=region.ENTRY)
+            table['codec'] = refs['codec']
+            table['fill'] = refs['fill']
+            terrain = refs['codec'] == region.TERRAIN
+            table['offset'][terrain] = refs['offset'][terrain]
+            stored = np.flatnonzero(~np.isin(refs['codec'], region.NO_PAYLOAD))
+            stored = stored[np.lexsort((refs['offset'][stored], refs['pack'][stored]))]
+            tmp_path = out_path + ".tmp"
+            with open(tmp_path, 'wb') as out:
+                out.write(region.HEADER.pack(region.MAGIC, region.VERSION, *info["dims"], *info["rdims"]))
+                out.write(table.tobytes())  # placeholder, rewritten below
+                written = {}  # (pack, offset) -> offset in out_path, payloads shared by regions are written once
+                src, src_pack = None, None
+                for r in stored.tolist():
+                    key = (int(refs['pack'][r]), int(refs['offset'][r]))
+                    if key not in written:
+                        if key[0] != src_pack:
+                            if src: src.close()
+                            src, src_pack = open(self._path('pack', key[0]), 'rb'), key[0]
+                        src.seek(key[1])
+                        payload = src.read(int(refs['length'][r]))
+                        if digest_of(payload) != refs['digest'][r].tobytes():
+                            raise ValueError(f"snapshot {n}: region {r} is corrupt in pack {key[0]}")
+                        written[key] = out.tell()
+                        out.write(payload)
+                    table['offset'][r] = written[key]
+                    table['length'][r] = refs['length'][r]
+                if src: src.close()
+                out.seek(region.HEADER.size)
+                out.write(table.tobytes())
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp_path, out_path)
+            return info
+
+
+def main():
+    parser = argparse.ArgumentParser(description="World backups")
+    parser.add_argument('--dir', default=BACKUP_DIR)
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list', help="show the snapshots")
+    restore = sub.add_parser('restore', help="write a snapshot out as a world file (stop the server first)")
+    restore.add_argument('snapshot', help="snapshot number or 'latest'")
+    restore.add_argument('dest', nargs='?', default='world.rgn')
+    restore.add_argument('--journal', default='world.journal',
+                         help="journal of the world being replaced, moved aside so it isn't replayed")
+    prune = sub.add_parser('prune', help="drop old snapshots and unused payloads")
+    prune.add_argument('--keep', type=int, default=KEEP)
+    args = parser.parse_args()
+
+    store = BackupStore(args.dir)
+    if args.command == 'list':
+        for n in store.snapshots():
+            info, refs = store.load(n)
+            stored = ~np.isin(refs['codec'], region.NO_PAYLOAD)
+            print(f"{n:6d}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(info['created']))}  "
+                  f"generation {info['generation']:<8d} {int(stored.sum()):7d} stored regions, "
+                  f"{int(refs['length'][stored].sum()) // 1024}KB")
+        total = sum(os.path.getsize(os.path.join(args.dir, name)) for name in os.listdir(args.dir))
+        print(f"[BACKUP] {len(store.snapshots())} snapshots, {total // 1024}KB on disk")
+    elif args.command == 'restore':
+        ids = store.snapshots()
+        n = ids[-1] if args.snapshot == 'latest' and ids else int(args.snapshot) if args.snapshot != 'latest' else None
+        if n is None:
+            raise SystemExit("[BACKUP] No snapshots")
+        started = time.time()
+        info = store.restore(n, args.dest)
+        for path in (args.journal, args.journal + ".old"):
+            if os.path.exists(path):
+                os.replace(path, path + ".before-restore")
+                print(f"[BACKUP] Moved {path} aside to {path}.before-restore")
+        print(f"[BACKUP] Restored snapshot {n} ({'x'.join(map(str, info['dims']))}) to {args.dest} "
+              f"in {time.time() - started:.1f}s")
+    elif args.command == 'prune':
+        dropped = store.prune(args.keep)
+        print(f"[BACKUP] Dropped {len(dropped)} snapshots, {len(store.snapshots())} left")
+
+
+if __name__ == "__main__":
+    main()
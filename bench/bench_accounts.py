@@ -0,0 +1,95 @@
+"""/register and /login throughput: the old per-command users.json reads and
+rewrites against accounts.AccountStore.
+
+Both run against a users.json that already holds --accounts accounts. The old
+path is slow enough that only --old-ops of each are timed.
+
+    python bench/bench_accounts.py --accounts 10000 --old-ops 500
+"""
+import argparse, asyncio, hashlib, os, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import ujson as json
+import accounts
+
+
+def old_load_users(path):
+    if os.path.exists(path):
+        with open(path, 'r') as f: return json.load(f)
+    return {}
+
+
+def old_register(path, name, password):
+    """The old /register: load, hash, load again and rewrite the whole file"""
+    if name.lower() in old_load_users(path): return False
+    pw_hash = hashlib.sha512(password.encode()).hexdigest()
+    users = old_load_users(path)
+    users[name.lower()] = pw_hash
+    with open(path, 'w') as f: json.dump(users, f)
+    return True
+
+
+def old_login(path, name, password):
+    users = old_load_users(path)
+    return users.get(name.lower()) == hashlib.sha512(password.encode()).hexdigest()
+
+
+def make_users(path, n):
+    users = {f"player{i}": accounts.hash_password(f"pw{i}") for i in range(n)}
+    with open(path, 'w') as f: json.dump(users, f)
+
+
+def bench_old(path, n):
+    started = time.perf_counter()
+    for i in range(n):
+        assert old_register(path, f"new{i}", f"pw{i}")
+    register_s = time.perf_counter() - started
+    started = time.perf_counter()
+    for i in range(n):
+        assert old_login(path, f"player{i}", f"pw{i}")
+    return n / register_s, n / (time.perf_counter() - started)
+
+
+async def bench_store(store, n):
+    started = time.perf_counter()
+    ok = await asyncio.gather(*(store.register(f"new{i}", f"pw{i}") for i in range(n)))
+    register_rate = n / (time.perf_counter() - started)
+    assert all(ok)
+    started = time.perf_counter()
+    ok = await asyncio.gather(*(store.verify(f"player{i}", f"pw{i}") for i in range(n)))
+    login_rate = n / (time.perf_counter() - started)
+    assert all(ok)
+    assert not any(await asyncio.gather(*(store.verify(f"player{i}", "wrong") for i in range(100))))
+    return register_rate, login_rate
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=10000, help="accounts in users.json to start with")
+    parser.add_argument('--old-ops', type=int, default=500, help="registrations/logins timed on the old path")
+    parser.add_argument('--workers', type=int, default=accounts.HASH_WORKERS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "users.json")
+        make_users(path, args.accounts)
+        register, login = bench_old(path, args.old_ops)
+        print(f"old   register {register:10,.0f}/s  login {login:10,.0f}/s  ({args.old_ops} each)")
+
+        make_users(path, args.accounts)
+        started = time.perf_counter()
+        store = accounts.AccountStore(path, args.workers)
+        load_s = time.perf_counter() - started
+        register, login = asyncio.run(bench_store(store, args.accounts))
+        started = time.perf_counter()
+        store.flush()
+        flush_s = time.perf_counter() - started
+        print(f"store register {register:10,.0f}/s  login {login:10,.0f}/s  ({args.accounts} each, "
+              f"{args.workers} hash workers)")
+        print(f"store load {load_s * 1000:.1f}ms, flush of {len(store):,} accounts {flush_s * 1000:.1f}ms "
+              f"({os.path.getsize(path) // 1024}KB)")
+        assert len(accounts.AccountStore(path)) == 2 * args.accounts
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""/blame and /rollback lookups against a large history.History.
+
+Writes --rows synthetic changes (--players players over the last --hours,
+spread over a 2560x128x2560 world) as sealed segments, then times blame
+lookups on random blocks and the per-player scan behind /rollback.
+
+    python bench/bench_history.py --rows 20000000
+"""
+import argparse, os, sys, tempfile, time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import history, region
+
+
+def fill(store, rows, players, hours, rng):
+    now = int(time.time())
+    for name in range(players):
+        store._player_id(f"player{name}")
+    for seq, start in enumerate(range(0, rows, history.SEGMENT_ROWS), 1):
+        n = min(history.SEGMENT_ROWS, rows - start)
+        # Segments cover consecutive slices of time, like a live server's would
+        t0 = now - hours * 3600 + start * hours * 3600 // rows
+        batch = np.zeros(n, dtype=history.ROW)
+        batch['t'] = t0 + np.arange(n) * hours * 3600 // rows
+        batch['player'] = rng.integers(0, players, n)
+        idx = rng.integers(0, store.world.X * store.world.Y * store.world.Z, n)
+        batch['key'] = store.spatial_key(idx)
+        batch['old'], batch['new'] = rng.integers(0, 50, n), rng.integers(0, 50, n)
+        history.write_segment(store._path('seg', seq), batch)
+    return history.History(store.world, store.dir)
+
+
+def timed(fn, args):
+    started = time.perf_counter()
+    results = [fn(*a) for a in args]
+    return (time.perf_counter() - started) * 1000 / len(args), results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20_000_000)
+    parser.add_argument('--players', type=int, default=500)
+    parser.add_argument('--hours', type=int, default=24 * 7, help="time span the rows cover")
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        world = region.RegionFile.create(os.path.join(tmp, "world.rgn"), (2560, 128, 2560))
+        started = time.perf_counter()
+        store = fill(history.History(world, os.path.join(tmp, "history")), args.rows, args.players, args.hours, rng)
+        size = sum(os.path.getsize(os.path.join(store.dir, name)) for name in os.listdir(store.dir))
+        print(f"{len(store):,} rows in {len(store.segments)} segments, {size / 2**20:.0f}MB, "
+              f"written in {time.perf_counter() - started:.1f}s")
+
+        # Blocks with recorded changes, and random (mostly untouched) ones
+        seg = store.segments[len(store.segments) // 2]
+        keys = seg.key[rng.integers(0, seg.rows, args.queries)].astype(np.int64)
+        changed = world.index_of(keys // world.region_volume, keys % world.region_volume).tolist()
+        ms, found = timed(store.blame, [(i,) for i in changed])
+        print(f"blame (changed block)   {ms:7.2f}ms  {sum(map(len, found)) / len(found):.1f} changes each")
+        ms, _ = timed(store.blame, [(int(i),) for i in rng.integers(0, 2560 * 128 * 2560, args.queries)])
+        print(f"blame (random block)    {ms:7.2f}ms")
+
+        now = int(time.time())
+        players = [f"player{p}" for p in rng.integers(0, args.players, 20)]
+        for minutes in (10, 60, 24 * 60):
+            ms, found = timed(store.changes_by, [(p, now - minutes * 60) for p in players])
+            print(f"rollback scan {minutes:5d} min {ms:7.2f}ms  {np.mean([len(f[1]) for f in found]):,.0f} changes each")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Per-join CPU time: legacy pair-by-pair level streaming from world.rle vs
+building the level packets from the region file (server.build_level_packets).
+
+    python bench/bench_level_stream.py --size 512 128 512
+"""
+import argparse, gzip, os, struct, sys, tempfile, time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import region, server
+
+
+class NullSink:
+    """Stands in for the socket: counts bytes and builds 0x03 packets like the old streamer"""
+    def __init__(self):
+        self.sent = 0
+
+    def write(self, data):
+        for i in range(0, len(data), 1024):
+            chunk = data[i:i+1024]
+            self.sent += len(chunk)
+            struct.pack('>BH', 0x03, len(chunk)) + bytes(chunk).ljust(1024, b'\x00')
+
+
+def make_world(path, total, seed=1):
+    """Half grass/half air like generate_initial_rle, with some noise so runs vary"""
+    rng = np.random.default_rng(seed)
+    blocks = np.zeros(total, dtype=np.uint8)
+    blocks[:total // 2] = 2
+    noise = rng.integers(0, total, size=total // 1000)
+    blocks[noise] = rng.integers(1, 50, size=len(noise), dtype=np.uint8)
+    points = np.flatnonzero(np.concatenate(([True], blocks[1:] != blocks[:-1])))
+    lens = np.diff(np.append(points, total))
+    with open(path, 'wb') as f:
+        for c, v in zip(lens, blocks[points]):
+            while c > 255:
+                f.write(bytes([255, int(v)]))
+                c -= 255
+            f.write(bytes([int(c), int(v)]))
+
+
+def legacy_join(path, total):
+    sink = NullSink()
+    with gzip.GzipFile(fileobj=sink, mode='wb', compresslevel=6) as gz:
+        gz.write(struct.pack('>I', total))
+        with open(path, 'rb') as f:
+            while True:
+                pair = f.read(2)
+                if not pair or len(pair) < 2:
+                    break
+                gz.write(bytes([pair[1]]) * pair[0])
+    return sink.sent
+
+
+def region_join(world, changes):
+    """One level stream build, as LevelCache does it: both packet streams from a snapshot"""
+    packets, fast_packets = server.build_level_packets(world.snapshot(), changes)
+    return len(packets)
+
+
+def timed(fn, *args):
+    started = time.process_time()
+    out = fn(*args)
+    return time.process_time() - started, out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, nargs=3, default=(512, 128, 512), metavar=('X', 'Y', 'Z'))
+    parser.add_argument('--changes', type=int, default=10000, help="pending block_logs entries to overlay")
+    args = parser.parse_args()
+    total = args.size[0] * args.size[1] * args.size[2]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'world.rle')
+        make_world(path, total)
+        rng = np.random.default_rng(2)
+        changes = dict(zip(rng.integers(0, total, args.changes).tolist(), rng.integers(0, 50, args.changes).tolist()))
+
+        rgn_path = os.path.join(tmp, 'world.rgn')
+        region.convert_rle(path, rgn_path, tuple(args.size))
+        world = region.RegionFile(rgn_path)
+
+        print(f"World {args.size[0]}x{args.size[1]}x{args.size[2]} = {total:,} blocks, RLE {os.path.getsize(path):,} bytes, "
+              f"regions {os.path.getsize(rgn_path):,} bytes")
+        legacy_cpu, legacy_out = timed(legacy_join, path, total)
+        print(f"legacy loop:    {legacy_cpu:8.2f}s CPU  ({legacy_out:,} gz bytes, no overlay)")
+        new_cpu, new_out = timed(region_join, world, changes)
+        print(f"region slabs:   {new_cpu:8.2f}s CPU  ({new_out:,} bytes of 0x03 packets, {len(changes):,} changes overlaid)")
+        world.close()
+        print(f"speedup: {legacy_cpu / max(new_cpu, 1e-9):.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Client packet decode rate: per-field readexactly (old loop) vs protocol.PacketReader.
+
+    python bench/bench_packet_decode.py --packets 500000
+"""
+import argparse, asyncio, os, struct, sys, time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import protocol
+
+
+def make_stream(n, seed=1):
+    """Mostly moves, some block changes, the odd chat line"""
+    rng = np.random.default_rng(seed)
+    kinds = rng.choice([0x08, 0x05, 0x0d], size=n, p=[0.8, 0.18, 0.02])
+    out = bytearray()
+    for i, kind in enumerate(kinds.tolist()):
+        if kind == 0x08:
+            out += struct.pack('>BBhhhBB', 0x08, 0xff, i & 0x3fff, 2000, 3000, i & 0xff, 0)
+        elif kind == 0x05:
+            out += struct.pack('>BhhhBB', 0x05, i & 0x3ff, 60, 100, 1, 1)
+        else:
+            out += struct.pack('>BB', 0x0d, 0xff) + b'hello'.ljust(64)
+    return bytes(out)
+
+
+def stream_reader(data):
+    """StreamReader holding all of `data`, like a socket that is never empty"""
+    reader = asyncio.StreamReader(limit=len(data) + 1)
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+async def old_decode(reader, n):
+    """The old handle_client loop: one readexactly + unpack per field"""
+    async def recv_exact(k):
+        return await reader.readexactly(k)
+    for _ in range(n):
+        packet_id = (await recv_exact(1))[0]
+        if packet_id == 0x05:
+            x = struct.unpack('>h', await recv_exact(2))[0]
+            y = struct.unpack('>h', await recv_exact(2))[0]
+            z = struct.unpack('>h', await recv_exact(2))[0]
+            mode = (await recv_exact(1))[0]
+            block_type = (await recv_exact(1))[0]
+        elif packet_id == 0x08:
+            pid = (await recv_exact(1))[0]
+            x = struct.unpack('>h', await recv_exact(2))[0]
+            y = struct.unpack('>h', await recv_exact(2))[0]
+            z = struct.unpack('>h', await recv_exact(2))[0]
+            yaw = (await recv_exact(1))[0]
+            pitch = (await recv_exact(1))[0]
+        elif packet_id == 0x0d:
+            pid = (await recv_exact(1))[0]
+            message = (await recv_exact(64)).decode('ascii').strip()
+
+
+async def new_decode(reader, n):
+    packets = protocol.PacketReader(reader)
+    for _ in range(n):
+        packet_id, fields = await packets.read_packet()
+        if packet_id == 0x0d:
+            message = fields[1].decode('ascii').strip()
+
+
+async def timed(decode, data, n):
+    reader = stream_reader(data)
+    started = time.perf_counter()
+    await decode(reader, n)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--packets', type=int, default=500_000)
+    args = parser.parse_args()
+
+    data = make_stream(args.packets)
+    for name, decode in (("readexactly per field", old_decode), ("PacketReader", new_decode)):
+        seconds = asyncio.run(timed(decode, data, args.packets))
+        print(f"{name:24s} {args.packets / seconds:12,.0f} packets/s  ({seconds:.2f}s)")
+
+
+if __name__ == '__main__':
+    main()
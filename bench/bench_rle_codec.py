@@ -0,0 +1,77 @@
+"""RLE codec and region save throughput in MB/s.
+
+    python bench/bench_rle_codec.py --blocks 50000000 --changes 100000
+"""
+import argparse, os, sys, tempfile, time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import rle, region
+
+
+def loop_encode(blocks):
+    """The old per-run save loop, writing into a bytearray instead of a file"""
+    out = bytearray()
+    diffs = np.concatenate(([True], blocks[1:] != blocks[:-1]))
+    points = np.where(diffs)[0]
+    run_vals = blocks[points]
+    run_lens = np.diff(np.append(points, len(blocks)))
+    for c, v in zip(run_lens, run_vals):
+        while c > 255:
+            out += bytes([255, int(v)])
+            c -= 255
+        out += bytes([int(c), int(v)])
+    return bytes(out)
+
+
+def make_blocks(n, seed=1):
+    """Layered terrain-like data with scattered edits"""
+    rng = np.random.default_rng(seed)
+    blocks = np.repeat(rng.integers(0, 10, n // 4096 + 1).astype(np.uint8), 4096)[:n]
+    blocks[rng.integers(0, n, n // 500)] = rng.integers(0, 50, n // 500, dtype=np.uint8)
+    return blocks
+
+
+def rate(nbytes, seconds):
+    return f"{nbytes / max(seconds, 1e-9) / 1e6:9.1f} MB/s"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--blocks', type=int, default=50_000_000, help="blocks per encode run (one old save chunk)")
+    parser.add_argument('--changes', type=int, default=100_000, help="pending changes for the region save")
+    parser.add_argument('--size', type=int, nargs=3, default=(512, 128, 512), metavar=('X', 'Y', 'Z'))
+    parser.add_argument('--skip-loop', action='store_true', help="skip the (slow) old encode loop")
+    args = parser.parse_args()
+
+    blocks = make_blocks(args.blocks)
+    started = time.perf_counter()
+    packed = rle.encode(blocks)
+    encode_s = time.perf_counter() - started
+    print(f"rle.encode        {rate(len(blocks), encode_s)}  ({len(packed):,} bytes)")
+
+    if not args.skip_loop:
+        started = time.perf_counter()
+        assert loop_encode(blocks) == packed
+        print(f"old save loop     {rate(len(blocks), time.perf_counter() - started)}")
+
+    started = time.perf_counter()
+    assert np.array_equal(rle.decode(packed), blocks)
+    print(f"rle.decode        {rate(len(blocks), time.perf_counter() - started)}")
+
+    X, Y, Z = args.size
+    total = X * Y * Z
+    rng = np.random.default_rng(2)
+    changes = dict(zip(rng.integers(0, total, args.changes).tolist(), rng.integers(0, 50, args.changes).tolist()))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'world.rgn')
+        world = region.RegionFile.create(path, (X, Y, Z), fill=2)
+        started = time.perf_counter()
+        dirty = world.apply_changes(changes)
+        save_s = time.perf_counter() - started
+        print(f"region save       {rate(dirty * world.region_volume, save_s)}  "
+              f"({len(changes):,} changes, {dirty:,} regions, {save_s:.2f}s)")
+
+
+if __name__ == '__main__':
+    main()
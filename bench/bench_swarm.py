@@ -0,0 +1,339 @@
+"""End-to-end load test: starts server.py offline in a scratch directory and
+points a swarm of simulated classic clients at it.
+
+Each bot joins (optionally negotiating CPE), streams the level, registers and
+logs in, then walks around spawn, places blocks and chats until the run
+ends. Reports join latency, level-stream throughput, block fan-out latency
+(placement sent -> 0x06/0x26 received by each client in view), server CPU
+and RSS (from /proc) and the duration of every save the server logs.
+
+    python bench/bench_swarm.py --bots 50 --duration 30
+    python bench/bench_swarm.py --bots 200 --cpe --json results.json   # '-' = stdout
+    python bench/bench_swarm.py --bots 100 --profile 20   # server flame graph -> ./profiles
+"""
+import argparse, asyncio, glob, json, os, random, re, shutil, signal, struct, subprocess, sys, tempfile, threading, time
+import numpy as np
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server.py')
+
+# Server -> client packet lengths, including the id byte
+LENGTHS = {0x00: 131, 0x01: 1, 0x02: 1, 0x03: 1028, 0x04: 7, 0x06: 8, 0x07: 74, 0x08: 10,
+           0x09: 7, 0x0a: 5, 0x0b: 4, 0x0c: 2, 0x0d: 66, 0x0e: 65, 0x0f: 2,
+           0x10: 67, 0x11: 69, 0x26: 1282}
+CPE_EXTENSIONS = (("FastMap", 1), ("BulkBlockUpdate", 1))
+
+
+def pad(s):
+    return s[:64].ljust(64).encode('ascii')
+
+
+def percentiles(samples, scale=1.0):
+    if not samples:
+        return None
+    a = np.asarray(samples) * scale
+    return {"p50": round(float(np.percentile(a, 50)), 3), "p90": round(float(np.percentile(a, 90)), 3),
+            "p99": round(float(np.percentile(a, 99)), 3), "max": round(float(a.max()), 3), "n": len(a)}
+
+
+class ServerProcess:
+    """server.py in a scratch directory, with its log and /proc counters watched"""
+    SAVE = re.compile(r"Save complete: (\d+) regions in ([\d.]+)s")
+
+    def __init__(self, args, workdir):
+        cmd = [sys.executable, '-u', os.path.abspath(SERVER), '--no-ngrok', '--port', str(args.port),
+               '--size', *map(str, args.size), '--journal-mb', str(args.journal_mb)]
+        if args.profile:
+            cmd += ['--profile', str(args.profile)]
+        self.proc = subprocess.Popen(cmd, cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        self.log = []
+        self.saves = []
+        self.kicks = 0
+        self.ready = threading.Event()
+        self.rss_peak = 0
+        threading.Thread(target=self._read_log, daemon=True).start()
+
+    def _read_log(self):
+        for line in self.proc.stdout:
+            self.log.append(line.rstrip())
+            if "Level snapshot #" in line:
+                self.ready.set()
+            elif "Kicked" in line or "[SECURITY]" in line:
+                self.kicks += 1
+            match = self.SAVE.search(line)
+            if match:
+                self.saves.append({"regions": int(match.group(1)), "seconds": float(match.group(2))})
+        self.ready.set()  # exited
+
+    def cpu_seconds(self):
+        try:
+            with open(f"/proc/{self.proc.pid}/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        except OSError:
+            return None
+
+    def rss_mb(self):
+        try:
+            with open(f"/proc/{self.proc.pid}/status") as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        rss = int(line.split()[1]) / 1024
+                        self.rss_peak = max(self.rss_peak, rss)
+                        return rss
+        except OSError:
+            return None
+
+    def stop(self):
+        """SIGINT, so the server runs its shutdown save like on Ctrl+C"""
+        if self.proc.poll() is None:
+            self.proc.send_signal(signal.SIGINT)
+            try:
+                self.proc.wait(60)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+
+class Stats:
+    def __init__(self):
+        self.join_s = []
+        self.level_bytes = []
+        self.level_s = []
+        self.fanout_s = []
+        self.placed = {}  # (x, y, z, block) -> send time
+        self.failed = 0
+        self.dropped = 0
+        self.sent = {"moves": 0, "blocks": 0, "chats": 0}
+        self.received = 0
+
+
+class Bot:
+    def __init__(self, n, args, stats, deadline):
+        self.name = f"bot{n}"
+        self.args = args
+        self.stats = stats
+        self.deadline = deadline
+        self.rng = random.Random(n)
+        self.pos = None
+        self.joined = None
+
+    async def read_packet(self):
+        packet_id = (await self.reader.readexactly(1))[0]
+        length = LENGTHS[packet_id]
+        if packet_id == 0x02 and self.fast_map:
+            length = 5
+        return packet_id, await self.reader.readexactly(length - 1)
+
+    async def join(self):
+        started = time.perf_counter()
+        self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.args.port)
+        self.writer.write(bytes([0x00, 7]) + pad(self.name) + pad('-') + bytes([0x42 if self.args.cpe else 0]))
+        self.fast_map = False
+        if self.args.cpe:
+            packet_id, body = await self.read_packet()
+            count = struct.unpack('>h', body[64:66])[0]
+            offered = set()
+            for _ in range(count):
+                packet_id, body = await self.read_packet()
+                offered.add((body[:64].decode('ascii').strip(), struct.unpack('>i', body[64:])[0]))
+            ours = [ext for ext in CPE_EXTENSIONS if ext in offered]
+            self.writer.write(bytes([0x10]) + pad("bench_swarm") + struct.pack('>h', len(ours)))
+            for name, version in ours:
+                self.writer.write(bytes([0x11]) + pad(name) + struct.pack('>i', version))
+            self.fast_map = ("FastMap", 1) in ours
+        level_bytes = 0
+        level_start = None
+        while True:
+            packet_id, body = await self.read_packet()
+            if packet_id == 0x02:
+                level_start = time.perf_counter()
+            elif packet_id == 0x03:
+                level_bytes += struct.unpack('>H', body[:2])[0]
+            elif packet_id == 0x04:
+                break
+            elif packet_id == 0x0e:
+                raise ConnectionError("kicked while joining")
+        now = self.joined = time.perf_counter()
+        self.stats.join_s.append(now - started)
+        self.stats.level_bytes.append(level_bytes)
+        self.stats.level_s.append(now - (level_start or started))
+
+    def chat(self, message):
+        self.writer.write(bytes([0x0d, 0xff]) + pad(message))
+
+    def on_blocks(self, now, changes):
+        for key in changes:
+            sent = self.stats.placed.get(key)
+            if sent is not None and sent >= self.joined:  # not join catch-up
+                self.stats.fanout_s.append(now - sent)
+
+    async def listen(self):
+        while True:
+            packet_id, body = await self.read_packet()
+            self.stats.received += 1
+            now = time.perf_counter()
+            if packet_id == 0x06:
+                self.on_blocks(now, [struct.unpack('>hhhB', body)])
+            elif packet_id == 0x26:
+                count = body[0] + 1
+                idx = np.frombuffer(body[1:1025], dtype='>i4')[:count].astype(np.int64)
+                X, Y, Z = self.args.size
+                self.on_blocks(now, zip((idx % X).tolist(), (idx // (X * Z)).tolist(),
+                                        ((idx // X) % Z).tolist(), body[1025:1025 + count]))
+            elif packet_id == 0x07 and body[0] == 0xff:
+                self.pos = struct.unpack('>hhh', body[65:71])
+            elif packet_id == 0x0e:
+                raise ConnectionError(f"kicked: {body.decode('ascii').strip()}")
+
+    async def play(self):
+        args = self.args
+        self.chat("/register benchpw")
+        self.chat("/login benchpw")
+        listener = asyncio.create_task(self.listen())
+        tick = 1 / args.move_rate
+        next_place = time.perf_counter() + self.rng.random() / max(args.place_rate, 1e-9)
+        next_chat = time.perf_counter() + self.rng.random() * args.chat_interval
+        step = 0
+        try:
+            while time.perf_counter() < self.deadline and not listener.done():
+                await asyncio.sleep(tick)
+                if self.pos is None: continue
+                x, y, z = self.pos
+                # Wander within a few blocks of spawn
+                walk = (self.rng.randint(-16, 16), self.rng.randint(-16, 16))
+                self.writer.write(struct.pack('>BBhhhBB', 0x08, 0xff, x + walk[0], y, z + walk[1], step & 0xff, 0))
+                self.stats.sent["moves"] += 1
+                now = time.perf_counter()
+                if args.place_rate and now >= next_place:
+                    next_place = now + 1 / args.place_rate
+                    bx = x // 32 + self.rng.randint(-8, 8)
+                    bz = z // 32 + self.rng.randint(-8, 8)
+                    by = min(y // 32 + 2 + self.rng.randint(0, 4), args.size[1] - 1)
+                    block = self.rng.randint(1, 49)
+                    self.stats.placed[(bx, by, bz, block)] = now
+                    self.writer.write(struct.pack('>BhhhBB', 0x05, bx, by, bz, 1, block))
+                    self.stats.sent["blocks"] += 1
+                if args.chat_interval and now >= next_chat:
+                    next_chat = now + args.chat_interval
+                    self.chat(f"hello from {self.name} #{step}")
+                    self.stats.sent["chats"] += 1
+                step += 1
+                await self.writer.drain()
+            if listener.done():
+                listener.result()  # re-raise why it stopped
+        finally:
+            listener.cancel()
+
+    async def run(self):
+        try:
+            await self.join()
+        except (OSError, asyncio.IncompleteReadError, ConnectionError):
+            self.stats.failed += 1
+            return
+        try:
+            await self.play()
+        except (OSError, asyncio.IncompleteReadError, ConnectionError):
+            self.stats.dropped += 1
+        finally:
+            self.writer.close()
+
+
+async def swarm(args, stats):
+    deadline = time.perf_counter() + args.duration
+    tasks = []
+    for n in range(args.bots):
+        tasks.append(asyncio.create_task(Bot(n, args, stats, deadline).run()))
+        await asyncio.sleep(1 / args.join_rate)
+    await asyncio.gather(*tasks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--bots', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=20, help="seconds of traffic after the first join")
+    parser.add_argument('--size', type=int, nargs=3, default=(256, 64, 256), metavar=('X', 'Y', 'Z'))
+    parser.add_argument('--port', type=int, default=25599)
+    parser.add_argument('--cpe', action='store_true', help="negotiate FastMap and BulkBlockUpdate")
+    parser.add_argument('--join-rate', type=float, default=20, help="bots connecting per second")
+    parser.add_argument('--move-rate', type=float, default=10, help="position updates per bot per second")
+    parser.add_argument('--place-rate', type=float, default=1, help="blocks placed per bot per second")
+    parser.add_argument('--chat-interval', type=float, default=10, help="seconds between chat lines per bot")
+    parser.add_argument('--journal-mb', type=float, default=0.25, help="server save threshold, low so saves happen")
+    parser.add_argument('--json', metavar='PATH', help="write the results as JSON ('-' for stdout)")
+    parser.add_argument('--profile', type=float, metavar='SECONDS',
+                        help="run the server's sampling profiler for its first SECONDS, copied to ./profiles")
+    args = parser.parse_args()
+
+    stats = Stats()
+    with tempfile.TemporaryDirectory(prefix="hb_swarm_") as workdir:
+        server = ServerProcess(args, workdir)
+        try:
+            server.ready.wait(300)
+            if server.proc.poll() is not None:
+                sys.exit("server exited during startup:\n" + "\n".join(server.log[-20:]))
+            cpu_start = server.cpu_seconds()
+            started = time.perf_counter()
+            sampler_stop = threading.Event()
+
+            def sample():
+                while not sampler_stop.wait(0.5):
+                    server.rss_mb()
+            threading.Thread(target=sample, daemon=True).start()
+
+            asyncio.run(swarm(args, stats))
+            elapsed = time.perf_counter() - started
+            sampler_stop.set()
+            cpu_end = server.cpu_seconds()
+            rss_end = server.rss_mb()
+        finally:
+            server.stop()
+            for path in glob.glob(os.path.join(workdir, "profiles", "*")):
+                os.makedirs("profiles", exist_ok=True)
+                shutil.copy(path, "profiles")
+
+    cpu = None if cpu_start is None or cpu_end is None else cpu_end - cpu_start
+    level_rates = [b / s for b, s in zip(stats.level_bytes, stats.level_s) if s > 0]
+    results = {
+        "bots": args.bots, "duration_s": round(elapsed, 2), "cpe": args.cpe, "world": list(args.size),
+        "joined": len(stats.join_s), "failed_joins": stats.failed, "dropped": stats.dropped,
+        "server_kicks": server.kicks,
+        "join_latency_ms": percentiles(stats.join_s, 1000),
+        "level_stream": {
+            "bytes_per_join": int(np.mean(stats.level_bytes)) if stats.level_bytes else 0,
+            "per_join_mb_s": percentiles(level_rates, 1e-6),
+        },
+        "fanout_latency_ms": percentiles(stats.fanout_s, 1000),
+        "server": {
+            "cpu_s": round(cpu, 2) if cpu is not None else None,
+            "cpu_percent": round(100 * cpu / elapsed, 1) if cpu is not None else None,
+            "rss_peak_mb": round(server.rss_peak, 1) if server.rss_peak else None,
+            "rss_end_mb": round(rss_end, 1) if rss_end else None,
+        },
+        "saves": server.saves,
+        "sent": stats.sent,
+        "packets_received": stats.received,
+    }
+
+    if args.json:
+        out = json.dumps(results, indent=2)
+        if args.json == '-':
+            print(out)
+        else:
+            with open(args.json, 'w') as f:
+                f.write(out + '\n')
+    if args.json != '-':
+        print(f"bots {results['joined']}/{args.bots} joined, {stats.failed} failed, {stats.dropped} dropped, "
+              f"{elapsed:.1f}s")
+        for key in ("join_latency_ms", "fanout_latency_ms"):
+            print(f"{key:20s} {results[key]}")
+        print(f"{'level_stream':20s} {results['level_stream']}")
+        print(f"{'server':20s} {results['server']}")
+        print(f"{'saves':20s} {len(server.saves)}, "
+              f"max {max((s['seconds'] for s in server.saves), default=0):.1f}s")
+        print(f"{'sent':20s} {stats.sent}, received {stats.received} packets")
+        for line in server.log:
+            if line.startswith("[PROFILE]"):
+                print(line)
+
+
+if __name__ == '__main__':
+    main()
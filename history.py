@@ -0,0 +1,241 @@
+"""Who changed which block, and when (history/).
+
+Every accepted change becomes a row (time, player, block, old block, new
+block). Rows collect in an in-memory buffer that a background thread appends
+to hot-<seq>.bin every FLUSH_INTERVAL. Once SEGMENT_ROWS are in, the buffer
+is sealed into a columnar segment file and a fresh one starts.
+
+Segments are sorted by spatial key: region id, then position inside the
+region (region.locate). All changes to one block, or to one region, are a
+contiguous run found by binary search. A second index orders rows by
+(player, time), so "everything bob did in the last 10 minutes" is one slice
+per segment. Each segment records its time range, so a rollback skips older
+segments unread. Segments are memory-mapped.
+
+    history/players.txt      player names; a row's player is a line number
+    history/seg-000001.hbh   sealed segment
+    history/hot-000002.bin   raw rows of the buffer being filled
+"""
+import os, re, struct, threading, time
+import numpy as np
+
+HISTORY_DIR = "history"
+SEGMENT_ROWS = 1 << 18  # rows per segment (~5.5MB)
+FLUSH_INTERVAL = 1.0  # seconds of rows a crash can lose
+
+ROW = np.dtype([('t', '<u4'), ('player', '<u4'), ('key', '<i8'), ('old', 'u1'), ('new', 'u1')])
+MAGIC = b'HBHS'
+VERSION = 1
+SEG_HEADER = struct.Struct('<4sHxxIIII')  # magic, version, rows, players, first and last time
+# Segment columns, in file order after the header; then the player index (ids, starts)
+SEG_COLUMNS = (('key', '<i8'), ('t', '<u4'), ('player', '<u4'), ('by_player', '<u4'), ('old', 'u1'), ('new', 'u1'))
+
+
+def write_segment(path, rows):
+    """Seal time-ordered ROW records into a segment file"""
+    order = np.argsort(rows['key'], kind='stable')
+    rows = rows[order]
+    by_player = np.lexsort((order, rows['player'])).astype('<u4')  # arrival order within a player
+    players, starts = np.unique(rows['player'][by_player], return_index=True)
+    starts = np.append(starts, len(rows)).astype('<u4')
+    t_min, t_max = (int(rows['t'].min()), int(rows['t'].max())) if len(rows) else (0, 0)
+    with open(path + ".tmp", 'wb') as f:
+        f.write(SEG_HEADER.pack(MAGIC, VERSION, len(rows), len(players), t_min, t_max))
+        for name, dtype in SEG_COLUMNS:
+            column = by_player if name == 'by_player' else rows[name]
+            f.write(np.ascontiguousarray(column, dtype=dtype).tobytes())
+        f.write(players.astype('<u4').tobytes())
+        f.write(starts.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+class Segment:
+    def __init__(self, path):
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+        magic, version, self.rows, count, self.t_min, self.t_max = SEG_HEADER.unpack(data[:SEG_HEADER.size].tobytes())
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} history segment")
+        pos = SEG_HEADER.size
+        for name, dtype in SEG_COLUMNS + (('players', '<u4'),):
+            n = count if name == 'players' else self.rows
+            size = n * np.dtype(dtype).itemsize
+            setattr(self, name, data[pos:pos + size].view(dtype))
+            pos += size
+        self.starts = data[pos:pos + (count + 1) * 4].view('<u4')
+
+    def at(self, key):
+        """Rows changing the block with this spatial key, oldest first"""
+        a, b = self.key.searchsorted((key, key + 1))
+        return np.arange(a, b)
+
+    def by(self, player, since):
+        """Rows of one player at or after `since`, oldest first"""
+        j = self.players.searchsorted(player)
+        if j == len(self.players) or self.players[j] != player:
+            return np.zeros(0, dtype=np.int64)
+        rows = self.by_player[self.starts[j]:self.starts[j + 1]]
+        return rows[self.t[rows].searchsorted(since):]
+
+
+class History:
+    def __init__(self, world, directory=HISTORY_DIR):
+        """`world` supplies the region geometry (locate/index_of) for spatial keys"""
+        os.makedirs(directory, exist_ok=True)
+        self.dir = directory
+        self.world = world
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.flush_lock = threading.Lock()  # a second flush could append the same rows again or seal a buffer twice
+        self.closed = False
+        self.names_path = os.path.join(directory, "players.txt")
+        self.names = []
+        if os.path.exists(self.names_path):
+            with open(self.names_path) as f:
+                self.names = f.read().splitlines()
+        self.ids = {name: k for k, name in enumerate(self.names)}
+
+        sealed = set(self._seqs('seg'))
+        hot = []
+        for seq in self._seqs('hot'):
+            path = self._path('hot', seq)
+            if seq in sealed:  # sealed, but the crash came before the hot file was removed
+                os.remove(path)
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            hot.append((seq, np.frombuffer(data[:len(data) // ROW.itemsize * ROW.itemsize], dtype=ROW)))
+        for seq, rows in hot[:-1]:
+            write_segment(self._path('seg', seq), rows)
+            os.remove(self._path('hot', seq))
+            sealed.add(seq)
+        self.segments = [Segment(self._path('seg', seq)) for seq in sorted(sealed)]
+
+        self.hot = np.zeros(SEGMENT_ROWS, dtype=ROW)
+        self.count = self.flushed = 0
+        self.sealing = []  # (seq, rows) of full buffers the writer hasn't sealed yet
+        if hot:
+            self.seq, rows = hot[-1]
+            self.hot[:len(rows)] = rows
+            self.count = self.flushed = len(rows)
+        else:
+            self.seq = max(sealed, default=0) + 1
+
+    def _seqs(self, kind):
+        found = (re.match(rf"{kind}-(\d+)\.(hbh|bin)$", name) for name in os.listdir(self.dir))
+        return sorted(int(m.group(1)) for m in found if m)
+
+    def _path(self, kind, seq):
+        return os.path.join(self.dir, f"{kind}-{seq:06d}.{'hbh' if kind == 'seg' else 'bin'}")
+
+    def __len__(self):
+        with self.lock:
+            return sum(s.rows for s in self.segments) + sum(len(r) for _, r in self.sealing) + self.count
+
+    def start(self):
+        threading.Thread(target=self._writer, name="history", daemon=True).start()
+
+    def spatial_key(self, idx):
+        rid, local = self.world.locate(idx)
+        return rid * self.world.region_volume + local
+
+    def _player_id(self, name):
+        pid = self.ids.get(name)
+        if pid is None:
+            pid = self.ids[name] = len(self.names)
+            self.names.append(name)
+            with open(self.names_path, 'a') as f:
+                f.write(name + "\n")
+        return pid
+
+    def record(self, player, idx, old, new):
+        key = self.spatial_key(idx)
+        with self.lock:
+            self.hot[self.count] = (int(time.time()), self._player_id(player), key, old, new)
+            self.count += 1
+            if self.count == SEGMENT_ROWS:
+                self.sealing.append((self.seq, self.hot))
+                self.seq += 1
+                self.hot = np.zeros(SEGMENT_ROWS, dtype=ROW)
+                self.count = self.flushed = 0
+                self.wake.set()
+
+    def flush(self):
+        """Append new rows to the hot file and seal full buffers"""
+        with self.flush_lock:
+            self._flush()
+
+    def _flush(self):
+        with self.lock:
+            seq, rows = self.seq, self.hot[self.flushed:self.count]
+            self.flushed = self.count
+            sealing = list(self.sealing)
+        if len(rows):
+            with open(self._path('hot', seq), 'ab') as f:
+                f.write(rows.tobytes())
+        for seq, rows in sealing:
+            path = self._path('seg', seq)
+            write_segment(path, rows)
+            segment = Segment(path)
+            with self.lock:
+                self.segments.append(segment)
+                self.sealing = [s for s in self.sealing if s[0] != seq]
+            if os.path.exists(self._path('hot', seq)):
+                os.remove(self._path('hot', seq))
+
+    def close(self):
+        """Write out every row and stop the writer thread"""
+        self.closed = True
+        self.wake.set()
+        self.flush()
+
+    def _writer(self):
+        while not self.closed:
+            self.wake.wait(FLUSH_INTERVAL)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[ERROR] History flush failed: {e}")
+
+    def _buffers(self):
+        """Unsealed rows, oldest first (stable views: rows below `count` never change)"""
+        with self.lock:
+            return list(self.segments), [rows for _, rows in self.sealing] + [self.hot[:self.count]]
+
+    def blame(self, idx, limit=5):
+        """Newest changes to block `idx` -> [(time, player, old, new)], newest first"""
+        key = self.spatial_key(idx)
+        segments, buffers = self._buffers()
+        found = []
+        for rows in reversed(buffers):
+            hits = rows[rows['key'] == key]
+            found += [(int(r['t']), int(r['player']), int(r['old']), int(r['new'])) for r in hits[::-1]]
+            if len(found) >= limit: break
+        for segment in reversed(segments):
+            if len(found) >= limit: break
+            rows = segment.at(key)[::-1]
+            found += list(zip(segment.t[rows].tolist(), segment.player[rows].tolist(),
+                              segment.old[rows].tolist(), segment.new[rows].tolist()))
+        return [(t, self.names[p], old, new) for t, p, old, new in found[:limit]]
+
+    def changes_by(self, player, since):
+        """Every change `player` made at or after time `since`, oldest first
+        -> (times, block indices, old blocks, new blocks) arrays"""
+        pid = self.ids.get(player)
+        segments, buffers = self._buffers()
+        parts = []
+        if pid is not None:
+            for segment in segments:
+                if segment.t_max < since: continue
+                rows = segment.by(pid, since)
+                parts.append((segment.t[rows], segment.key[rows], segment.old[rows], segment.new[rows]))
+            for rows in buffers:
+                hits = rows[(rows['player'] == pid) & (rows['t'] >= since)]
+                parts.append((hits['t'], hits['key'], hits['old'], hits['new']))
+        if not parts:
+            parts = [(np.zeros(0, '<u4'), np.zeros(0, '<i8'), np.zeros(0, 'u1'), np.zeros(0, 'u1'))]
+        t, key, old, new = (np.concatenate(column) for column in zip(*parts))
+        volume = self.world.region_volume
+        return t, self.world.index_of(key // volume, key % volume), old, new
@@ -0,0 +1,137 @@
+"""Append-only block-change journal (world.journal).
+
+Every accepted block change is queued in memory and written out in
+group-committed batches by a background thread (one write + fsync per batch):
+
+    [count:u32][crc32:u32][count * (index:u32, block:u8)]
+
+A torn batch at the tail (crash mid-write) fails its CRC and is cut off on
+replay. Compaction rotates the live file to `<path>.old`, writes the changes
+into the world, then deletes the rotated file.
+"""
+import os, struct, threading, time, zlib
+import numpy as np
+
+BATCH = struct.Struct('<II')
+RECORD = struct.Struct('<IB')
+RECORD_DTYPE = np.dtype([('idx', '<u4'), ('block', 'u1')])
+
+# Max seconds a change sits in memory before it is committed
+COMMIT_INTERVAL = 0.05
+
+
+class Journal:
+    def __init__(self, path):
+        self.path = path
+        self.old_path = path + ".old"
+        self.lock = threading.Lock()
+        self.pending = bytearray()
+        self.pending_count = 0
+        self.wake = threading.Event()
+        self.closed = False
+        self.f = open(self.path, 'ab')
+
+    def start(self):
+        threading.Thread(target=self._committer, daemon=True).start()
+
+    def append(self, idx, block):
+        with self.lock:
+            self.pending += RECORD.pack(idx, block)
+            self.pending_count += 1
+        self.wake.set()
+
+    def size(self):
+        with self.lock:
+            return self.f.tell() + len(self.pending)
+
+    def has_rotated(self):
+        return os.path.exists(self.old_path)
+
+    def _commit_locked(self):
+        if not self.pending_count: return
+        payload = bytes(self.pending)
+        self.f.write(BATCH.pack(self.pending_count, zlib.crc32(payload)) + payload)
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.pending.clear()
+        self.pending_count = 0
+
+    def commit(self):
+        with self.lock:
+            if not self.closed:
+                self._commit_locked()
+
+    def close(self):
+        """Commit what is queued and stop the committer"""
+        with self.lock:
+            self._commit_locked()
+            self.closed = True
+            self.f.close()
+        self.wake.set()
+
+    def _committer(self):
+        while True:
+            self.wake.wait()
+            if self.closed: return
+            time.sleep(COMMIT_INTERVAL)  # let a burst of changes share one fsync
+            self.wake.clear()
+            try:
+                self.commit()
+            except Exception as e:
+                print(f"[ERROR] Journal commit failed: {e}")
+
+    def rotate(self):
+        """Seal everything journaled so far into <path>.old and start a fresh file.
+
+        If an older rotation was never cleared its records are kept in front.
+        """
+        with self.lock:
+            self._commit_locked()
+            self.f.close()
+            if os.path.exists(self.old_path):
+                with open(self.old_path, 'ab') as old, open(self.path, 'rb') as cur:
+                    old.write(cur.read())
+                    old.flush()
+                    os.fsync(old.fileno())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.old_path)
+            self.f = open(self.path, 'ab')
+
+    def drop_rotated(self):
+        """The rotated records are in the world file now"""
+        if os.path.exists(self.old_path):
+            os.remove(self.old_path)
+
+    def replay(self):
+        """Read back {index: block} from the rotated and live files, oldest first"""
+        changes = {}
+        for path in (self.old_path, self.path):
+            if os.path.exists(path):
+                changes.update(self._read(path))
+        return changes
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        chunks = []
+        pos = 0
+        while pos + BATCH.size <= len(data):
+            count, crc = BATCH.unpack_from(data, pos)
+            end = pos + BATCH.size + count * RECORD.size
+            payload = data[pos + BATCH.size:end]
+            if end > len(data) or zlib.crc32(payload) != crc:
+                break
+            chunks.append(np.frombuffer(payload, dtype=RECORD_DTYPE))
+            pos = end
+        if pos < len(data):
+            print(f"[JOURNAL] Dropping {len(data) - pos} torn bytes at the end of {path}")
+            with open(path, 'r+b') as f:
+                f.truncate(pos)
+            if path == self.path:
+                with self.lock:
+                    self.f.seek(0, os.SEEK_END)
+        if not chunks:
+            return {}
+        records = np.concatenate(chunks)
+        return dict(zip(records['idx'].tolist(), records['block'].tolist()))
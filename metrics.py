@@ -0,0 +1,158 @@
+"""Tiny runtime metrics: counters, gauges and histograms kept as plain ints and
+floats (an update is a dict lookup and an add), rendered as Prometheus text
+on demand. Updates are not locked; under the GIL the worst case is a lost
+increment, which is fine for monitoring.
+
+    python server.py --metrics-port 9100   ->   curl 127.0.0.1:9100/metrics
+"""
+import bisect, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REGISTRY = []
+
+# Upper bounds in seconds, 100us .. 1 minute
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _labels(label, value):
+    return f'{{{label}="{value}"}}' if label else ''
+
+
+class Counter:
+    def __init__(self, name, help, label=None):
+        self.name, self.help, self.label = name, help, label
+        self.values = {}
+        REGISTRY.append(self)
+
+    def inc(self, n=1, value=None):
+        self.values[value] = self.values.get(value, 0) + n
+
+    def get(self, value=None):
+        return self.values.get(value, 0)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for value, n in sorted(self.values.items(), key=lambda kv: str(kv[0])):
+            yield f"{self.name}{_labels(self.label, value)} {n}"
+
+
+class Gauge:
+    """Read from a callback when rendered, so it costs nothing in between"""
+    def __init__(self, name, help, read):
+        self.name, self.help, self.read = name, help, read
+        REGISTRY.append(self)
+
+    def get(self):
+        return self.read()
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {self.read()}"
+
+
+class Histogram:
+    def __init__(self, name, help, label=None, buckets=BUCKETS):
+        self.name, self.help, self.label, self.buckets = name, help, label, buckets
+        self.series = {}  # label value -> [bucket counts..., +Inf], sum, count
+        REGISTRY.append(self)
+
+    def observe(self, seconds, value=None):
+        series = self.series.get(value)
+        if series is None:
+            series = self.series[value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, seconds)] += 1
+        series[1] += seconds
+        series[2] += 1
+
+    def time(self, value=None):
+        return _Timer(self, value)
+
+    def count(self, value=None):
+        series = self.series.get(value)
+        return series[2] if series else 0
+
+    def quantile(self, q, value=None):
+        """Upper bound of the bucket holding quantile q (None without samples)"""
+        series = self.series.get(value)
+        if not series or not series[2]:
+            return None
+        target = q * series[2]
+        seen = 0
+        for bound, n in zip(self.buckets + (float('inf'),), series[0]):
+            seen += n
+            if seen >= target:
+                return bound
+        return float('inf')
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for value, (counts, total, count) in sorted(self.series.items(), key=lambda kv: str(kv[0])):
+            prefix = f'{self.label}="{value}",' if self.label else ''
+            seen = 0
+            for bound, n in zip(self.buckets, counts):
+                seen += n
+                yield f'{self.name}_bucket{{{prefix}le="{bound}"}} {seen}'
+            yield f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}'
+            yield f"{self.name}_sum{_labels(self.label, value)} {total}"
+            yield f"{self.name}_count{_labels(self.label, value)} {count}"
+
+
+class _Timer:
+    def __init__(self, histogram, value):
+        self.histogram, self.value = histogram, value
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, self.value)
+
+
+class TimedLock:
+    """threading.Lock that records how long acquiring it had to wait.
+    Uncontended acquires only count a zero wait, no clock reads."""
+    def __init__(self, histogram, value):
+        self.lock = threading.Lock()
+        self.histogram, self.value = histogram, value
+
+    def __enter__(self):
+        if self.lock.acquire(False):
+            self.histogram.observe(0, self.value)
+            return
+        started = time.perf_counter()
+        self.lock.acquire()
+        self.histogram.observe(time.perf_counter() - started, self.value)
+
+    def __exit__(self, *exc):
+        self.lock.release()
+
+
+def render():
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port):
+    """Prometheus scrape endpoint on 127.0.0.1 only, in a daemon thread"""
+    httpd = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
@@ -0,0 +1,100 @@
+"""Pending block changes that are journaled but not yet in the world file.
+
+Recent writes land in a small dict; every so often it is merged into a pair
+of sorted numpy arrays (int64 index, uint8 block), ~9 bytes per change
+instead of ~100 for a dict entry. Merges build new arrays rather than
+writing into the old ones, so snapshot() can hand out the current arrays
+without copying them.
+
+Not thread-safe: the server calls everything with logs_lock held.
+"""
+import numpy as np
+import rle
+
+HOT_MIN = 4096  # hot dict entries before a merge
+HOT_FRACTION = 64  # ...or 1/64 of the merged changes, so merges stay amortised O(1)
+HOT_ENTRY_BYTES = 100  # rough dict cost per entry, for nbytes()
+
+
+class PendingChanges:
+    def __init__(self):
+        self.hot = {}
+        self.hot_new = 0  # hot indices not in the arrays
+        self.idx = np.zeros(0, dtype=np.int64)
+        self.vals = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.idx) + self.hot_new
+
+    def nbytes(self):
+        return self.idx.nbytes + self.vals.nbytes + len(self.hot) * HOT_ENTRY_BYTES
+
+    def _find(self, idx):
+        """Position of idx in the arrays, or -1"""
+        pos = self.idx.searchsorted(idx)
+        return pos if pos < len(self.idx) and self.idx.item(pos) == idx else -1
+
+    def get(self, idx, default=None):
+        if idx in self.hot:
+            return self.hot[idx]
+        pos = self._find(idx)
+        return self.vals.item(pos) if pos >= 0 else default
+
+    def between(self, lo, hi):
+        """Sorted (indices, blocks) of the pending changes with lo <= index < hi"""
+        a, b = np.searchsorted(self.idx, (lo, hi))
+        idx, vals = self.idx[a:b], self.vals[a:b]
+        hot = {k: v for k, v in self.hot.items() if lo <= k < hi}
+        if not hot:
+            return idx, vals
+        hot_idx, hot_vals = rle.sorted_changes(hot)
+        older = ~np.isin(idx, hot_idx)
+        idx = np.concatenate((idx[older], hot_idx))
+        vals = np.concatenate((vals[older], hot_vals))
+        order = np.argsort(idx, kind='stable')
+        return idx[order], vals[order]
+
+    def set(self, idx, block):
+        if idx not in self.hot and self._find(idx) < 0:
+            self.hot_new += 1
+        self.hot[idx] = block
+        if len(self.hot) >= max(HOT_MIN, len(self.idx) // HOT_FRACTION):
+            self._merge()
+
+    def update(self, changes):
+        """Add a {index: block} dict in one go"""
+        self.hot.update(changes)
+        self._merge()
+
+    def _merge(self):
+        if not self.hot: return
+        hot_idx, hot_vals = rle.sorted_changes(self.hot)
+        pos = np.searchsorted(self.idx, hot_idx)
+        found = pos < len(self.idx)
+        found[found] = self.idx[pos[found]] == hot_idx[found]
+        vals = self.vals.copy()  # a snapshot may still hold the old arrays
+        vals[pos[found]] = hot_vals[found]
+        new = ~found
+        self.idx = np.insert(self.idx, pos[new], hot_idx[new])
+        self.vals = np.insert(vals, pos[new], hot_vals[new])
+        self.hot = {}
+        self.hot_new = 0
+
+    def snapshot(self):
+        """Sorted (indices, blocks) arrays of every pending change. They are never
+        modified afterwards, so they can be used outside the lock."""
+        self._merge()
+        return self.idx, self.vals
+
+    def discard_saved(self, snapshot):
+        """Drop changes the world file now has: entries still equal to `snapshot`.
+        Anything overwritten since the snapshot was taken stays pending."""
+        self._merge()
+        saved_idx, saved_vals = snapshot
+        if not len(saved_idx) or not len(self.idx): return
+        pos = np.minimum(np.searchsorted(self.idx, saved_idx), len(self.idx) - 1)
+        done = (self.idx[pos] == saved_idx) & (self.vals[pos] == saved_vals)
+        keep = np.ones(len(self.idx), dtype=bool)
+        keep[pos[done]] = False
+        self.idx = self.idx[keep]
+        self.vals = self.vals[keep]
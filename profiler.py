@@ -0,0 +1,194 @@
+"""Sampling profiler for the live server.
+
+While running, a background thread grabs every thread's Python stack from
+sys._current_frames() every SAMPLE_INTERVAL seconds. Stacks are written in
+collapsed format (`root;caller;leaf count`), which flamegraph.pl and
+https://www.speedscope.app open directly. Nothing is hooked into the
+interpreter, so the server runs at full speed in between samples.
+
+The stacks file counts wall-clock samples, waits included. The hot function
+summary only counts busy samples: the thread is not parked in a known wait
+(IDLE_FRAMES) and its CPU clock moved by at least BUSY_FRACTION of the
+interval, so threads sleeping or blocked in I/O drop out of it.
+
+Stages of the server are marked with `with profiler.span("name"):`. The
+names go at the root of each sampled stack, so a flame graph splits into
+handshake / level_stream / packet_loop / broadcast / save. Spans opened
+inside a coroutine belong to its asyncio task rather than the thread, so
+other clients' tasks running on the same event loop don't inherit them.
+Spans are tracked all the time (a dict append and pop), so a profile
+started mid-session still sees which stage each client is in.
+"""
+import asyncio, collections, os, sys, threading, time
+
+SAMPLE_INTERVAL = 0.01  # seconds between samples (100 Hz)
+BUSY_FRACTION = 0.1  # CPU time, as a share of the interval, that makes a sample busy
+PROFILE_DIR = "profiles"
+# Leaf frames of a thread blocked waiting (in C, below the Python frame)
+IDLE_FRAMES = {("selectors.py", "select"), ("threading.py", "wait"), ("thread.py", "_worker"),
+               ("queue.py", "get"), ("socket.py", "accept")}
+
+_active = None  # the running Profiler, if any
+_spans = {}  # asyncio Task or thread ident -> [open span names]
+_loops = {}  # thread ident -> event loop running on it, see watch_loop()
+
+
+def watch_loop(loop):
+    """Register the event loop of the calling thread, so samples of it can be
+    attributed to the task that is running"""
+    _loops[threading.get_ident()] = loop
+
+
+def _owner():
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return task if task is not None else threading.get_ident()
+
+
+class span:
+    """Marks a stage of the server in profiles"""
+    __slots__ = ('name', 'owner')
+
+    def __init__(self, name):
+        self.name = name
+        self.owner = None
+
+    def __enter__(self):
+        self.owner = _owner()
+        _spans.setdefault(self.owner, []).append(self.name)
+
+    def __exit__(self, *exc):
+        names = _spans[self.owner]
+        names.pop()
+        if not names: del _spans[self.owner]
+
+
+def _label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Profiler:
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = collections.Counter()  # collapsed stack -> samples
+        self.self_samples = collections.Counter()  # leaf label -> busy samples
+        self.total_samples = collections.Counter()  # label -> busy samples with it anywhere on the stack
+        self.stage_samples = collections.Counter()
+        self.samples = 0
+        self.busy = 0
+        self.cpu_seconds = 0.0
+        self.threads = set()
+        self.cpu = {}  # thread ident -> CPU time at the last sample
+        self.started = self.stopped = None
+        self.done = threading.Event()
+
+    def start(self):
+        global _active
+        if _active is not None:
+            raise RuntimeError("A profile is already running")
+        _active = self
+        self.started = time.time()
+        self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        global _active
+        self.done.set()
+        self.thread.join()
+        _active = None
+        self.stopped = time.time()
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self.done.wait(self.interval):
+            frames = sys._current_frames()
+            if frames.keys() - names.keys():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in frames.items():
+                if ident != me:
+                    self._sample(names.get(ident, str(ident)), ident, frame)
+            del frames
+
+    def _sample(self, thread_name, ident, frame):
+        loop = _loops.get(ident)
+        task = asyncio.current_task(loop) if loop is not None else None
+        stages = _spans.get(task if task is not None else ident, ())
+
+        labels = []
+        leaf = frame.f_code
+        while frame is not None:
+            labels.append(_label(frame.f_code))
+            frame = frame.f_back
+        labels.reverse()
+        self.stacks[";".join([thread_name, *stages, *labels])] += 1
+        self.samples += 1
+        self.threads.add(thread_name)
+        if not self._busy(ident, leaf):
+            return
+        self.busy += 1
+        self.self_samples[labels[-1]] += 1
+        for label in set(labels):
+            self.total_samples[label] += 1
+        self.stage_samples[stages[-1] if stages else "other"] += 1
+
+    def _busy(self, ident, leaf):
+        try:
+            now = time.clock_gettime(time.pthread_getcpuclockid(ident))
+        except (AttributeError, OSError):  # no per-thread clocks, the leaf frame has to do
+            now = None
+        if now is not None:
+            used = now - self.cpu.get(ident, now)
+            self.cpu[ident] = now
+            self.cpu_seconds += used
+            if used < self.interval * BUSY_FRACTION:
+                return False
+        return (os.path.basename(leaf.co_filename), leaf.co_name) not in IDLE_FRAMES
+
+    def write(self, path):
+        """Collapsed stacks, one `frames count` line each"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def summary(self, top=5):
+        """A few short lines: samples, CPU used, hot stages and the top
+        functions by self/total share of the busy samples"""
+        busy = self.busy or 1
+        wall = (self.stopped or time.time()) - self.started
+        lines = [f"{self.busy}/{self.samples} samples busy, {len(self.threads)} threads, "
+                 f"{self.cpu_seconds:.1f}s CPU in {wall:.0f}s"]
+        stages = ", ".join(f"{name} {n * 100 / busy:.0f}%" for name, n in self.stage_samples.most_common(4))
+        if stages:
+            lines.append(f"Stages: {stages}")
+        for label, n in self.self_samples.most_common(top):
+            lines.append(f"{n * 100 / busy:.1f}%/{self.total_samples[label] * 100 / busy:.1f}% {label}")
+        return lines
+
+
+def profile_path():
+    return os.path.join(PROFILE_DIR, time.strftime("profile-%Y%m%d-%H%M%S.collapsed"))
+
+
+async def run(seconds, report):
+    """Profile the whole process for `seconds`, write the stacks and pass
+    summary lines to report(line)"""
+    profiler = Profiler()
+    profiler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+    path = profile_path()
+    await asyncio.get_running_loop().run_in_executor(None, profiler.write, path)
+    report(f"Profile written to {path}")
+    for line in profiler.summary():
+        report(line)
+    return profiler
+
+
+def running():
+    return _active is not None
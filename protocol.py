@@ -0,0 +1,69 @@
+"""Client -> server packet framing for the classic protocol.
+
+Every packet a client may send has a fixed length, so the connection reads
+whatever the socket has (up to READ_SIZE) into one buffer and cuts complete
+packets out of it with precompiled structs: a burst of moves costs one read,
+not seven per packet.
+"""
+import struct
+
+READ_SIZE = 64 * 1024
+
+# Packet id -> fields after the id byte
+PACKETS = {
+    0x00: struct.Struct('>B64s64sB'),  # Identification: protocol, name, key, unused
+    0x05: struct.Struct('>hhhBB'),     # Set Block: x, y, z, mode, block
+    0x08: struct.Struct('>BhhhBB'),    # Position: pid, x, y, z, yaw, pitch
+    0x0d: struct.Struct('>B64s'),      # Message: pid, text
+    0x10: struct.Struct('>64sh'),      # CPE ExtInfo: app name, extension count
+    0x11: struct.Struct('>64si'),      # CPE ExtEntry: extension name, version
+}
+# Packet id -> total length including the id byte
+PACKET_LENGTHS = {pid: 1 + s.size for pid, s in PACKETS.items()}
+
+
+class PacketReader:
+    """Splits one client's byte stream into (packet_id, fields) tuples.
+    on_read(n), if given, is called with the size of every socket read."""
+    def __init__(self, reader, on_read=None):
+        self.reader = reader
+        self.on_read = on_read
+        self.buf = bytearray()
+        self.pos = 0
+
+    def next_packet(self):
+        """Next complete packet from the buffer, or None if more bytes are needed.
+
+        Unknown ids come back as (packet_id, None): the stream can't be framed
+        past them, so the caller must drop the client.
+        """
+        if self.pos >= len(self.buf):
+            return None
+        packet_id = self.buf[self.pos]
+        fields = PACKETS.get(packet_id)
+        if fields is None:
+            return packet_id, None
+        if len(self.buf) - self.pos < 1 + fields.size:
+            return None
+        values = fields.unpack_from(self.buf, self.pos + 1)
+        self.pos += 1 + fields.size
+        return packet_id, values
+
+    async def fill(self):
+        data = await self.reader.read(READ_SIZE)
+        if not data:
+            raise ConnectionError("Closed")
+        if self.on_read is not None:
+            self.on_read(len(data))
+        if self.pos:
+            del self.buf[:self.pos]  # drop consumed packets (at most one partial one is left)
+            self.pos = 0
+        self.buf += data
+
+    async def read_packet(self):
+        """Next packet, only touching the socket once the buffer runs dry"""
+        packet = self.next_packet()
+        while packet is None:
+            await self.fill()
+            packet = self.next_packet()
+        return packet
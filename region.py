@@ -0,0 +1,537 @@
+"""Region-indexed world file (world.rgn).
+
+The world is cut into fixed RX x RY x RZ regions, each compressed on its own.
+An offset table at the head of the file points at every region's payload, so
+reading or patching one region only touches that region's bytes.
+
+    [header 16 bytes][table: one 16-byte entry per region][payloads...]
+
+Region r = (ry * nz + rz) * nx + rx, and blocks inside a region use the same
+y, z, x order as the level stream. Patched regions are appended and their
+table entry rewritten, so readers holding an older table stay consistent;
+`compact()` drops the dead payloads once they pile up.
+
+Regions of a generated world start out as TERRAIN entries: no payload, the
+seed in the offset field. They are generated (see terrain.py) whenever they
+are read and only take disk space once a block in them changes.
+
+    python region.py convert world.rle world.rgn --size 2560 128 2560
+    python region.py export world.rgn world.rle
+    python region.py rewrite world.rgn --workers 8 [--verify]
+"""
+import argparse, collections, hashlib, multiprocessing, os, shutil, struct, threading, zlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import rle, terrain
+
+MAGIC = b'HBRG'
+VERSION = 1
+HEADER = struct.Struct('<4sHHHHBBBx')
+ENTRY = np.dtype([('offset', '<u8'), ('length', '<u4'), ('codec', 'u1'), ('fill', 'u1'), ('pad', 'V2')])
+
+REGION = (16, 16, 16)  # RX, RY, RZ
+
+# Region codecs
+UNIFORM = 0  # every block is `fill`, no payload
+ZLIB = 1
+RLE = 2  # rle.encode pairs, for regions with few runs (decodes with one np.repeat)
+TERRAIN = 3  # not generated yet: terrain.generate() with the seed stored in `offset`
+NO_PAYLOAD = (UNIFORM, TERRAIN)
+
+COMPRESS_LEVEL = 6
+RLE_MAX_BYTES = 256  # bigger RLE payloads go through zlib instead
+CACHE_REGIONS = 4096  # decoded regions a RegionCache keeps (4096 * 4KB = 16MB)
+
+
+def encode_region(blocks):
+    """Pick the cheapest codec for one region -> (codec, fill, payload)"""
+    if (blocks == blocks[0]).all():
+        return UNIFORM, blocks[0], b''
+    packed = rle.encode(blocks)
+    if len(packed) <= RLE_MAX_BYTES:
+        return RLE, 0, packed
+    return ZLIB, 0, zlib.compress(blocks.tobytes(), COMPRESS_LEVEL)
+
+
+def decode_region(entry, payload, volume):
+    """Payload bytes of one table entry -> fresh flat uint8 array"""
+    if entry['codec'] == UNIFORM:
+        return np.full(volume, entry['fill'], dtype=np.uint8)
+    if entry['codec'] == ZLIB:
+        return np.frombuffer(zlib.decompress(payload), dtype=np.uint8).copy()
+    if entry['codec'] == RLE:
+        return rle.decode(payload)
+    raise ValueError(f"Unknown region codec {entry['codec']}")
+
+
+class RegionReader:
+    """Reads regions through one file handle and one offset table"""
+    def __init__(self, f, f_lock, table, dims, rdims):
+        self.f = f
+        self.f_lock = f_lock
+        self.table = table
+        self.X, self.Y, self.Z = dims
+        self.RX, self.RY, self.RZ = rdims
+        self.nx = -(-self.X // self.RX)
+        self.ny = -(-self.Y // self.RY)
+        self.nz = -(-self.Z // self.RZ)
+        self.region_volume = self.RX * self.RY * self.RZ
+
+    def locate(self, idx):
+        """World indices -> (region ids, offsets inside the region)"""
+        x = idx % self.X
+        z = (idx // self.X) % self.Z
+        y = idx // (self.X * self.Z)
+        rid = ((y // self.RY) * self.nz + z // self.RZ) * self.nx + x // self.RX
+        local = ((y % self.RY) * self.RZ + z % self.RZ) * self.RX + x % self.RX
+        return rid, local
+
+    def index_of(self, rid, local):
+        """Inverse of locate()"""
+        rx, rz, ry = rid % self.nx, (rid // self.nx) % self.nz, rid // (self.nx * self.nz)
+        lx, lz, ly = local % self.RX, (local // self.RX) % self.RZ, local // (self.RX * self.RZ)
+        return ((ry * self.RY + ly) * self.Z + rz * self.RZ + lz) * self.X + rx * self.RX + lx
+
+    def generate_region(self, rid, seed):
+        """Terrain of one region as a fresh flat array"""
+        rx, rz, ry = rid % self.nx, (rid // self.nx) % self.nz, rid // (self.nx * self.nz)
+        origin = (rx * self.RX, ry * self.RY, rz * self.RZ)
+        return terrain.generate(seed, origin, (self.RY, self.RZ, self.RX), self.Y).reshape(-1)
+
+    def _decode(self, entry, rid):
+        if entry['codec'] == TERRAIN:
+            return self.generate_region(rid, int(entry['offset']))
+        payload = b''
+        if entry['codec'] != UNIFORM:
+            payload = self.read_payload(int(entry['offset']), int(entry['length']))
+        return decode_region(entry, payload, self.region_volume)
+
+    def read_payload(self, offset, length):
+        """Raw (still encoded) payload bytes of one table entry"""
+        with self.f_lock:
+            self.f.seek(offset)
+            return self.f.read(length)
+
+    def read_region(self, rid):
+        """Decode one region into a fresh flat uint8 array (y, z, x order)"""
+        return self._decode(self.table[rid].copy(), rid)
+
+    def read_slab(self, ry):
+        """Decode one layer of regions into world order: shape (layers, Z, X)"""
+        per_slab = self.nz * self.nx
+        entries = self.table[ry * per_slab:(ry + 1) * per_slab].copy()
+        slab = np.empty((per_slab, self.region_volume), dtype=np.uint8)
+        uniform = entries['codec'] == UNIFORM
+        slab[uniform] = entries['fill'][uniform][:, None]
+        generated = entries['codec'] == TERRAIN
+        for seed in np.unique(entries['offset'][generated]).tolist():
+            # Generate the whole layer in one go rather than region by region
+            heights = terrain.heightmap(seed, 0, 0, self.nx * self.RX, self.nz * self.RZ, self.Y)
+            blocks = terrain.fill(heights, ry * self.RY, self.RY, self.Y)
+            blocks = blocks.reshape(self.RY, self.nz, self.RZ, self.nx, self.RX).transpose(1, 3, 0, 2, 4)
+            blocks = blocks.reshape(per_slab, self.region_volume)
+            same = generated & (entries['offset'] == seed)
+            slab[same] = blocks[same]
+        for k in np.flatnonzero(~uniform & ~generated):
+            slab[k] = self._decode(entries[k], ry * per_slab + k)
+        y0 = ry * self.RY
+        layers = min(self.RY, self.Y - y0)
+        world = slab.reshape(self.nz, self.nx, self.RY, self.RZ, self.RX).transpose(2, 0, 3, 1, 4)
+        world = world.reshape(self.RY, self.nz * self.RZ, self.nx * self.RX)
+        return np.ascontiguousarray(world[:layers, :self.Z, :self.X])
+
+    def iter_slabs(self, changes=None):
+        """Yield (start, blocks) over the whole world in level order with `changes` overlaid"""
+        change_idx, change_vals = rle.sorted_changes(changes)
+        for ry in range(self.ny):
+            blocks = self.read_slab(ry).reshape(-1)
+            start = ry * self.RY * self.X * self.Z
+            lo, hi = np.searchsorted(change_idx, (start, start + len(blocks)))
+            if hi > lo:
+                blocks[change_idx[lo:hi] - start] = change_vals[lo:hi]
+            yield start, blocks
+
+
+class RegionFile(RegionReader):
+    """A world.rgn opened for reading and patching"""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()  # one writer at a time
+        self._open()
+
+    def _open(self):
+        f = open(self.path, 'r+b')
+        magic, version, X, Y, Z, RX, RY, RZ = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self.path} is not a version {VERSION} region file")
+        count = -(-X // RX) * -(-Y // RY) * -(-Z // RZ)
+        table = np.frombuffer(f.read(count * ENTRY.itemsize), dtype=ENTRY).copy()
+        if len(table) != count:
+            raise ValueError(f"{self.path}: truncated region table")
+        super().__init__(f, threading.Lock(), table, (X, Y, Z), (RX, RY, RZ))
+        # Swapped in one assignment so lock-free readers never mix two files
+        self.epoch = getattr(self, 'epoch', -1) + 1
+        self.handle = (self.epoch, f, self.f_lock, table)
+
+    @classmethod
+    def create(cls, path, dims, rdims=REGION, fill=0, seed=None):
+        """Write a world where every region is uniformly `fill`, or is terrain
+        from `seed` that gets generated on first read"""
+        nx, ny, nz = (-(-d // r) for d, r in zip(dims, rdims))
+        table = np.zeros(nx * ny * nz, dtype=ENTRY)
+        table['codec'] = UNIFORM
+        table['fill'] = fill
+        if seed is not None:
+            # Layers above the highest possible surface (and the sea) are plain air
+            top = max(terrain.max_height(dims[1]), terrain.sea_level(dims[1]))
+            ground = -(-top // rdims[1]) * nz * nx
+            table['codec'][:ground] = TERRAIN
+            table['offset'][:ground] = seed
+            table['fill'] = 0
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, *dims, *rdims))
+            f.write(table.tobytes())
+        return cls(path)
+
+    def dims(self):
+        return self.X, self.Y, self.Z
+
+    def close(self):
+        with self.lock, self.f_lock:
+            self.f.close()
+
+    def snapshot(self):
+        """Frozen reader: payloads are never overwritten, so a table copy stays valid"""
+        with self.lock:
+            return RegionReader(self.f, self.f_lock, self.table.copy(), self.dims(), (self.RX, self.RY, self.RZ))
+
+    def live_bytes(self):
+        return int(self.table['length'].sum())
+
+    def write_regions(self, regions):
+        """Store {rid: flat blocks}: append the payloads, fsync, then repoint the table"""
+        if not regions: return
+        with self.lock:
+            updates = []
+            payloads = []
+            with self.f_lock:
+                self.f.seek(0, os.SEEK_END)
+                end = self.f.tell()
+                for rid, blocks in regions.items():
+                    entry = np.zeros(1, dtype=ENTRY)[0]
+                    entry['codec'], entry['fill'], payload = encode_region(blocks)
+                    if payload:
+                        payloads.append(payload)
+                        entry['offset'] = end
+                        entry['length'] = len(payload)
+                        end += len(payload)
+                    updates.append((rid, entry))
+                # All payloads of the batch go out in one write
+                self.f.write(b''.join(payloads))
+                self.f.flush()
+                os.fsync(self.f.fileno())
+
+                for rid, entry in updates:
+                    self.f.seek(HEADER.size + rid * ENTRY.itemsize)
+                    self.f.write(entry.tobytes())
+                    self.table[rid] = entry
+                self.f.flush()
+                os.fsync(self.f.fileno())
+
+    def write_slab(self, ry, blocks):
+        """Store one layer of regions from world-ordered blocks of shape (layers, Z, X)"""
+        padded = np.zeros((self.RY, self.nz * self.RZ, self.nx * self.RX), dtype=np.uint8)
+        padded[:blocks.shape[0], :self.Z, :self.X] = blocks
+        regions = padded.reshape(self.RY, self.nz, self.RZ, self.nx, self.RX).transpose(1, 3, 0, 2, 4)
+        regions = regions.reshape(self.nz * self.nx, self.region_volume)
+        base = ry * self.nz * self.nx
+        self.write_regions({base + k: regions[k] for k in range(len(regions))})
+
+    def _group_changes(self, changes):
+        """{index: block} -> (region ids, offsets, blocks), sorted by region"""
+        idx, vals = rle.sorted_changes(changes)
+        rid, local = self.locate(idx)
+        order = np.argsort(rid, kind='stable')
+        return rid[order], local[order], vals[order]
+
+    def count_dirty(self, changes):
+        rid, local = self.locate(rle.sorted_changes(changes)[0])
+        return len(np.unique(rid))
+
+    def apply_changes(self, changes, batch=4096):
+        """Patch {index: block} into the file, rewriting only the regions they touch"""
+        rid, local, vals = self._group_changes(changes)
+        if not len(rid): return 0
+        # Group boundaries: one slice of changes per dirty region
+        starts = np.flatnonzero(np.concatenate(([True], rid[1:] != rid[:-1])))
+        ends = np.append(starts[1:], len(rid))
+        pending = {}
+        for s, e in zip(starts, ends):
+            r = int(rid[s])
+            blocks = self.read_region(r)
+            blocks[local[s:e]] = vals[s:e]
+            pending[r] = blocks
+            if len(pending) >= batch:
+                self.write_regions(pending)
+                pending = {}
+        self.write_regions(pending)
+        return len(starts)
+
+    def garbage_bytes(self):
+        with self.f_lock:
+            size = os.fstat(self.f.fileno()).st_size
+        return size - HEADER.size - len(self.table) * ENTRY.itemsize - self.live_bytes()
+
+    def rewrite_to(self, out_path, changes=None, workers=1):
+        """Write a fresh copy of the world (with `changes` applied) to out_path.
+
+        The regions are split into contiguous ranges. With workers > 1 each range
+        is encoded by a separate process into its own segment file, and the
+        segments are stitched in order, so the result is byte-identical to the
+        serial path.
+        """
+        with self.lock:
+            table = self.table.copy()
+            rid, local, vals = self._group_changes(changes)
+            with self.f_lock:
+                self.f.flush()
+            tasks = max(1, workers) * 4 if workers > 1 else 1
+            bounds = np.linspace(0, len(table), tasks + 1).astype(np.int64)
+            jobs = []
+            for k in range(tasks):
+                r0, r1 = int(bounds[k]), int(bounds[k + 1])
+                lo, hi = np.searchsorted(rid, (r0, r1))
+                jobs.append((self.path, table[r0:r1], r0, self.dims(), (self.RX, self.RY, self.RZ),
+                             rid[lo:hi], local[lo:hi], vals[lo:hi], f"{out_path}.seg{k}"))
+
+            if workers > 1:
+                ctx = multiprocessing.get_context('spawn')
+                with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+                    results = list(pool.map(_rewrite_segment, *zip(*jobs)))
+            else:
+                results = [_rewrite_segment(*job) for job in jobs]
+
+            with open(out_path, 'wb') as out:
+                out.write(HEADER.pack(MAGIC, VERSION, *self.dims(), self.RX, self.RY, self.RZ))
+                out.write(table.tobytes())  # placeholder, rewritten below
+                base = out.tell()
+                for k, (seg_table, seg_length) in enumerate(results):
+                    r0 = int(bounds[k])
+                    stored = ~np.isin(seg_table['codec'], NO_PAYLOAD)
+                    seg_table['offset'][stored] += base
+                    table[r0:r0 + len(seg_table)] = seg_table
+                    seg_path = f"{out_path}.seg{k}"
+                    with open(seg_path, 'rb') as seg:
+                        shutil.copyfileobj(seg, out, 8 * 1024 * 1024)
+                    os.remove(seg_path)
+                    base += seg_length
+                out.seek(HEADER.size)
+                out.write(table.tobytes())
+                out.flush()
+                os.fsync(out.fileno())
+        return len(np.unique(rid))
+
+    def rewrite(self, changes=None, workers=1):
+        """Rewrite the whole file (applying `changes`, dropping dead payloads) and swap it in atomically"""
+        tmp_path = self.path + ".tmp"
+        with self.lock:
+            dirty = self.rewrite_to(tmp_path, changes, workers)
+            os.replace(tmp_path, self.path)
+            # Old snapshots keep the previous handle (and inode) alive until they are done
+            self._open()
+        return dirty
+
+    def compact(self, workers=1):
+        """Drop dead payloads"""
+        self.rewrite(None, workers)
+
+
+class RegionCache:
+    """Point and box reads through an LRU of decoded regions.
+
+    Cached regions are keyed by their table entry (and file epoch), so a save
+    that patches or moves a region makes it miss and the stale copy ages out.
+    Safe to use from any thread while the world is being saved.
+    """
+    def __init__(self, world, max_regions=CACHE_REGIONS):
+        self.world = world
+        self.max_regions = max_regions
+        self.regions = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def region(self, rid):
+        """Region `rid` as a read-only flat array, or its fill value if it is uniform"""
+        epoch, f, f_lock, table = self.world.handle
+        offset, length, codec, fill, pad = table.item(rid)  # one atomic read, ~10x faster than table[rid]
+        if codec == UNIFORM:
+            return fill
+        key = (rid, epoch, offset)
+        with self.lock:
+            blocks = self.regions.get(key)
+            if blocks is not None:
+                self.regions.move_to_end(key)
+                self.hits += 1
+                return blocks
+            self.misses += 1
+        if codec == TERRAIN:
+            blocks = self.world.generate_region(rid, offset)
+        else:
+            with f_lock:
+                f.seek(offset)
+                payload = f.read(length)
+            blocks = decode_region({'codec': codec, 'fill': fill}, payload, self.world.region_volume)
+        blocks.flags.writeable = False
+        with self.lock:
+            self.regions[key] = blocks
+            while len(self.regions) > self.max_regions:
+                self.regions.popitem(last=False)
+        return blocks
+
+    def get_block(self, x, y, z):
+        w = self.world
+        rid = ((y // w.RY) * w.nz + z // w.RZ) * w.nx + x // w.RX
+        blocks = self.region(rid)
+        if isinstance(blocks, int):
+            return blocks
+        return blocks.item(((y % w.RY) * w.RZ + z % w.RZ) * w.RX + x % w.RX)
+
+    def get_box(self, x0, y0, z0, x1, y1, z1):
+        """Blocks in [x0, x1) x [y0, y1) x [z0, z1) as a (y, z, x) array"""
+        w = self.world
+        out = np.empty((y1 - y0, z1 - z0, x1 - x0), dtype=np.uint8)
+        for ry in range(y0 // w.RY, (y1 - 1) // w.RY + 1):
+            ya, yb = max(y0, ry * w.RY), min(y1, (ry + 1) * w.RY)
+            for rz in range(z0 // w.RZ, (z1 - 1) // w.RZ + 1):
+                za, zb = max(z0, rz * w.RZ), min(z1, (rz + 1) * w.RZ)
+                for rx in range(x0 // w.RX, (x1 - 1) // w.RX + 1):
+                    xa, xb = max(x0, rx * w.RX), min(x1, (rx + 1) * w.RX)
+                    blocks = self.region((ry * w.nz + rz) * w.nx + rx)
+                    dest = out[ya - y0:yb - y0, za - z0:zb - z0, xa - x0:xb - x0]
+                    if isinstance(blocks, int):
+                        dest[...] = blocks
+                    else:
+                        blocks = blocks.reshape(w.RY, w.RZ, w.RX)
+                        dest[...] = blocks[ya - ry * w.RY:yb - ry * w.RY,
+                                           za - rz * w.RZ:zb - rz * w.RZ,
+                                           xa - rx * w.RX:xb - rx * w.RX]
+        return out
+
+
+def _rewrite_segment(path, table, r0, dims, rdims, rid, local, vals, seg_path):
+    """Pool worker: re-encode regions [r0, r0 + len(table)) into seg_path.
+
+    Reads the source through a memory map; untouched payloads are copied as-is.
+    Returns the range's table with offsets relative to the segment start.
+    """
+    src = np.memmap(path, dtype=np.uint8, mode='r')
+    volume = rdims[0] * rdims[1] * rdims[2]
+    reader = RegionReader(None, None, table, dims, rdims)  # only for generate_region
+    table = table.copy()
+    bounds = np.searchsorted(rid, np.arange(r0, r0 + len(table) + 1))
+    pos = 0
+    buffered = []
+    with open(seg_path, 'wb') as seg:
+        for k in range(len(table)):
+            entry = table[k]
+            s, e = bounds[k], bounds[k + 1]
+            if entry['codec'] not in NO_PAYLOAD:
+                offset = int(entry['offset'])
+                payload = src[offset:offset + int(entry['length'])].tobytes()
+            else:
+                payload = b''
+            if e > s:
+                if entry['codec'] == TERRAIN:
+                    blocks = reader.generate_region(r0 + k, int(entry['offset']))
+                else:
+                    blocks = decode_region(entry, payload, volume)
+                blocks[local[s:e]] = vals[s:e]
+                entry['codec'], entry['fill'], payload = encode_region(blocks)
+            if entry['codec'] == UNIFORM:
+                entry['offset'] = 0
+                entry['length'] = 0
+                continue
+            if entry['codec'] == TERRAIN:
+                continue  # still not generated, keeps its seed
+            entry['offset'] = pos
+            entry['length'] = len(payload)
+            buffered.append(payload)
+            pos += len(payload)
+            if len(buffered) >= 4096:
+                seg.write(b''.join(buffered))
+                buffered = []
+        seg.write(b''.join(buffered))
+    return table, pos
+
+
+def convert_rle(rle_path, rgn_path, dims, rdims=REGION):
+    """One-shot conversion of a legacy world.rle into a region file"""
+    X, Y, Z = dims
+    tmp_path = rgn_path + ".tmp"
+    world = RegionFile.create(tmp_path, dims, rdims)
+    view = rle.RLEView(rle_path)
+    for ry in range(world.ny):
+        y0 = ry * world.RY
+        y1 = min(y0 + world.RY, Y)
+        blocks = view.expand(y0 * X * Z, y1 * X * Z).reshape(y1 - y0, Z, X)
+        world.write_slab(ry, blocks)
+    world.f.close()
+    os.replace(tmp_path, rgn_path)
+
+
+def export_rle(rgn_path, rle_path):
+    """Flatten a region file back into a legacy world.rle, one write per layer of regions"""
+    world = RegionFile(rgn_path)
+    tmp_path = rle_path + ".tmp"
+    with open(tmp_path, 'wb') as out:
+        for start, blocks in world.iter_slabs():
+            out.write(rle.encode(blocks))
+    os.replace(tmp_path, rle_path)
+    return world.dims()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="World file tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+    conv = sub.add_parser('convert', help="convert a legacy world.rle into a region file")
+    conv.add_argument('source', nargs='?', default='world.rle')
+    conv.add_argument('dest', nargs='?', default='world.rgn')
+    conv.add_argument('--size', type=int, nargs=3, default=(2560, 128, 2560), metavar=('X', 'Y', 'Z'))
+    export = sub.add_parser('export', help="flatten a region file back into a legacy world.rle")
+    export.add_argument('source', nargs='?', default='world.rgn')
+    export.add_argument('dest', nargs='?', default='world.rle')
+    rewrite = sub.add_parser('rewrite', help="compact a region file with a process pool")
+    rewrite.add_argument('path', nargs='?', default='world.rgn')
+    rewrite.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    rewrite.add_argument('--verify', action='store_true',
+                         help="only check that the parallel output is byte-identical to the serial one")
+    args = parser.parse_args()
+
+    if args.command == 'rewrite':
+        world = RegionFile(args.path)
+        if args.verify:
+            digests = []
+            for workers in (1, args.workers):
+                out_path = f"{args.path}.verify{workers}"
+                world.rewrite_to(out_path, workers=workers)
+                with open(out_path, 'rb') as f:
+                    digests.append(hashlib.sha256(f.read()).hexdigest())
+                os.remove(out_path)
+            print(f"[VERIFY] serial {digests[0][:16]} / {args.workers} workers {digests[1][:16]}: "
+                  f"{'identical' if digests[0] == digests[1] else 'MISMATCH'}")
+            if digests[0] != digests[1]:
+                raise SystemExit(1)
+        else:
+            world.compact(args.workers)
+            print(f"[REWRITE] {args.path} compacted with {args.workers} workers")
+    elif args.command == 'export':
+        dims = export_rle(args.source, args.dest)
+        print(f"[EXPORT] {args.source} -> {args.dest} ({'x'.join(map(str, dims))})")
+    elif args.command == 'convert':
+        print(f"[CONVERT] {args.source} -> {args.dest} ({'x'.join(map(str, args.size))})")
+        convert_rle(args.source, args.dest, tuple(args.size))
+        print("[CONVERT] Done!")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""RLE helpers for world files: a flat stream of (count, value) byte pairs."""
+import os
+import numpy as np
+
+
+class RLEView:
+    """Memory-mapped (count, value) pairs plus their cumulative run ends"""
+    def __init__(self, path):
+        if os.path.getsize(path) < 2:
+            self.counts = np.zeros(0, dtype=np.uint8)
+            self.vals = np.zeros(0, dtype=np.uint8)
+        else:
+            data = np.memmap(path, dtype=np.uint8, mode='r')
+            data = data[:len(data) // 2 * 2]
+            self.counts = data[0::2]
+            self.vals = data[1::2]
+        # cum[k] is the index one past the last block of pair k
+        self.cum = np.cumsum(self.counts, dtype=np.int64)
+        self.total = int(self.cum[-1]) if len(self.cum) else 0
+
+    def expand(self, start, end):
+        """Decode blocks [start, end) into a fresh uint8 array"""
+        first = int(np.searchsorted(self.cum, start, side='right'))
+        last = min(int(np.searchsorted(self.cum, end, side='left')), len(self.cum) - 1)
+        if first > last:
+            return np.zeros(end - start, dtype=np.uint8)
+
+        run_ends = self.cum[first:last + 1]
+        run_starts = run_ends - self.counts[first:last + 1]
+        # Clip the first/last runs to the window
+        lengths = np.minimum(run_ends, end) - np.maximum(run_starts, start)
+        out = np.repeat(self.vals[first:last + 1], lengths)
+        if len(out) < end - start:  # file shorter than the world: the rest is air
+            out = np.concatenate((out, np.zeros(end - start - len(out), dtype=np.uint8)))
+        return out
+
+
+def encode(blocks):
+    """Vectorized RLE: uint8 blocks -> interleaved (count, value) bytes, runs split at 255"""
+    n = len(blocks)
+    if n == 0:
+        return b''
+    starts = np.flatnonzero(np.concatenate(([True], blocks[1:] != blocks[:-1])))
+    lengths = np.diff(np.append(starts, n))
+    # A run of L blocks becomes ceil(L / 255) pairs: full 255s, then the remainder
+    pieces = (lengths + 254) // 255
+    counts = np.full(int(pieces.sum()), 255, dtype=np.uint8)
+    counts[np.cumsum(pieces) - 1] = lengths - (pieces - 1) * 255
+    out = np.empty(2 * len(counts), dtype=np.uint8)
+    out[0::2] = counts
+    out[1::2] = np.repeat(blocks[starts], pieces)
+    return out.tobytes()
+
+
+def decode(data):
+    """Interleaved (count, value) bytes -> uint8 blocks"""
+    pairs = np.frombuffer(data, dtype=np.uint8)
+    return np.repeat(pairs[1::2], pairs[0::2])
+
+
+def sorted_changes(changes):
+    """Turn a {index: block} dict into sorted (indices, blocks) arrays.
+    Already sorted arrays (pending.PendingChanges.snapshot()) pass through."""
+    if isinstance(changes, tuple):
+        return changes
+    if not changes:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint8)
+    idx = np.fromiter(changes.keys(), dtype=np.int64, count=len(changes))
+    vals = np.fromiter(changes.values(), dtype=np.uint8, count=len(changes))
+    order = np.argsort(idx, kind='stable')
+    return idx[order], vals[order]
+
@@ -1,339 +1,1063 @@
-import socket, struct, gzip, io, os, threading, time, numpy as np
-import requests, json, random, string, hashlib
+import asyncio, struct, os, threading, time, zlib, numpy as np
+import requests, json, random, string, collections, argparse
 from pyngrok import ngrok
 import ujson as json
+import region, journal, protocol, pending, metrics, profiler, accounts, backup, history, worlds, ticks
 
 
-# World configuration
+# World configuration: size of a newly created world (existing ones keep theirs)
 X, Y, Z = 2560, 128, 2560
-clients = {}
-clients_lock = threading.Lock()
-next_player_id = 0
+PORT = 25565
+METRICS_PORT = None  # localhost Prometheus endpoint, None = off
+PROFILE_SECONDS = None  # profile the first N seconds after startup, see profiler.py
+PROFILE_MAX_SECONDS = 300
+clients = {}  # Connection -> (name, player_id); only touched from the event loop
+free_player_ids = set(range(128))  # classic player ids are signed bytes, -1 means "you"
 admin_list = ["TheMrRedSlime"]
 USER_DB_FILE = "users.json"
+account_store = None  # accounts.AccountStore over USER_DB_FILE, opened in main()
+# Levels: the default one lives in the working directory, every other in
+# WORLDS_DIR/<name>/. Each directory holds the files and folders below.
+DEFAULT_WORLD = "main"
+WORLDS_DIR = "worlds"
+WORLD_NAME_CHARS = set(string.ascii_letters + string.digits + "_-")
+level_manager = None  # worlds.WorldManager, opened in main()
+WORLD_FILE = "world.rgn"
+LEGACY_WORLD_FILE = "world.rle"  # converted to WORLD_FILE on first start
+WORLD_SEED = None  # terrain seed for a fresh world, None = random
+JOURNAL_FILE = "world.journal"
+JOURNAL_COMPACT_BYTES = 4 * 1024 * 1024  # fold the journal into the world past this size
+JOURNAL_CHECK_INTERVAL = 10
+SAVE_WORKERS = os.cpu_count() or 1  # processes for whole-file saves, 1 = serial
+PARALLEL_SAVE_REGIONS = 4096  # dirty regions past which a save rewrites the file in parallel
+BACKUP_DIR = "backups"
+BACKUP_INTERVAL = 3600  # seconds between automatic snapshots, 0 = only on /backup
+BACKUP_KEEP = 24  # snapshots kept, older ones are pruned after each new one
+HISTORY_DIR = "history"
+ROLLBACK_BATCH = 256  # blocks reverted per logs_lock hold; a placement waits for one batch at most
+# Block updates (falling sand and gravel, flowing water and lava), see ticks.py
+PHYSICS = True  # --no-physics: blocks stay where they are put
+BLOCK_TICK_RATE = 20  # block update ticks per second
+TICK_BUDGET = 2000  # updates per level per tick; the rest wait for the next tick
+TICK_BATCH = 64  # updates per logs_lock hold; each reads and may write a handful of neighbours
+TICK_MAX_LAG = 10  # ticks the loop may fall behind before it skips ahead
+AIR, WATER, STILL_WATER, LAVA, STILL_LAVA, SAND, GRAVEL = 0, 8, 9, 10, 11, 12, 13
+FALL_THROUGH = {AIR, WATER, STILL_WATER, LAVA, STILL_LAVA}
+FLUIDS = {WATER: (WATER, 7), STILL_WATER: (WATER, 7), LAVA: (LAVA, 3), STILL_LAVA: (LAVA, 3)}  # -> (flowing block, reach)
 player_list = set()
 authenticated_clients = set()
 
-# LOG-BASED SYSTEM: Stores (index, block_type) to avoid 2GB RAM usage
-block_logs = {} 
-logs_lock = threading.Lock()
+# Runtime metrics: always collected (plain adds), read by /stats and the --metrics-port endpoint
+packets_in = metrics.Counter("hb_packets_in_total", "Client packets handled, by type", "type")
+bytes_in = metrics.Counter("hb_bytes_in_total", "Bytes read from clients")
+bytes_out = metrics.Counter("hb_bytes_out_total", "Bytes written to clients")
+fanout_seconds = metrics.Histogram("hb_fanout_seconds", "Time spent queueing one broadcast to its recipients", "kind")
+lock_wait_seconds = metrics.Histogram("hb_lock_wait_seconds", "Time spent waiting to acquire a lock", "lock",
+                                      (0,) + metrics.BUCKETS)  # uncontended acquires land in le="0"
+join_level_seconds = metrics.Histogram("hb_join_level_seconds", "Level stream duration per join")
+save_seconds = metrics.Histogram("hb_save_seconds", "World save duration")
+save_bytes = metrics.Counter("hb_save_bytes_total", "Bytes written to the world file by saves")
+backup_seconds = metrics.Histogram("hb_backup_seconds", "World snapshot duration")
+tick_seconds = metrics.Histogram("hb_block_tick_seconds", "Duration of block ticks that ran updates")
+block_updates = metrics.Counter("hb_block_updates_total", "Scheduled block updates run")
+tick_overruns = metrics.Counter("hb_block_tick_overruns_total", "Block ticks skipped because the loop fell behind")
+metrics.Gauge("hb_players", "Connected clients", lambda: len(clients))
+metrics.Gauge("hb_worlds_loaded", "Levels loaded", lambda: len(loaded_levels()))
+metrics.Gauge("hb_world_memory_bytes", "Estimated memory held by loaded levels",
+              lambda: sum(level.memory_bytes() for level in loaded_levels()))
+metrics.Gauge("hb_pending_changes", "Block changes not yet saved to the world files",
+              lambda: sum(len(level.block_logs) for level in loaded_levels()))
+metrics.Gauge("hb_pending_bytes", "Approximate memory held by pending block changes",
+              lambda: sum(level.block_logs.nbytes() for level in loaded_levels()))
+metrics.Gauge("hb_send_queue_bytes", "Bytes queued for all clients", lambda: sum(conn.queued_bytes for conn in list(clients)))
+metrics.Gauge("hb_block_updates_pending", "Scheduled block updates waiting",
+              lambda: sum(len(level.block_ticks) for level in loaded_levels()))
+metrics.Gauge("hb_block_tick_lag", "Ticks the oldest due block update has waited",
+              lambda: max((level.block_ticks.lag() for level in loaded_levels()), default=0))
+metrics.Gauge("hb_journal_bytes", "Journal size", lambda: sum(level.block_journal.size() for level in loaded_levels()))
 
-def hash_password(password):
-    return hashlib.sha512(password.encode()).hexdigest()
+PENDING_MAX_BYTES = 64 * 1024 * 1024  # save a level early once its block_logs hold this much
+save_requested = threading.Event()  # wakes auto_save_task when a level passes PENDING_MAX_BYTES
 
-def load_users():
-    if os.path.exists(USER_DB_FILE):
-        with open(USER_DB_FILE, 'r') as f: return json.load(f)
-    return {}
+# Seconds to wait after a block change before rebuilding the shared level snapshot
+LEVEL_CACHE_DEBOUNCE = 5
 
-def save_user(username, password_hash):
-    users = load_users()
-    users[username.lower()] = password_hash
-    with open(USER_DB_FILE, 'w') as f: json.dump(users, f)
+# Per-client send queue backpressure
+SEND_QUEUE_SOFT_LIMIT = 256 * 1024  # above this, new position updates for the client are dropped
+SEND_QUEUE_HIGH_WATER = 1024 * 1024  # clients stuck above this for SEND_QUEUE_GRACE seconds are dropped
+SEND_QUEUE_GRACE = 10
+SEND_QUEUE_HARD_LIMIT = 8 * 1024 * 1024  # dropped immediately
+WRITE_BATCH_BYTES = 64 * 1024
+
+# Classic Protocol Extension: clients flag support with 0x42 in the handshake's unused byte
+CPE_MAGIC = 0x42
+CPE_APP_NAME = "HobbyBuster"
+CPE_EXTENSIONS = {"FastMap": 1, "BulkBlockUpdate": 1}
+BULK_MIN_CHANGES = 161  # below this a 1282-byte BulkBlockUpdate is bigger than 8-byte 0x06s
+# Packet layouts for building many block updates at once with numpy
+BULK_PACKET = np.dtype([('id', 'u1'), ('count', 'u1'), ('idx', '>i4', 256), ('block', 'u1', 256)])
+SET_BLOCK_PACKET = np.dtype([('id', 'u1'), ('x', '>i2'), ('y', '>i2'), ('z', '>i2'), ('block', 'u1')])
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+MOVE_TICK_RATE = 20  # movement broadcasts per second
+player_poses = {}  # player_id -> newest (x, y, z, yaw, pitch) the client sent
+sent_poses = {}  # player_id -> pose every other client last heard about
+
+# Interest management: movement and block changes only go to players within VIEW_RADIUS,
+# through a grid of cells kept per level (see Level)
+VIEW_RADIUS = 256  # blocks, measured horizontally
+VIEW_HYSTERESIS = 16  # a visible player is only despawned this far past the radius
+GRID_CELL = VIEW_RADIUS + VIEW_HYSTERESIS  # blocks; the 3x3 cells around a player cover its view
+player_names = {}  # player_id -> name
+CELL_CHANGES_PRUNE_INTERVAL = 10  # seconds
+CELL_CHANGES_MAX = 4096  # blocks a cell remembers one by one; past this, only which regions changed
+REPLAY_REGIONS = 8  # whole regions resent per write (256KB of 0x06), each once the send queue has drained
 
 def pad_string(s):
     return s[:64].ljust(64).encode('ascii')
 
-def recv_exact(sock, n, max_size=1024):
-    if n > max_size:
-        raise ValueError(f"Security Trigger: Packet size {n} exceeds limit {max_size}")
-        
-    data = b''
-    while len(data) < n:
-        chunk = sock.recv(n - len(data))
-        if not chunk: raise ConnectionError("Closed")
-        data += chunk
-    return data
-    
-def generate_initial_rle():
-    """Creates a new world.rle with half grass if none exists."""
-    if os.path.exists("world.rle"): return
-    print("[SERVER] Generating initial RLE world (Half Grass)...")
-    half = (X * Y * Z) // 2
-    with open("world.rle", "wb") as f:
-        # Write in chunks to avoid memory issues
-        chunk_size = 10000000  # 10M blocks at a time
-        remaining_grass = half
-        
-        while remaining_grass > 0:
-            count = min(255, remaining_grass)
-            f.write(bytes([count, 2]))  # Grass
-            remaining_grass -= count
-        
-        remaining_air = (X * Y * Z) - half
-        while remaining_air > 0:
-            count = min(255, remaining_air)
-            f.write(bytes([count, 0]))  # Air
-            remaining_air -= count
-    
-    print("[SERVER] RLE world generated!")
+class Connection:
+    """One client on the event loop with its own bounded send queue.
+
+    send() only enqueues; a writer task drains the queue in batches, so one slow
+    client never holds anyone else up. Movement goes through send_moves(),
+    which skips the tick once the queue passes SEND_QUEUE_SOFT_LIMIT and flags
+    the client for an absolute resync instead.
+    """
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.packets = protocol.PacketReader(reader, bytes_in.inc)
+        self.writer = writer
+        self.address = writer.get_extra_info('peername')
+        self.queue = collections.deque()
+        self.queued_bytes = 0
+        self.dropped = 0  # movement ticks skipped
+        self.needs_resync = False
+        self.over_since = None
+        self.closing = False
+        self.wake = asyncio.Event()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.writer_task = asyncio.create_task(self._write_loop())
+        # Interest management, see movement_tick_once()
+        self.join_seq = 0  # level broadcast_seq when the client got the level, see enter_level()
+        self.cell = None  # grid cell the view is centred on
+        self.cells = ()  # grid cells in view
+        self.cell_baseline = {}  # cell -> level broadcast_seq when it left view
+        self.visible = set()  # player_ids spawned on this client
+        self.extensions = set()  # CPE extensions agreed on in the handshake
+        self.block_batch = None  # {index: block} sent once per tick, for BulkBlockUpdate clients
+        self.level = None  # Level the client is in, see enter_level()
+        self.spawn = None  # (x, y, z) in 1/32 blocks, where /goto or the join put it
+
+    def send(self, data):
+        if self.closing: return
+        self.queue.append(data)
+        self._queued(len(data))
+
+    def send_moves(self, data):
+        """One tick of relative moves; if they can't go out, the next tick resyncs absolutely"""
+        if self.closing: return
+        if self.queued_bytes > SEND_QUEUE_SOFT_LIMIT:
+            self.dropped += 1
+            self.needs_resync = True
+            return
+        self.send(data)
+
+    def _queued(self, n):
+        self.queued_bytes += n
+        self.idle.clear()
+        self.wake.set()
+        if self.queued_bytes <= SEND_QUEUE_HIGH_WATER:
+            self.over_since = None
+            return
+        now = time.monotonic()
+        if self.over_since is None:
+            self.over_since = now
+        if self.queued_bytes > SEND_QUEUE_HARD_LIMIT or now - self.over_since > SEND_QUEUE_GRACE:
+            print(f"[NETWORK] Dropping {self.address}: {self.queued_bytes:,} bytes stuck in its send queue")
+            self.abort()
+
+    async def _write_loop(self):
+        try:
+            while True:
+                if not self.queue:
+                    self.idle.set()
+                    if self.closing: break
+                    self.wake.clear()
+                    await self.wake.wait()
+                    continue
+                batch = bytearray()
+                while self.queue and len(batch) < WRITE_BATCH_BYTES:
+                    batch += self.queue.popleft()
+                self.queued_bytes -= len(batch)
+                bytes_out.inc(len(batch))
+                self.writer.write(batch)
+                await self.writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.idle.set()
+            self.writer.close()
+
+    async def send_direct(self, data):
+        """Write a big blob (the level) straight to the socket, after anything already queued"""
+        await self.idle.wait()
+        bytes_out.inc(len(data))
+        self.writer.write(data)
+        await self.writer.drain()
+
+    def close(self):
+        """Close once everything queued so far has been written"""
+        self.closing = True
+        self.wake.set()
+
+    def abort(self):
+        self.closing = True
+        self.queue.clear()
+        self.queued_bytes = 0
+        self.writer.transport.abort()
+
+def generate_initial_world(name, directory, size):
+    """Creates world.rgn in `directory`: converts a legacy world.rle, or starts a terrain world if there is none."""
+    world_file = os.path.join(directory, WORLD_FILE)
+    if os.path.exists(world_file): return
+    legacy_file = os.path.join(directory, LEGACY_WORLD_FILE)
+    if os.path.exists(legacy_file):
+        print(f"[SERVER] Converting {legacy_file} to region format...")
+        region.convert_rle(legacy_file, world_file, size)
+        print(f"[SERVER] Converted! ({legacy_file} can be deleted)")
+        return
+    seed = WORLD_SEED if WORLD_SEED is not None else random.getrandbits(63)
+    print(f"[SERVER] Creating a new world {name} (seed {seed})...")
+    # Regions are generated the first time they are read, see terrain.py
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = world_file + ".tmp"
+    new_world = region.RegionFile.create(tmp_path, size, seed=seed)
+    new_world.f.close()
+    os.replace(tmp_path, world_file)
+    print("[SERVER] World created!")
+
+class Level:
+    """One hosted world and everything scoped to it: the region file, pending
+    changes and journal, block history, backups, the shared level stream and
+    the interest grid of the players in it.
+
+    Opening and close() block on disk, so they run off the event loop; the
+    grid and `clients` are only touched from the event loop."""
+    def __init__(self, name, directory, size=None):
+        self.name = name
+        self.dir = directory
+        self.world_file = os.path.join(directory, WORLD_FILE)
+        self.block_logs = pending.PendingChanges()  # (index, block) not yet in the world file
+        self.logs_lock = metrics.TimedLock(lock_wait_seconds, "logs_lock")
+        self.save_lock = metrics.TimedLock(lock_wait_seconds, "save_lock")
+        self.backup_lock = threading.Lock()  # a backup still reads the file after save_lock
+        self.closed = False
+        self.level_cache = LevelCache(self)
+        self.block_ticks = ticks.Scheduler()
+        self.fluid_reach = {}  # index -> how much further the flowing fluid there may spread, if less than FLUIDS' reach
+
+        self.clients = {}  # Connection -> (name, player_id) of the players in this level
+        self.moved_players = set()
+        self.player_cells = {}  # player_id -> grid cell of sent_poses[player_id]
+        self.cell_players = collections.defaultdict(set)  # grid cell -> player_ids in it
+        self.cell_watchers = collections.defaultdict(set)  # grid cell -> Connections with it in view
+        # Changes kept for clients that bring a cell into view later are stamped with the
+        # broadcast that sent them (not the level generation: a tick or rollback changes
+        # blocks off the loop before its broadcast, and a baseline must not cover those)
+        self.broadcast_seq = 0
+        self.cell_changes = collections.defaultdict(dict)  # grid cell -> {index: (broadcast_seq, block)}, replayed on entering view
+        self.cell_regions = collections.defaultdict(dict)  # grid cell -> {region origin: broadcast_seq}, resent whole
+        self.dirty_cells = set()  # cells a player entered, left or moved in since the last tick
+
+        generate_initial_world(name, directory, size or (X, Y, Z))
+        self.world = region.RegionFile(self.world_file)
+        self.X, self.Y, self.Z = self.world.dims()
+        if size is not None and self.world.dims() != tuple(size):
+            raise ValueError(f"{self.world_file} is {self.X}x{self.Y}x{self.Z}, expected {'x'.join(map(str, size))}")
+        self.region_cache = region.RegionCache(self.world)
+
+        # Replay the journal over the world: anything not yet compacted becomes pending again
+        self.block_journal = journal.Journal(os.path.join(directory, JOURNAL_FILE))
+        replayed = self.block_journal.replay()
+        with self.logs_lock:
+            self.block_logs.update(replayed)
+        if replayed:
+            print(f"[SERVER] Replayed {len(replayed)} journaled block changes into {name}")
+        if self.block_journal.has_rotated():
+            print("[SERVER] Finishing an interrupted compaction...")
+            self.save()
+        self.block_journal.start()
+        self.block_history = history.History(self.world, os.path.join(directory, HISTORY_DIR))
+        self.block_history.start()
+        self.backup_store = backup.BackupStore(os.path.join(directory, BACKUP_DIR))
+        self.level_cache.start()
+
+    def close(self):
+        """Save everything and release the files (the level must be empty)"""
+        self.level_cache.stop()
+        self.block_ticks.clear()
+        with self.backup_lock:
+            self.save()
+            with self.save_lock:
+                self.closed = True  # a save() still holding this level finds it closed
+            self.block_history.close()
+            self.block_journal.close()
+            self.world.close()
+
+    def memory_bytes(self):
+        """Rough size of what the level keeps in memory"""
+        snapshot = self.level_cache.snapshot
+        streams = sum(map(len, (snapshot.packets, snapshot.fast_packets))) if snapshot else 0
+        regions = len(self.region_cache.regions) * self.world.region_volume
+        cells = sum(map(len, self.cell_changes.values())) + sum(map(len, self.cell_regions.values()))
+        return (streams + regions + self.block_logs.nbytes() + self.block_history.hot.nbytes
+                + (cells + len(self.fluid_reach)) * pending.HOT_ENTRY_BYTES)
+
+    def index(self, x, y, z):
+        return (y * self.Z + z) * self.X + x
+
+    def contains(self, x, y, z):
+        return 0 <= x < self.X and 0 <= y < self.Y and 0 <= z < self.Z
+
+    def xyz(self, idx):
+        return idx % self.X, idx // (self.X * self.Z), (idx // self.X) % self.Z
+
+    def spawn_point(self):
+        """Player position (in 1/32 blocks) to spawn at, just above the ground"""
+        # Classic protocol uses signed shorts (-32768 to 32767)
+        # Along an axis too long for that, spawn near the origin instead of the center
+        x, z = (size // 2 if (size // 2) * 32 <= 32767 else 512 for size in (self.X, self.Z))
+        return x * 32, (self.surface_height(x, z) + 2) * 32, z * 32
+
+    def current_block(self, idx):
+        """Block at world index `idx`. Call with logs_lock held."""
+        block = self.block_logs.get(idx)
+        return block if block is not None else self.region_cache.get_block(*self.xyz(idx))
+
+    def prefetch(self, indices):
+        """Decode the regions holding `indices` into region_cache, so that reading
+        them later under logs_lock is a cache hit"""
+        rid, _ = self.world.locate(np.asarray(indices, dtype=np.int64))
+        for r in np.unique(rid).tolist():
+            self.region_cache.region(r)
+
+    def set_block(self, idx, block, player):
+        """Record an accepted block change: history, pending logs, level snapshot,
+        journal, and the block updates it sets off"""
+        self.prefetch([idx] + self.neighbours(idx) if PHYSICS else [idx])
+        with self.logs_lock:
+            generation = self._set_block_locked(idx, block, player)
+            if PHYSICS:
+                self.schedule_updates(idx, player)
+            return generation
+
+    def _set_block_locked(self, idx, block, player):
+        self.fluid_reach.pop(idx, None)  # whatever replaced the flowing fluid (a placed fluid is a source)
+        old = self.current_block(idx)
+        if old != block:
+            self.block_history.record(player, idx, old, block)
+        self.block_logs.set(idx, block)
+        self.level_cache.record(idx, block)
+        self.block_journal.append(idx, block)
+        if self.block_logs.nbytes() > PENDING_MAX_BYTES:
+            save_requested.set()
+        return self.level_cache.generation
+
+    def neighbours(self, idx):
+        """Indices of the blocks sharing a face with `idx`"""
+        x, y, z = self.xyz(idx)
+        X, XZ = self.X, self.X * self.Z
+        steps = ((-1, x > 0), (1, x < self.X - 1), (-X, z > 0), (X, z < self.Z - 1), (-XZ, y > 0), (XZ, y < self.Y - 1))
+        return [idx + step for step, inside in steps if inside]
+
+    def schedule_updates(self, idx, cause):
+        """Schedule `idx` and its neighbours for whichever of them has a rule in
+        BLOCK_RULES. Call with logs_lock held."""
+        for i in [idx] + self.neighbours(idx):
+            rule = BLOCK_RULES.get(self.current_block(i))
+            if rule is not None:
+                self.block_ticks.schedule(i, rule[0], cause)
+
+    def run_ticks(self, budget):
+        """Run up to `budget` due block updates -> indices they changed"""
+        changed, done = set(), 0
+        with profiler.span("block_tick"):
+            while done < budget:
+                due = self.block_ticks.pop(min(TICK_BATCH, budget - done))
+                if not due: break
+                done += len(due)
+                self.prefetch([i for idx, cause in due for i in [idx] + self.neighbours(idx)])
+                with self.logs_lock:
+                    for idx, cause in due:
+                        block = self.current_block(idx)
+                        if block not in FLUIDS or block != FLUIDS[block][0]:
+                            self.fluid_reach.pop(idx, None)  # no longer flowing fluid
+                        rule = BLOCK_RULES.get(block)
+                        if rule is not None:
+                            changed.update(rule[1](self, idx, block, cause))
+        block_updates.inc(done)
+        return list(changed)
+
+    def get_block(self, x, y, z):
+        """Current block at (x, y, z): a pending change if there is one, else the world file"""
+        if not self.contains(x, y, z):
+            raise ValueError(f"({x}, {y}, {z}) is outside the world")
+        # Pending first: a save only drops changes after they are in the file
+        with self.logs_lock:
+            block = self.block_logs.get(self.index(x, y, z))
+        if block is not None:
+            return block
+        return self.region_cache.get_block(x, y, z)
+
+    def surface_height(self, x, z):
+        """y of the first air block above the highest non-air block of column (x, z)"""
+        solid = np.flatnonzero(self.get_box(x, 0, z, x + 1, self.Y, z + 1).reshape(-1))
+        return int(solid[-1]) + 1 if len(solid) else 0
+
+    def get_box(self, x0, y0, z0, x1, y1, z1):
+        """Current blocks in [x0, x1) x [y0, y1) x [z0, z1) as a (y, z, x) uint8 array"""
+        X, Y, Z = self.X, self.Y, self.Z
+        if not (0 <= x0 < x1 <= X and 0 <= y0 < y1 <= Y and 0 <= z0 < z1 <= Z):
+            raise ValueError(f"Box ({x0}, {y0}, {z0})-({x1}, {y1}, {z1}) is outside the world")
+        with self.logs_lock:
+            idx, vals = self.block_logs.between((y0 * Z + z0) * X + x0, ((y1 - 1) * Z + z1 - 1) * X + x1)
+        box = self.region_cache.get_box(x0, y0, z0, x1, y1, z1)
+        if len(idx):
+            x, y, z = self.xyz(idx)
+            inside = (x >= x0) & (x < x1) & (z >= z0) & (z < z1)  # y is inside by construction
+            box[y[inside] - y0, z[inside] - z0, x[inside] - x0] = vals[inside]
+        return box
+
+    def save(self):
+        """Compacts the journal: writes pending block_logs into the region file, touching only dirty regions"""
+        world, block_journal = self.world, self.block_journal
+        with self.save_lock, profiler.span("save"):
+            if self.closed:  # its files may already belong to a reopened Level
+                return
+            with self.logs_lock:
+                changes_copy = self.block_logs.snapshot()
+                # The rotated journal holds exactly the changes in changes_copy
+                block_journal.rotate()
+            if not len(changes_copy[0]):
+                block_journal.drop_rotated()
+                return
+
+            print(f"[SERVER] Saving {len(changes_copy[0])} changes to {self.name}...")
+            started = time.time()
+            if SAVE_WORKERS > 1 and world.count_dirty(changes_copy) >= PARALLEL_SAVE_REGIONS:
+                # Big save: re-encode every region across a process pool into a fresh file
+                dirty = world.rewrite(changes_copy, SAVE_WORKERS)
+                save_bytes.inc(os.path.getsize(self.world_file))
+            else:
+                size_before = os.path.getsize(self.world_file)
+                dirty = world.apply_changes(changes_copy)
+                save_bytes.inc(os.path.getsize(self.world_file) - size_before)  # patched regions are appended
+            save_seconds.observe(time.time() - started)
+            block_journal.drop_rotated()
+            with self.logs_lock:
+                # Only drop entries that were not overwritten while we were saving
+                self.block_logs.discard_saved(changes_copy)
+            print(f"[SERVER] Save complete: {dirty} regions in {time.time() - started:.1f}s")
+
+            if world.garbage_bytes() > max(world.live_bytes(), 16 * 1024 * 1024):
+                print("[SERVER] Compacting world file...")
+                world.compact(SAVE_WORKERS)
+
+    def take_backup(self):
+        """Snapshot the world as of now into its BACKUP_DIR and prune old snapshots -> summary line.
+
+        Holding save_lock for a moment pins a point in time where the region file
+        and the pending changes don't overlap; block placement only waits for the
+        brief logs_lock. Everything slow happens after both are released."""
+        started = time.time()
+        with self.backup_lock:
+            with self.save_lock:
+                with self.logs_lock:
+                    changes = self.block_logs.snapshot()
+                    generation = self.level_cache.generation
+                reader = self.world.snapshot()
+            n, stored, nbytes = self.backup_store.create(reader, changes, generation)
+            dropped = self.backup_store.prune(BACKUP_KEEP)
+        backup_seconds.observe(time.time() - started)
+        return (f"Backup {n} of {self.name}: {stored} new regions ({nbytes // 1024}KB) in "
+                f"{time.time() - started:.1f}s" + (f", pruned {len(dropped)}" if dropped else ""))
+
+    def rollback(self, player, minutes, by):
+        """Undo what `player` changed in the last `minutes` -> (reverted indices, skipped).
+
+        Each block goes back to what it was before the player's first change in
+        the window. Blocks somebody else has changed since are left alone."""
+        t, idx, old, new = self.block_history.changes_by(player, int(time.time() - minutes * 60))
+        if not len(idx):
+            return [], 0
+        order = np.argsort(idx, kind='stable')  # per block, still oldest first
+        idx, old, new = idx[order], old[order], new[order]
+        starts = np.flatnonzero(np.r_[True, idx[1:] != idx[:-1]])
+        ends = np.r_[starts[1:], len(idx)] - 1
+        targets = list(zip(idx[starts].tolist(), old[starts].tolist(), new[ends].tolist()))
+        reverted, skipped = [], 0
+        for start in range(0, len(targets), ROLLBACK_BATCH):
+            batch = targets[start:start + ROLLBACK_BATCH]
+            self.prefetch([i for i, before, latest in batch])
+            with self.logs_lock:
+                for i, before, latest in batch:
+                    current = self.current_block(i)
+                    if current != latest:
+                        skipped += 1
+                    elif current != before:
+                        self._set_block_locked(i, before, f"rollback:{by}")
+                        reverted.append(i)
+        return reverted, skipped
+
+def fall(level, idx, block, cause):
+    """Sand and gravel drop into air or fluid below them, one block per update"""
+    below = idx - level.X * level.Z
+    if below < 0 or level.current_block(below) not in FALL_THROUGH: return ()
+    level._set_block_locked(idx, AIR, cause)
+    level._set_block_locked(below, block, cause)
+    level.schedule_updates(idx, cause)
+    level.schedule_updates(below, cause)
+    return idx, below
+
+def flow(level, idx, block, cause):
+    """Water and lava run down into air, or else out sideways, a block less far
+    from their source each step"""
+    flowing, reach = FLUIDS[block]
+    XZ = level.X * level.Z
+    left = level.fluid_reach.get(idx, reach)
+    if idx >= XZ and level.current_block(idx - XZ) == AIR:
+        targets, left = [idx - XZ], reach  # a falling stream spreads afresh where it lands
+    elif left > 0:
+        targets, left = [i for i in level.neighbours(idx) if abs(i - idx) < XZ and level.current_block(i) == AIR], left - 1
+    else:
+        return ()
+    for i in targets:
+        level._set_block_locked(i, flowing, cause)
+        if left < reach:
+            level.fluid_reach[i] = left
+        level.schedule_updates(i, cause)
+    return targets
+
+# block -> (ticks between a change next to it and its update, rule); a rule runs with
+# logs_lock held and returns the indices it changed
+BLOCK_RULES = {SAND: (1, fall), GRAVEL: (1, fall), WATER: (5, flow), STILL_WATER: (5, flow),
+               LAVA: (30, flow), STILL_LAVA: (30, flow)}
+
+def world_dir(name):
+    return "." if name == DEFAULT_WORLD else os.path.join(WORLDS_DIR, name)
+
+def world_names():
+    """Every level on disk: the default one, then WORLDS_DIR/<name>/ with a world file"""
+    names = [DEFAULT_WORLD]
+    if os.path.isdir(WORLDS_DIR):
+        names += sorted(name for name in os.listdir(WORLDS_DIR) if name != DEFAULT_WORLD and any(
+            os.path.exists(os.path.join(WORLDS_DIR, name, f)) for f in (WORLD_FILE, LEGACY_WORLD_FILE)))
+    return names
+
+def open_level(name):
+    """worlds.WorldManager callback: load level `name` from disk"""
+    return Level(name, world_dir(name), (X, Y, Z) if name == DEFAULT_WORLD else None)
+
+def loaded_levels():
+    return level_manager.loaded() if level_manager else []
+
+class LevelSnapshot:
+    """Immutable pre-built 0x03 packet streams for one world generation:
+    gzip for vanilla clients, raw deflate for FastMap ones"""
+    def __init__(self, generation, packets, fast_packets):
+        self.generation = generation
+        self.packets = packets
+        self.fast_packets = fast_packets
+
+class LevelCache:
+    """Builds the compressed level streams once and serves the same blobs to every join.
+
+    Every accepted block change bumps `generation` (under logs_lock) and is kept in
+    `recent` so a joiner holding an older snapshot can be caught up with 0x06 packets.
+    """
+    def __init__(self, level):
+        self.level = level
+        self.generation = 0
+        self.snapshot = None
+        self.recent = collections.deque()  # (generation, idx, block)
+        self.in_use = collections.Counter()  # snapshot generation -> joins streaming it
+        self.lock = threading.Lock()
+        self.dirty = threading.Event()
+        self.ready = threading.Event()
+        self.stopped = False
+
+    def start(self):
+        self.dirty.set()
+        threading.Thread(target=self._builder, daemon=True).start()
+
+    def stop(self):
+        self.stopped = True
+        self.dirty.set()
+
+    def record(self, idx, block):
+        """Call with logs_lock held, right after writing block_logs"""
+        self.generation += 1
+        self.recent.append((self.generation, idx, block))
+        self.dirty.set()
+
+    def acquire(self):
+        self.ready.wait()
+        with self.lock:
+            snapshot = self.snapshot
+            self.in_use[snapshot.generation] += 1
+        return snapshot
+
+    def release(self, snapshot):
+        with self.lock:
+            self.in_use[snapshot.generation] -= 1
+            if self.in_use[snapshot.generation] <= 0:
+                del self.in_use[snapshot.generation]
+        self._prune()
+
+    def changes_since(self, generation):
+        """Latest block per index changed after `generation`. Call with logs_lock held."""
+        return {idx: block for gen, idx, block in self.recent if gen > generation}
+
+    def _prune(self):
+        # Keep every change some in-flight join may still need to catch up on
+        with self.level.logs_lock, self.lock:
+            if self.snapshot is None: return
+            oldest = min([self.snapshot.generation, *self.in_use])
+            while self.recent and self.recent[0][0] <= oldest:
+                self.recent.popleft()
+
+    def _builder(self):
+        while True:
+            self.dirty.wait()
+            if self.snapshot is not None:
+                time.sleep(LEVEL_CACHE_DEBOUNCE)  # batch up a burst of edits
+            if self.stopped: return
+            self.dirty.clear()
+            try:
+                with profiler.span("level_build"):
+                    self._rebuild()
+            except Exception as e:
+                print(f"[ERROR] Level snapshot build failed: {e}")
+                time.sleep(LEVEL_CACHE_DEBOUNCE)
+                self.dirty.set()
+
+    def _rebuild(self):
+        started = time.time()
+        # Copy the logs BEFORE freezing the region table: a save that lands in
+        # between has already written these changes into the file.
+        with self.level.logs_lock:
+            changes = self.level.block_logs.snapshot()
+            generation = self.generation
+        packets, fast_packets = build_level_packets(self.level.world.snapshot(), changes)
+        with self.lock:
+            self.snapshot = LevelSnapshot(generation, packets, fast_packets)
+        self.ready.set()
+        self._prune()
+        print(f"[SERVER] Level snapshot #{generation} of {self.level.name} ready "
+              f"({len(packets):,} bytes, {time.time() - started:.1f}s)")
+
+def build_level_packets(reader, changes):
+    """Compress the world (with `changes` applied) once, as 0x03 Level Data Chunk
+    packets of both the gzipped, size-prefixed stream and the FastMap raw deflate one"""
+    volume = reader.X * reader.Y * reader.Z
+    deflate = zlib.compressobj(6, zlib.DEFLATED, -15)
+    size = struct.pack('>I', volume)
+    crc = zlib.crc32(size)
+    # A full flush ends the size prefix byte-aligned with the history reset, so the
+    # rest is a complete raw deflate stream by itself: FastMap gets it as it is,
+    # vanilla clients get it behind the prefix inside a gzip member
+    head = deflate.compress(size) + deflate.flush(zlib.Z_FULL_FLUSH)
+    body = []
+    # Decode one layer of regions at a time and feed zlib whole buffers
+    for start, blocks in reader.iter_slabs(changes):
+        body.append(deflate.compress(memoryview(blocks)))
+        crc = zlib.crc32(blocks, crc)
+    body.append(deflate.flush())
+    body = b''.join(body)
+    gz = GZIP_HEADER + head + body + struct.pack('<II', crc, (volume + 4) & 0xffffffff)
+    return level_chunks(gz), level_chunks(body)
+
+def level_chunks(data):
+    """Split compressed level data into 0x03 Level Data Chunk packets"""
+    total = len(data)
+    packets = bytearray()
+    for i in range(0, total, 1024):
+        chunk = data[i:i+1024]
+        percent = min(100, (i + len(chunk)) * 100 // total)
+        # Packet 0x03: [ID][Length:short][Data*1024][Percent]
+        packets += struct.pack('>BH', 0x03, len(chunk))
+        packets += chunk.ljust(1024, b'\x00')
+        packets += struct.pack('B', percent)
+    return bytes(packets)
+
+def block_packets(conn, changes):
+    """Packets for a list of (index, block) in the client's level: BulkBlockUpdate [0x26] for clients
+    that support it when there are enough of them, 0x06 Set Block otherwise"""
+    bulk = "BulkBlockUpdate" in conn.extensions
+    out = []
+    for start in range(0, len(changes), 256):
+        chunk = changes[start:start + 256]
+        if bulk and len(chunk) >= BULK_MIN_CHANGES:
+            indices = np.zeros(256, dtype='>i4')
+            blocks = np.zeros(256, dtype=np.uint8)
+            indices[:len(chunk)], blocks[:len(chunk)] = zip(*chunk)
+            out.append(struct.pack('BB', 0x26, len(chunk) - 1) + indices.tobytes() + blocks.tobytes())
+        else:
+            out += [struct.pack('>BhhhB', 0x06, *conn.level.xyz(idx), block) for idx, block in chunk]
+    return b''.join(out)
 
 def auto_save_task():
     while True:
-        time.sleep(300) 
-        if not block_logs: continue
-        
-        print(f"[SERVER] Fast-saving {len(block_logs)} changes in 50MB chunks...")
-        try:
-            with logs_lock:
-                changes_copy = dict(block_logs)
-            
-            CHUNK_SIZE = 50_000_000 
-            new_rle_path = "world.rle.tmp"
-            
-            with open("world.rle", "rb") as f_in, open(new_rle_path, "wb") as f_out:
-                # Read all existing RLE metadata at once (this is small)
-                rle_data = f_in.read()
-                counts = np.frombuffer(rle_data[0::2], dtype=np.uint8)
-                vals = np.frombuffer(rle_data[1::2], dtype=np.uint8)
-                
-                # Reconstruct only the indices we need to find chunk boundaries
-                # Note: We don't reconstruct the world, just the "cumulative" counts
-                cum_counts = np.cumsum(counts, dtype=np.int64)
-                
-                for start in range(0, X*Y*Z, CHUNK_SIZE):
-                    end = min(start + CHUNK_SIZE, X*Y*Z)
-                    
-                    # Find which RLE pairs belong to this 100MB chunk
-                    # This is the "secret sauce" for speed
-                    idx_start = np.searchsorted(cum_counts, start, side='right')
-                    idx_end = np.searchsorted(cum_counts, end, side='left')
-                    
-                    # Materialize just THIS 100MB chunk
-                    chunk_counts = counts[idx_start:idx_end+1].copy()
-                    chunk_vals = vals[idx_start:idx_end+1].copy()
-                    
-                    # Adjust the first and last run if they overlap chunk boundaries
-                    chunk_counts[0] = cum_counts[idx_start] - start
-                    chunk_counts[-1] = end - (cum_counts[idx_end-1] if idx_end > 0 else 0)
-                    
-                    # Expand, patch, and re-compress the chunk using NumPy
-                    temp_chunk = np.repeat(chunk_vals, chunk_counts)
-                    
-                    # Patch logs
-                    for idx in list(changes_copy.keys()):
-                        if start <= idx < end:
-                            temp_chunk[idx - start] = changes_copy.pop(idx)
-                    
-                    # Fast RLE compression for the chunk
-                    if len(temp_chunk) > 0:
-                        diffs = np.concatenate(([True], temp_chunk[1:] != temp_chunk[:-1]))
-                        points = np.where(diffs)[0]
-                        run_vals = temp_chunk[points]
-                        run_lens = np.diff(np.append(points, len(temp_chunk)))
-                        
-                        for c, v in zip(run_lens, run_vals):
-                            while c > 255:
-                                f_out.write(bytes([255, int(v)]))
-                                c -= 255
-                            f_out.write(bytes([int(c), int(v)]))
-
-            os.replace(new_rle_path, "world.rle")
-            with logs_lock:
-                for key in (set(block_logs.keys()) - set(changes_copy.keys())):
-                    block_logs.pop(key, None)
-            print("[SERVER] Fast-save complete.")
-        except Exception as e:
-            print(f"[ERROR] Save failed: {e}")
+        # Woken early when a level's block_logs pass PENDING_MAX_BYTES
+        save_requested.wait(JOURNAL_CHECK_INTERVAL)
+        save_requested.clear()
+        for level in loaded_levels():
+            try:
+                if level.closed:  # unloaded since loaded_levels()
+                    continue
+                if level.block_logs.nbytes() > PENDING_MAX_BYTES:
+                    print(f"[SERVER] Pending changes in {level.name} over {PENDING_MAX_BYTES >> 20}MB, saving early")
+                elif level.block_journal.size() < JOURNAL_COMPACT_BYTES:
+                    continue
+                level.save()
+            except Exception as e:
+                print(f"[ERROR] Save of {level.name} failed: {e}")
+
+async def run_rollback(level, player, minutes, conn, by):
+    started = time.time()
+    try:
+        reverted, skipped = await asyncio.get_running_loop().run_in_executor(None, level.rollback, player, minutes, by)
+    except Exception as e:
+        print(f"[ERROR] Rollback failed: {e}")
+        send_message(conn, f"&cRollback failed: {e}")
+        return
+    broadcast_blocks(level, reverted)
+    line = f"Rolled back {len(reverted)} blocks by {player} ({minutes:g} min, {(time.time() - started) * 1000:.0f}ms)"
+    print(f"[ROLLBACK] {by}: {line}, {skipped} skipped")
+    send_message(conn, "&e" + line)
+    if skipped:
+        send_message(conn, f"&e{skipped} blocks changed by others since were left alone")
+
+def format_age(seconds):
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size:
+            return f"{seconds // size}{unit}"
+    return f"{seconds}s"
 
-def handle_command(player_name: str, message: str, client_socket):
+def auto_backup_task():
+    while True:
+        time.sleep(BACKUP_INTERVAL)
+        for level in loaded_levels():
+            if level.closed: continue
+            try:
+                print(f"[BACKUP] {level.take_backup()}")
+            except Exception as e:
+                print(f"[ERROR] Backup of {level.name} failed: {e}")
+
+async def run_backup(level, conn):
+    try:
+        line = await asyncio.get_running_loop().run_in_executor(None, level.take_backup)
+    except Exception as e:
+        print(f"[ERROR] Backup failed: {e}")
+        send_message(conn, f"&cBackup failed: {e}")
+        return
+    print(f"[BACKUP] {line}")
+    send_message(conn, "&e" + line)
+
+async def handle_command(player_name: str, message: str, conn):
     args = message.split()
     command = args[0].lower()
+    level = conn.level
     if command == "/kick":
         if player_name not in admin_list:
-            send_message(client_socket, "&cYou do not have permission to use this command!")
+            send_message(conn, "&cYou do not have permission to use this command!")
             return
         if len(args) < 2:
-            send_message(client_socket, "&cUsage: /kick <player> [reason]")
+            send_message(conn, "&cUsage: /kick <player> [reason]")
             return
         target = args[1]
         reason = ' '.join(args[2:]) if len(args) > 2 else "Kicked by operator"
-        target_socket = None
-        with clients_lock:
-            for sock, (name, pid) in clients.items():
-                if name.lower() == target.lower():
-                    target_socket = sock
-                    break
-
-        if target_socket:
+        target_conn = None
+        for other, (name, pid) in clients.items():
+            if name.lower() == target.lower():
+                target_conn = other
+                break
+
+        if target_conn:
             print(f"[KICK] {player_name} kicked {target}: {reason}")
             packet = struct.pack('>BB', 0x0d, 0xff)
             packet += pad_string(f"&e{target} was kicked: {reason}")
             broadcast(packet)
-            kick_player(target_socket, reason)
+            kick_player(target_conn, reason)
         else:
-            send_message(client_socket, f"&cPlayer '{target}' not found")
+            send_message(conn, f"&cPlayer '{target}' not found")
+    elif command == "/queues":
+        if player_name not in admin_list:
+            send_message(conn, "&cYou do not have permission to use this command!")
+            return
+        deepest = sorted(clients.items(), key=lambda item: item[0].queued_bytes, reverse=True)[:5]
+        send_message(conn, f"&eSend queues ({len(clients)} clients):")
+        for other, (name, pid) in deepest:
+            send_message(conn, f"&e{name}: {other.queued_bytes // 1024}KB queued, {other.dropped} move ticks skipped")
+    elif command == "/stats":
+        if player_name not in admin_list:
+            send_message(conn, "&cYou do not have permission to use this command!")
+            return
+        for line in stats_lines():
+            send_message(conn, line)
+    elif command == "/profile":
+        if player_name not in admin_list:
+            send_message(conn, "&cYou do not have permission to use this command!")
+            return
+        try:
+            seconds = float(args[1])
+        except (IndexError, ValueError):
+            seconds = 0
+        if not 0 < seconds <= PROFILE_MAX_SECONDS:
+            send_message(conn, f"&cUsage: /profile <seconds> (up to {PROFILE_MAX_SECONDS})")
+            return
+        if profiler.running():
+            send_message(conn, "&cA profile is already running")
+            return
+        send_message(conn, f"&eProfiling for {seconds:g}s...")
+        # In the background, so this client's packets keep being handled meanwhile
+        asyncio.create_task(run_profile(seconds, conn))
+    elif command == "/backup":
+        if player_name not in admin_list:
+            send_message(conn, "&cYou do not have permission to use this command!")
+            return
+        if len(args) > 1 and args[1].lower() == "list":
+            snapshots = level.backup_store.snapshots()
+            send_message(conn, f"&e{len(snapshots)} snapshots of {level.name}")
+            for n in snapshots[-5:]:
+                info = level.backup_store.load(n)[0]
+                send_message(conn, f"&e{n}: {time.strftime('%Y-%m-%d %H:%M', time.localtime(info['created']))}, "
+                                   f"generation {info['generation']}")
+            return
+        send_message(conn, "&eTaking a backup...")
+        asyncio.create_task(run_backup(level, conn))
+    elif command == "/rollback":
+        if player_name not in admin_list:
+            send_message(conn, "&cYou do not have permission to use this command!")
+            return
+        try:
+            target, minutes = args[1], float(args[2])
+        except (IndexError, ValueError):
+            minutes = 0
+        if minutes <= 0:
+            send_message(conn, "&cUsage: /rollback <player> <minutes>")
+            return
+        send_message(conn, f"&eRolling back {target}...")
+        asyncio.create_task(run_rollback(level, target, minutes, conn, player_name))
+    elif command == "/blame":
+        if player_name not in admin_list:
+            send_message(conn, "&cYou do not have permission to use this command!")
+            return
+        try:
+            x, y, z = (int(a) for a in args[1:4])
+            if not level.contains(x, y, z): raise ValueError
+        except ValueError:
+            send_message(conn, f"&cUsage: /blame <x> <y> <z> (inside {level.X}x{level.Y}x{level.Z})")
+            return
+        changes = level.block_history.blame(level.index(x, y, z))
+        if not changes:
+            send_message(conn, f"&eNo recorded changes at {x} {y} {z}")
+        now = int(time.time())
+        for t, name, old, new in changes:
+            send_message(conn, f"&e{format_age(now - t)} ago {name}: {old} -> {new}")
+    elif command == "/getblock":
+        try:
+            x, y, z = (int(a) for a in args[1:4])
+            block = level.get_block(x, y, z)
+        except ValueError:
+            send_message(conn, f"&cUsage: /getblock <x> <y> <z> (inside {level.X}x{level.Y}x{level.Z})")
+            return
+        send_message(conn, f"&eBlock at {x} {y} {z}: {block}")
+    elif command == "/worlds":
+        loaded = {level.name: level for level in loaded_levels()}
+        names = world_names()
+        send_message(conn, f"&e{len(names)} worlds, {len(loaded)} loaded (you are in {level.name}):")
+        for name in names:
+            state = f"{len(loaded[name].clients)} players" if name in loaded else "not loaded"
+            send_message(conn, f"&e  {name}: {state}")
+    elif command == "/goto":
+        if len(args) < 2:
+            send_message(conn, "&cUsage: /goto <world> (see /worlds)")
+            return
+        name = args[1]
+        if name == level.name:
+            send_message(conn, f"&eYou are already in {name}")
+            return
+        if name not in world_names():
+            send_message(conn, f"&cNo world named '{name}' (see /worlds)")
+            return
+        await change_level(conn, name)
+    elif command == "/newworld":
+        if player_name not in admin_list:
+            send_message(conn, "&cYou do not have permission to use this command!")
+            return
+        try:
+            name, size = args[1], tuple(int(a) for a in args[2:5])
+            if len(size) != 3 or not all(16 <= d <= 4096 for d in size) or np.prod(size) >= 2 ** 31: raise ValueError
+        except (IndexError, ValueError):
+            send_message(conn, "&cUsage: /newworld <name> <x> <y> <z>")
+            return
+        if not set(name) <= WORLD_NAME_CHARS or len(name) > 32:
+            send_message(conn, "&cWorld names are up to 32 letters, digits, _ and -")
+            return
+        if name in world_names():
+            send_message(conn, f"&cThere already is a world named '{name}'")
+            return
+        await asyncio.get_running_loop().run_in_executor(None, generate_initial_world, name, world_dir(name), size)
+        send_message(conn, f"&eCreated {name} ({'x'.join(map(str, size))}), /goto {name} to visit it")
     elif command == "/register":
         if len(args) < 2:
-            send_message(client_socket, "&cUsage: /register <password>")
+            send_message(conn, "&cUsage: /register <password>")
             return
-        users = load_users()
-        if player_name.lower() in users:
-            send_message(client_socket, "&cYou are already registered! Use /login.")
+        # Hashing runs on the store's worker pool, the file is written behind
+        if not await account_store.register(player_name, args[1]):
+            send_message(conn, "&cYou are already registered! Use /login.")
             return
-        save_user(player_name, hash_password(args[1]))
-        authenticated_clients.add(client_socket)
-        send_message(client_socket, "&aRegistered and logged in successfully!")
+        authenticated_clients.add(conn)
+        send_message(conn, "&aRegistered and logged in successfully!")
 
     elif command == "/login":
         if len(args) < 2:
-            send_message(client_socket, "&cUsage: /login <password>")
+            send_message(conn, "&cUsage: /login <password>")
             return
-        users = load_users()
-        pw_hash = hash_password(args[1])
-        if users.get(player_name.lower()) == pw_hash:
-            authenticated_clients.add(client_socket)
-            send_message(client_socket, "&aLogged in! You can now move and speak.")
+        if await account_store.verify(player_name, args[1]):
+            authenticated_clients.add(conn)
+            send_message(conn, "&aLogged in! You can now move and speak.")
         else:
-            send_message(client_socket, "&cInvalid password!")
+            send_message(conn, "&cInvalid password!")
     else:
-        send_message("&cCommand not found!")
+        send_message(conn, "&cCommand not found!")
         
 
-def send_message(client_socket, message):
-    """Send a message to a specific client"""
+def format_latency(histogram, value=None):
+    """'p50/p99 ms' from a metrics.Histogram's buckets"""
+    if not histogram.count(value): return "-"
+    return f"{histogram.quantile(0.5, value) * 1000:g}/{histogram.quantile(0.99, value) * 1000:g}ms"
+
+def stats_lines():
+    """Short summary of the runtime metrics for /stats"""
+    mb = 1024 * 1024
+    packets = ", ".join(f"{t} {n}" for t, n in sorted(packets_in.values.items()))
+    levels = loaded_levels()
+    return [
+        f"&eStats: {len(clients)} players",
+        f"&ePackets in: {packets or 'none'}",
+        f"&eNet: {bytes_in.get() // 1024}KB in, {bytes_out.get() // 1024}KB out",
+        f"&eWorlds: {len(levels)} loaded, {sum(level.memory_bytes() for level in levels) / mb:.0f}MB"
+        f" of {level_manager.budget / mb:.0f}MB",
+        f"&ePending: {sum(len(level.block_logs) for level in levels)} changes, "
+        f"{sum(level.block_logs.nbytes() for level in levels) // 1024}KB",
+        f"&eFan-out p50/p99: block {format_latency(fanout_seconds, 'block')}",
+        f"&e  chat {format_latency(fanout_seconds, 'chat')}, tick {format_latency(fanout_seconds, 'move_tick')}",
+        f"&eLock wait: logs {format_latency(lock_wait_seconds, 'logs_lock')}",
+        f"&eJoin stream: {format_latency(join_level_seconds)}",
+        f"&eBlock ticks: {format_latency(tick_seconds)}, {block_updates.get()} updates, "
+        f"{sum(len(level.block_ticks) for level in levels)} pending",
+        f"&eSaves: {save_seconds.count()}, {format_latency(save_seconds)}, {save_bytes.get() / mb:.1f}MB",
+    ]
+
+async def run_profile(seconds, conn=None):
+    """Sample every thread for `seconds`; the summary goes to the console and `conn`"""
+    def report(line):
+        print(f"[PROFILE] {line}")
+        if conn is not None:
+            send_message(conn, "&e" + line)
     try:
-        packet = struct.pack('>BB', 0x0d, 0xff)
-        packet += pad_string(message)
-        client_socket.sendall(packet)
-    except:
-        pass
+        await profiler.run(seconds, report)
+    except Exception as e:
+        print(f"[ERROR] Profile failed: {e}")
+
+def send_message(conn, message):
+    """Send a message to a specific client"""
+    packet = struct.pack('>BB', 0x0d, 0xff)
+    packet += pad_string(message)
+    conn.send(packet)
 
-def teleport_player(client_socket, x, y, z, yaw=0, pitch=0):
+def teleport_player(conn, x, y, z, yaw=0, pitch=0):
     """Teleport a player to specific coordinates"""
-    try:
-        # [0x08][player_id:byte][x:short][y:short][z:short][yaw:byte][pitch:byte]
-        packet = struct.pack('>BbhhhBB', 0x08, -1, x, y, z, yaw, pitch)
-        client_socket.sendall(packet)
-    except:
-        pass
+    # [0x08][player_id:byte][x:short][y:short][z:short][yaw:byte][pitch:byte]
+    packet = struct.pack('>BbhhhBB', 0x08, -1, x, y, z, yaw, pitch)
+    conn.send(packet)
 
-def kick_player(target_socket, reason):
+def kick_player(conn, reason):
     """Kick a player from the server"""
-    try:
-        # [0x0e][reason*64]
-        packet = struct.pack('>B', 0x0e)
-        packet += pad_string("Kicked for reason: " + reason)
-        target_socket.sendall(packet)
-        target_socket.close()
-    except:
-        pass
-
-def handle_client(client_socket, address):
-    global next_player_id
+    # [0x0e][reason*64]
+    packet = struct.pack('>B', 0x0e)
+    packet += pad_string("Kicked for reason: " + reason)
+    conn.send(packet)
+    conn.close()  # flushes the kick packet first; the read loop then sees EOF
+
+async def negotiate_cpe(conn, player_name):
+    """ExtInfo/ExtEntry exchange: keep the extensions both sides support in conn.extensions"""
+    packet = struct.pack('B', 0x10) + pad_string(CPE_APP_NAME) + struct.pack('>h', len(CPE_EXTENSIONS))
+    for name, version in CPE_EXTENSIONS.items():
+        packet += struct.pack('B', 0x11) + pad_string(name) + struct.pack('>i', version)
+    conn.send(packet)
+
+    packet_id, fields = await conn.packets.read_packet()
+    if packet_id != 0x10:
+        raise ConnectionError(f"Expected ExtInfo, got 0x{packet_id:02x}")
+    app_name, count = fields
+    for _ in range(count):
+        packet_id, fields = await conn.packets.read_packet()
+        if packet_id != 0x11:
+            raise ConnectionError(f"Expected ExtEntry, got 0x{packet_id:02x}")
+        name, version = fields
+        name = name.decode('ascii').strip()
+        if CPE_EXTENSIONS.get(name) == version:
+            conn.extensions.add(name)
+    if "BulkBlockUpdate" in conn.extensions:
+        conn.block_batch = {}
+    print(f"[CPE] {player_name} ({app_name.decode('ascii').strip()}): {', '.join(sorted(conn.extensions)) or 'no shared extensions'}")
+
+async def handle_client(reader, writer):
+    conn = Connection(reader, writer)
     player_id = -1
     player_name = "Unknown"
     
     try:
-        print(f"[CONNECT] Connection from {address}")
+        print(f"[CONNECT] Connection from {conn.address}")
         
         # --- 1. Handshake & Identification ---
-        handshake_id = recv_exact(client_socket, 1)[0]
-        if handshake_id != 0x00:
-            print(f"[ERROR] Bad handshake: {handshake_id}")
-            return
-        
-        protocol_version = recv_exact(client_socket, 1)[0]
-        player_name = recv_exact(client_socket, 64).decode('ascii').strip()
-        verify_key = recv_exact(client_socket, 64)
-        unused = recv_exact(client_socket, 1)
-        
-        print(f"[LOGIN] {player_name} (Protocol {protocol_version})")
+        with profiler.span("handshake"):
+            handshake_id, fields = await conn.packets.read_packet()
+            if handshake_id != 0x00:
+                print(f"[ERROR] Bad handshake: {handshake_id}")
+                return
+
+            protocol_version, player_name, verify_key, unused = fields
+            player_name = player_name.decode('ascii').strip()
+
+            print(f"[LOGIN] {player_name} (Protocol {protocol_version})")
+            if unused == CPE_MAGIC:
+                await negotiate_cpe(conn, player_name)
         
-        # Assign player ID
-        with clients_lock:
-            player_id = next_player_id
-            next_player_id = (next_player_id + 1) % 128
-            if next_player_id == 255:  # Skip 255 (reserved)
-                next_player_id = 0
-            clients[client_socket] = (player_name, player_id)
+        # Assign player ID (the client is only added to `clients` once it has the level)
+        if not free_player_ids:
+            print(f"[LOGIN] Refused {player_name}: all {len(player_names)} player ids in use")
+            kick_player(conn, "Server is full!")
+            return
+        player_id = min(free_player_ids)
+        free_player_ids.discard(player_id)
 
         # Send Server Identification [0x00]
         packet = struct.pack('BB', 0x00, 0x07)
         packet += pad_string("RLE Server")
         packet += pad_string("Direct-Stream")
         packet += struct.pack('B', 0x00)  # User type
-        client_socket.sendall(packet)
-        
-        # --- 2. Level Streaming (DIRECT - NO RAM EXPANSION) ---
-        client_socket.sendall(struct.pack('B', 0x02))  # Level Initialize
-
-        # Custom streamer that pipes RLE→Gzip→Socket without loading full world
-        class DirectSocketStreamer:
-            def __init__(self, sock):
-                self.sock = sock
-                self.sent = 0
-                self.total_size = X * Y * Z
-            
-            def write(self, data):
-                # Send data in 1024-byte chunks
-                for i in range(0, len(data), 1024):
-                    chunk = data[i:i+1024]
-                    self.sent += len(chunk)
-                    percent = min(100, int((self.sent / self.total_size) * 100))
-                    
-                    # Packet 0x03: [ID][Length:short][Data*1024][Percent]
-                    packet = struct.pack('>BH', 0x03, len(chunk))
-                    packet += chunk.ljust(1024, b'\x00')
-                    packet += struct.pack('B', percent)
-                    self.sock.sendall(packet)
-
-        # Stream world directly from RLE file without expanding in RAM
-        streamer = DirectSocketStreamer(client_socket)
-        with gzip.GzipFile(fileobj=streamer, mode='wb', compresslevel=6) as gz:
-            # Write world size header
-            gz.write(struct.pack('>I', X * Y * Z))
-            
-            # Stream RLE data - expand on-the-fly
-            with open("world.rle", "rb") as f:
-                while True:
-                    pair = f.read(2)
-                    if not pair or len(pair) < 2:
-                        break
-                    count = pair[0]
-                    block_id = pair[1]
-                    # Expand this RLE pair directly into gzip stream
-                    gz.write(bytes([block_id]) * count)
-        
-        # Level Finalize [0x04]
-        packet = struct.pack('>Bhhh', 0x04, X, Y, Z)
-        client_socket.sendall(packet)
-        
-        # --- 3. Player Spawning ---
-        # Classic protocol uses signed shorts (-32768 to 32767)
-        # For large worlds, spawn near origin instead of center
-        if (X // 2) * 32 > 32767 or (Z // 2) * 32 > 32767:
-            # Spawn at a safe location within protocol limits
-            spawn_x = 512 * 32  # Block 512
-            spawn_y = 70 * 32   # Block 70 (above ground)
-            spawn_z = 512 * 32  # Block 512
-        else:
-            # Normal spawn at world center
-            spawn_x = (X // 2) * 32
-            spawn_y = ((Y // 2) + 10) * 32
-            spawn_z = (Z // 2) * 32
-        
-        # Tell ALL existing players about the new player FIRST
-        spawn_packet_others = struct.pack('>Bb', 0x07, player_id)
-        spawn_packet_others += pad_string(player_name)
-        spawn_packet_others += struct.pack('>hhhBB', spawn_x, spawn_y, spawn_z, 0, 0)
-        broadcast(spawn_packet_others, exclude=client_socket)
-        
-        # Tell new player about themselves
-        spawn_packet_self = struct.pack('>Bb', 0x07, -1)  # -1 = self
-        spawn_packet_self += pad_string(player_name)
-        spawn_packet_self += struct.pack('>hhhBB', spawn_x, spawn_y, spawn_z, 0, 0)
-        client_socket.sendall(spawn_packet_self)
-        
-        # Tell new player about all existing players
-        with clients_lock:
-            for sock, (name, pid) in clients.items():
-                if sock != client_socket:
-                    other_spawn = struct.pack('>Bb', 0x07, pid)
-                    other_spawn += pad_string(name)
-                    other_spawn += struct.pack('>hhhBB', spawn_x, spawn_y, spawn_z, 0, 0)
-                    client_socket.sendall(other_spawn)
+        conn.send(packet)
         
+        # --- 2. Level streaming and spawn, in the default world ---
+        player_names[player_id] = player_name
+        await enter_level(conn, level_manager.acquire(DEFAULT_WORLD), player_id, player_name)
+
         # Join message
         join_msg = struct.pack('>BB', 0x0d, 0xff)
         join_msg += pad_string(f"&e{player_name} joined the game")
@@ -343,99 +1067,92 @@ def handle_client(client_socket, address):
         
         print(f"[SPAWN] {player_name} spawned (ID: {player_id})")
         
-        # --- 4. Main Packet Loop ---
+        # --- 3. Main Packet Loop ---
         move_packet_count = 0
         blocks_placed = 0
         last_check_time = time.time()
         last_grief_time = time.time()
-        send_message(client_socket, "&ePlease /login <password> or /register <password>")
-        while True:
-            packet_id = recv_exact(client_socket, 1)[0]
-            VALID_PIDS = {0x00, 0x05, 0x08, 0x0d} 
-            is_auth = client_socket in authenticated_clients
-            if packet_id not in VALID_PIDS:
-                print(f"[SECURITY] Invalid packet ID 0x{packet_id:02x} from {player_name}. Blocking.")
-                kick_player(client_socket, "Invalid packet sequence detected.")
-                return
+        send_message(conn, "&ePlease /login <password> or /register <password>")
+        with profiler.span("packet_loop"):
+            while True:
+                packet_id, fields = await conn.packets.read_packet()
+                VALID_PIDS = {0x00, 0x05, 0x08, 0x0d} 
+                is_auth = conn in authenticated_clients
+                if packet_id not in VALID_PIDS:
+                    print(f"[SECURITY] Invalid packet ID 0x{packet_id:02x} from {player_name}. Blocking.")
+                    kick_player(conn, "Invalid packet sequence detected.")
+                    return
+                packets_in.inc(1, f"0x{packet_id:02x}")
 
-            if time.time() - last_grief_time >= 1:
-                if blocks_placed > 45:
-                    print(f"[SECURITY] Triggered Anti Grief System")
-                    kick_player(client_socket, "Triggered Anti Grief. Slow down!")
+                if time.time() - last_grief_time >= 1:
+                    if blocks_placed > 45:
+                        print(f"[SECURITY] Triggered Anti Grief System: {player_name} "
+                              f"(undo with /rollback {player_name} <minutes>)")
+                        kick_player(conn, "Triggered Anti Grief. Slow down!")
+                        blocks_placed = 0
+                        last_grief_time = time.time()
                     blocks_placed = 0
-                    last_grief_time = time.time()
-                blocks_placed = 0
-                last_check_time = time.time()
-
-            if time.time() - last_check_time >= 30:
-                #print(f"[NETWORK] {player_name} sent {move_packet_count} move packets in the last 30 seconds.")
-                if move_packet_count > (30*20)+(30*2):
-                    kick_player(client_socket, "Triggered Packet Spam")
-                move_packet_count = 0
-                last_check_time = time.time()
-            
-            if packet_id == 0x05:  # Set Block
-                x = struct.unpack('>h', recv_exact(client_socket, 2))[0]
-                y = struct.unpack('>h', recv_exact(client_socket, 2))[0]
-                z = struct.unpack('>h', recv_exact(client_socket, 2))[0]
-                mode = recv_exact(client_socket, 1)[0]
-                block_type = recv_exact(client_socket, 1)[0]
-                
-                
-                # Validate coordinates
-                if 0 <= x < X and 0 <= y < Y and 0 <= z < Z:
-                    idx = (y * Z + z) * X + x
-                    new_block = block_type if mode == 1 else 0
-                    
-                    # Store in log
-                    with logs_lock: 
-                        block_logs[idx] = new_block
-                    
-                    # Broadcast block change [0x06]
-                    blocks_placed += 1
-                    block_packet = struct.pack('>BhhhB', 0x06, x, y, z, new_block)
-                    broadcast(block_packet)
-            
-            elif packet_id == 0x08:  # Position & Orientation
-
-                move_packet_count +=1
-                pid = recv_exact(client_socket, 1)[0]  # Player's own ID (ignored)
-                x = struct.unpack('>h', recv_exact(client_socket, 2))[0]
-                y = struct.unpack('>h', recv_exact(client_socket, 2))[0]
-                z = struct.unpack('>h', recv_exact(client_socket, 2))[0]
-                yaw = recv_exact(client_socket, 1)[0]
-                pitch = recv_exact(client_socket, 1)[0]
-                
-                if not is_auth:
-                    teleport_player(client_socket, spawn_x, spawn_y, spawn_z)
-                    continue
-                
-                # Broadcast position with SERVER's assigned player_id
-                move_packet = struct.pack('>BbhhhBB', 0x08, player_id, x, y, z, yaw, pitch)
-                broadcast(move_packet, exclude=client_socket)
-            
-            elif packet_id == 0x0d:  # Message
-                pid = recv_exact(client_socket, 1)[0]
-                message = recv_exact(client_socket, 64).decode('ascii').strip()
+                    last_check_time = time.time()
 
-                if not is_auth and not (message.startswith('/login') or message.startswith('/register')):
-                    send_message(client_socket, "&cLogin to chat!")
-                    continue
-                
-                if message:
-                    if message.startswith('/'):
-                        print(f"[COMMAND] <{player_name}> <{message}>")
-                        handle_command(player_name, message, client_socket)
-                    else:
-                        print(f"[CHAT] <{player_name}> {message}")
-                        chat_packet = struct.pack('>BB', 0x0d, 0xff)
-                        chat_packet += pad_string(f"&f<{player_name}> {message}")
-                        broadcast(chat_packet)
-            
-            else:
-                print(f"[WARN] Unknown packet 0x{packet_id:02x} from {player_name}")
+                if time.time() - last_check_time >= 30:
+                    #print(f"[NETWORK] {player_name} sent {move_packet_count} move packets in the last 30 seconds.")
+                    if move_packet_count > (30*20)+(30*2):
+                        kick_player(conn, "Triggered Packet Spam")
+                    move_packet_count = 0
+                    last_check_time = time.time()
+
+                if packet_id == 0x05:  # Set Block
+                    x, y, z, mode, block_type = fields
+
+
+                    # Validate coordinates
+                    level = conn.level
+                    if level.contains(x, y, z):
+                        idx = level.index(x, y, z)
+                        new_block = block_type if mode == 1 else 0
+
+                        # Store in log (and journal)
+                        level.set_block(idx, new_block, player_name)
+
+                        # Send block change [0x06] to everyone in view of it
+                        blocks_placed += 1
+                        broadcast_block(level, x, y, z, new_block)
+
+                elif packet_id == 0x08:  # Position & Orientation
+
+                    move_packet_count +=1
+                    pid, x, y, z, yaw, pitch = fields  # pid is the player's own ID (ignored)
+
+                    if not is_auth:
+                        teleport_player(conn, *conn.spawn)
+                        continue
+
+                    # Only the newest pose per tick is broadcast, see movement_tick()
+                    player_poses[player_id] = (x, y, z, yaw, pitch)
+                    conn.level.moved_players.add(player_id)
+
+                elif packet_id == 0x0d:  # Message
+                    pid, message = fields
+                    message = message.decode('ascii').strip()
+
+                    if not is_auth and not (message.startswith('/login') or message.startswith('/register')):
+                        send_message(conn, "&cLogin to chat!")
+                        continue
+
+                    if message:
+                        if message.startswith('/'):
+                            print(f"[COMMAND] <{player_name}> <{message}>")
+                            await handle_command(player_name, message, conn)
+                        else:
+                            print(f"[CHAT] <{player_name}> {message}")
+                            chat_packet = struct.pack('>BB', 0x0d, 0xff)
+                            chat_packet += pad_string(f"&f<{player_name}> {message}")
+                            broadcast(chat_packet, level=conn.level)
 
-    except ConnectionError:
+                else:
+                    print(f"[WARN] Unknown packet 0x{packet_id:02x} from {player_name}")
+
+    except (ConnectionError, asyncio.CancelledError):
         print(f"[DISCONNECT] {player_name} connection lost")
     except Exception as e:
         print(f"[ERROR] {player_name}: {e}")
@@ -443,141 +1160,479 @@ def handle_client(client_socket, address):
         traceback.print_exc()
     finally:
         # Cleanup
-        with clients_lock:
-            if client_socket in clients:
-                del clients[client_socket]
+        clients.pop(conn, None)
+        authenticated_clients.discard(conn)
         
         # Despawn player
+        if conn.level is not None:
+            leave_level(conn, player_id)
         if player_id >= 0:
-            despawn_packet = struct.pack('>Bb', 0x0c, player_id)
-            broadcast(despawn_packet)
+            free_player_ids.add(player_id)
+            sent_poses.pop(player_id, None)
+            player_poses.pop(player_id, None)
+            player_names.pop(player_id, None)
             
             leave_msg = struct.pack('>BB', 0x0d, 0xff)
             leave_msg += pad_string(f"&e{player_name} left the game")
             broadcast(leave_msg)
 
-            player_list.remove(player_name)
+            player_list.discard(player_name)
             
             print(f"[LEAVE] {player_name} left")
         
+        conn.close()
+
+def broadcast(packet, exclude=None, level=None):
+    """Queue packet for all clients (or those in `level`) except excluded one
+    (event loop only, never blocks)"""
+    with fanout_seconds.time("chat"), profiler.span("broadcast"):
+        for conn in list(clients if level is None else level.clients):
+            if conn is not exclude:
+                conn.send(packet)
+
+async def enter_level(conn, level, player_id, player_name):
+    """Stream `level` to the client and spawn it there. The caller holds the level
+    (level_manager.acquire) on the client's behalf; leave_level() lets go."""
+    loop = asyncio.get_running_loop()
+    conn.level = level
+    with profiler.span("level_stream"):
+        fast_map = "FastMap" in conn.extensions
+        if fast_map:
+            conn.send(struct.pack('>Bi', 0x02, level.X * level.Y * level.Z))  # Level Initialize + volume
+        else:
+            conn.send(struct.pack('B', 0x02))  # Level Initialize
+
+        # Blocks until the first snapshot exists, so wait in a worker thread
+        stream_started = time.perf_counter()
+        level_cache = level.level_cache
+        snapshot = await loop.run_in_executor(None, level_cache.acquire)
         try:
-            client_socket.close()
-        except:
-            pass
+            await conn.send_direct(snapshot.fast_packets if fast_map else snapshot.packets)
 
-def broadcast(packet, exclude=None):
-    """Send packet to all clients except excluded one"""
-    with clients_lock:
-        dead_sockets = []
-        for sock in list(clients.keys()):
-            if sock != exclude:
-                try:
-                    sock.sendall(packet)
-                except:
-                    dead_sockets.append(sock)
-        
-        # Clean up dead connections
-        for sock in dead_sockets:
-            if sock in clients:
-                del clients[sock]
+            # Level Finalize [0x04]
+            packet = struct.pack('>Bhhh', 0x04, level.X, level.Y, level.Z)
+            conn.send(packet)
+            join_level_seconds.observe(time.perf_counter() - stream_started)
 
-def main():
-    generate_initial_rle()
-    
-    # Start auto-save thread
-    threading.Thread(target=auto_save_task, daemon=True).start()
-    print("[SERVER] Auto-save enabled (every 5 minutes)")
+            # Register and catch up on changes newer than the snapshot. There is no
+            # await in between, so no broadcast can overtake the catch-up packets.
+            clients[conn] = level.clients[conn] = (player_name, player_id)
+            with level.logs_lock:
+                catch_up = level_cache.changes_since(snapshot.generation)
+            # Everything broadcast so far is in the snapshot or the catch-up
+            conn.join_seq = level.broadcast_seq
+            if catch_up:
+                conn.send(block_packets(conn, list(catch_up.items())))
+        finally:
+            level_cache.release(snapshot)
+
+    conn.spawn = level.spawn_point()
+    player_poses[player_id] = sent_poses[player_id] = (*conn.spawn, 0, 0)
+
+    # Tell new player about themselves
+    spawn_packet_self = struct.pack('>Bb', 0x07, -1)  # -1 = self
+    spawn_packet_self += pad_string(player_name)
+    spawn_packet_self += struct.pack('>hhhBB', *conn.spawn, 0, 0)
+    conn.send(spawn_packet_self)
+
+    # Nearby players are spawned on both sides by the next movement tick
+    place_player(level, player_id)
+    watch_cells(conn, level.player_cells[player_id])
+
+def leave_level(conn, player_id):
+    """Take the client out of its level (despawning it for the others) and let go of the level"""
+    level = conn.level
+    level.clients.pop(conn, None)
+    level.moved_players.discard(player_id)
+    remove_player(level, player_id)
+    watch_cells(conn, None)
+    conn.visible = set()
+    conn.cell_baseline = {}
+    if conn.block_batch is not None:
+        conn.block_batch = {}
+    conn.level = None
+    level_manager.release(level)
 
+async def change_level(conn, name):
+    """/goto: move the client to level `name`, loading it first if needed"""
+    player_name, player_id = clients[conn]
+    send_message(conn, f"&eGoing to {name}...")
     try:
-        tunnel = ngrok.connect(25565, "tcp")
-        print(f"[NGROK] Tunnel established: {tunnel.public_url}")
-        
+        # Loading reads the world file and replays its journal, keep it off the loop
+        level = await asyncio.get_running_loop().run_in_executor(None, level_manager.acquire, name)
     except Exception as e:
-        print(f"[NGROK ERROR] {e}")
+        print(f"[ERROR] Loading {name} failed: {e}")
+        send_message(conn, f"&cCould not load {name}: {e}")
+        return
+    old = conn.level
+    if conn.visible:
+        conn.send(b''.join(struct.pack('>Bb', 0x0c, pid) for pid in conn.visible))
+    leave_level(conn, player_id)
+    await enter_level(conn, level, player_id, player_name)
+    print(f"[WORLD] {player_name} went from {old.name} to {name}")
+    announce = struct.pack('>BB', 0x0d, 0xff) + pad_string(f"&e{player_name} went to {name}")
+    broadcast(announce, level=old)
+    broadcast(announce, level=level)
+
+def encode_move(pid, old, new):
+    """Smallest packet taking everyone from pose `old` to `new` (b'' if nothing changed)"""
+    dx, dy, dz = new[0] - old[0], new[1] - old[1], new[2] - old[2]
+    moved = dx or dy or dz
+    turned = new[3] != old[3] or new[4] != old[4]
+    if moved and not (-128 <= dx <= 127 and -128 <= dy <= 127 and -128 <= dz <= 127):
+        return struct.pack('>BbhhhBB', 0x08, pid, *new)  # Too far for a relative move
+    if moved and turned:
+        return struct.pack('>BbbbbBB', 0x09, pid, dx, dy, dz, new[3], new[4])
+    if moved:
+        return struct.pack('>Bbbbb', 0x0a, pid, dx, dy, dz)
+    if turned:
+        return struct.pack('>BbBB', 0x0b, pid, new[3], new[4])
+    return b''
+
+def cell_of(x, z):
+    """Grid cell of a block column"""
+    return (x // GRID_CELL, z // GRID_CELL)
+
+def neighbourhood(cell):
+    cx, cz = cell
+    return [(cx + dx, cz + dz) for dx in (-1, 0, 1) for dz in (-1, 0, 1)]
+
+def in_view(a, b, visible):
+    """Is pose `b` within view of pose `a`? Already visible players get some slack."""
+    limit = (VIEW_RADIUS + (VIEW_HYSTERESIS if visible else 0)) * 32
+    dx, dz = a[0] - b[0], a[2] - b[2]
+    return dx * dx + dz * dz <= limit * limit
+
+def place_player(level, pid):
+    """Move a player to the grid cell of its sent pose"""
+    cell = cell_of(sent_poses[pid][0] >> 5, sent_poses[pid][2] >> 5)
+    old = level.player_cells.get(pid)
+    level.dirty_cells.add(cell)
+    if old == cell: return
+    if old is not None:
+        level.cell_players[old].discard(pid)
+        if not level.cell_players[old]: del level.cell_players[old]
+        level.dirty_cells.add(old)
+    level.player_cells[pid] = cell
+    level.cell_players[cell].add(pid)
+
+def remove_player(level, pid):
+    """Take a leaving player off the grid and off every client that can see it"""
+    cell = level.player_cells.pop(pid, None)
+    if cell is None: return
+    level.cell_players[cell].discard(pid)
+    if not level.cell_players[cell]: del level.cell_players[cell]
+    level.dirty_cells.add(cell)
+    despawn_packet = struct.pack('>Bb', 0x0c, pid)
+    for conn in level.cell_watchers.get(cell, ()):
+        if pid in conn.visible:
+            conn.visible.discard(pid)
+            conn.send(despawn_packet)
+
+def watch_cells(conn, cell):
+    """Centre a client's view on `cell` of its level (None = stop watching),
+    replaying block changes it missed in cells coming into view"""
+    if cell == conn.cell: return
+    level = conn.level
+    cells = neighbourhood(cell) if cell is not None else ()
+    for c in conn.cells:
+        if c not in cells:
+            level.cell_watchers[c].discard(conn)
+            if not level.cell_watchers[c]: del level.cell_watchers[c]
+            conn.cell_baseline[c] = level.broadcast_seq
+    for c in cells:
+        if c not in conn.cells:
+            level.cell_watchers[c].add(conn)
+            baseline = conn.cell_baseline.pop(c, conn.join_seq)
+            missed = [(idx, block) for idx, (seq, block) in level.cell_changes.get(c, {}).items() if seq > baseline]
+            if missed: conn.send(block_packets(conn, missed))
+            stale = [origin for origin, seq in level.cell_regions.get(c, {}).items() if seq > baseline]
+            if stale: asyncio.create_task(replay_regions(conn, level, stale))
+    conn.cell, conn.cells = cell, cells
 
-    # Start server
-    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    server.bind(('0.0.0.0', 25565))
-    server.listen(5)
+def broadcast_block(level, x, y, z, block):
+    """Send a 0x06 to clients with the block in view (BulkBlockUpdate clients get
+    it batched with the rest of the tick) and keep it for everyone else"""
+    cell = cell_of(x, z)
+    idx = level.index(x, y, z)
+    packet = struct.pack('>BhhhB', 0x06, x, y, z, block)
+    with fanout_seconds.time("block"), profiler.span("broadcast"):
+        for conn in level.cell_watchers.get(cell, ()):
+            if conn.block_batch is not None:
+                conn.block_batch[idx] = block
+            else:
+                conn.send(packet)
+    level.broadcast_seq += 1
+    record_cell_changes(level, cell, [(idx, block)], level.broadcast_seq)
+
+def broadcast_blocks(level, indices):
+    """Send many changed blocks as one update: every client gets the ones in its
+    view in a single write (BulkBlockUpdate clients through their tick batch)"""
+    if not indices: return
+    with level.logs_lock:
+        changes = [(idx, level.current_block(idx)) for idx in indices]
+    level.broadcast_seq += 1
+    per_conn = collections.defaultdict(list)
+    with fanout_seconds.time("block"), profiler.span("broadcast"):
+        by_cell = collections.defaultdict(list)
+        for idx, block in changes:
+            x, y, z = level.xyz(idx)
+            by_cell[cell_of(x, z)].append((idx, block))
+        for cell, cell_blocks in by_cell.items():
+            for conn in level.cell_watchers.get(cell, ()):
+                per_conn[conn] += cell_blocks
+            record_cell_changes(level, cell, cell_blocks, level.broadcast_seq)
+        for conn, conn_blocks in per_conn.items():
+            if conn.block_batch is not None:
+                conn.block_batch.update(conn_blocks)
+            else:
+                conn.send(block_packets(conn, conn_blocks))
+
+def record_cell_changes(level, cell, changes, seq):
+    """Keep (index, block) changes for clients that bring `cell` into view later.
+    Past CELL_CHANGES_MAX blocks the cell only keeps which regions changed."""
+    log = level.cell_changes[cell]
+    log.update((idx, (seq, block)) for idx, block in changes)
+    if len(log) > CELL_CHANGES_MAX:
+        regions = level.cell_regions[cell]
+        rx, ry, rz = region.REGION
+        for idx, (gen, block) in log.items():
+            x, y, z = level.xyz(idx)
+            origin = (x - x % rx, y - y % ry, z - z % rz)
+            regions[origin] = max(gen, regions.get(origin, 0))
+        log.clear()
+
+async def replay_regions(conn, level, origins):
+    """Resend whole regions of a cell whose change log was collapsed, REPLAY_REGIONS
+    at a time as the client's send queue drains. Regions are decoded in the
+    executor; the current blocks are read and queued on the loop, so a live
+    broadcast can't be overtaken by an older copy."""
+    loop = asyncio.get_running_loop()
+    for start in range(0, len(origins), REPLAY_REGIONS):
+        batch = origins[start:start + REPLAY_REGIONS]
+        await loop.run_in_executor(None, level.prefetch, [level.index(*origin) for origin in batch])
+        while conn.queued_bytes > SEND_QUEUE_SOFT_LIMIT and not conn.closing:
+            await asyncio.sleep(1 / MOVE_TICK_RATE)
+        # Keep going if the cell left view meanwhile: its baseline already counts these regions as sent
+        if conn.closing or conn.level is not level: return
+        conn.send(b''.join(region_packets(conn, level, *origin) for origin in batch))
+
+def region_packets(conn, level, x0, y0, z0):
+    """Every block of the region at (x0, y0, z0) as packets for `conn`, built with numpy"""
+    x1, y1, z1 = (min(a + r, n) for a, r, n in zip((x0, y0, z0), region.REGION, (level.X, level.Y, level.Z)))
+    blocks = level.get_box(x0, y0, z0, x1, y1, z1)
+    y, z, x = (a.ravel() for a in np.indices(blocks.shape))
+    blocks = blocks.ravel()
+    if "BulkBlockUpdate" in conn.extensions:
+        packets = np.zeros(-(-len(blocks) // 256), dtype=BULK_PACKET)
+        packets['id'], packets['count'] = 0x26, 255
+        packets['count'][-1] = (len(blocks) - 1) % 256
+        # Fields of a structured array aren't contiguous, so fill flat copies and assign them back
+        indices, padded = np.zeros(len(packets) * 256, dtype='>i4'), np.zeros(len(packets) * 256, dtype=np.uint8)
+        indices[:len(blocks)], padded[:len(blocks)] = level.index(x + x0, y + y0, z + z0), blocks
+        packets['idx'], packets['block'] = indices.reshape(-1, 256), padded.reshape(-1, 256)
+    else:
+        packets = np.zeros(len(blocks), dtype=SET_BLOCK_PACKET)
+        packets['id'] = 0x06
+        packets['x'], packets['y'], packets['z'], packets['block'] = x + x0, y + y0, z + z0, blocks
+    return packets.tobytes()
+
+def prune_cell_changes(level):
+    """Forget each cell's changes that every client without it in view has
+    already seen (they are older than its baseline for the cell)"""
+    for cell in set(level.cell_changes) | set(level.cell_regions):
+        floor = min((conn.cell_baseline.get(cell, conn.join_seq)
+                     for conn in level.clients if cell not in conn.cells), default=level.broadcast_seq)
+        changes = level.cell_changes.get(cell, {})
+        for idx in [idx for idx, (gen, block) in changes.items() if gen <= floor]:
+            del changes[idx]
+        regions = level.cell_regions.get(cell, {})
+        for origin in [origin for origin, gen in regions.items() if gen <= floor]:
+            del regions[origin]
+        if not changes: level.cell_changes.pop(cell, None)
+        if not regions: level.cell_regions.pop(cell, None)
+
+def update_view(conn, player_id, packets):
+    """Spawn/despawn players crossing this client's view radius, then queue the
+    moves of the ones that stay visible"""
+    me = sent_poses[player_id]
+    near = set()
+    for cell in conn.cells:
+        for pid in conn.level.cell_players.get(cell, ()):
+            if pid != player_id and in_view(me, sent_poses[pid], pid in conn.visible):
+                near.add(pid)
+    changes = []
+    for pid in conn.visible - near:
+        changes.append(struct.pack('>Bb', 0x0c, pid))
+    for pid in near - conn.visible:
+        changes.append(struct.pack('>Bb', 0x07, pid) + pad_string(player_names[pid])
+                       + struct.pack('>hhhBB', *sent_poses[pid]))
+    moves = b''.join(packets[pid] for pid in near & conn.visible if pid in packets)
+    conn.visible = near
+    if changes: conn.send(b''.join(changes))
+    return moves
+
+def movement_tick_once(level):
+    """Send every pose in `level` that changed since the last tick to the players
+    in view of it, one write per recipient"""
+    packets = {}
+    for pid in level.moved_players:
+        if pid in sent_poses:
+            packet = encode_move(pid, sent_poses[pid], player_poses[pid])
+            sent_poses[pid] = player_poses[pid]
+            place_player(level, pid)
+            if packet:
+                packets[pid] = packet
+    level.moved_players.clear()
+
+    for conn, (name, player_id) in list(level.clients.items()):
+        if conn.block_batch:
+            conn.send(block_packets(conn, list(conn.block_batch.items())))
+            conn.block_batch = {}
+        if player_id not in level.player_cells: continue  # not spawned yet
+        watch_cells(conn, level.player_cells[player_id])
+        moves = b''
+        if not level.dirty_cells.isdisjoint(conn.cells):
+            moves = update_view(conn, player_id, packets)
+        if conn.needs_resync:
+            if conn.queued_bytes > SEND_QUEUE_SOFT_LIMIT: continue
+            conn.needs_resync = False
+            conn.send(b''.join(struct.pack('>BbhhhBB', 0x08, pid, *sent_poses[pid])
+                               for pid in conn.visible))
+        elif moves:
+            conn.send_moves(moves)
+    level.dirty_cells.clear()
+
+async def movement_tick():
+    loop = asyncio.get_running_loop()
+    interval = 1 / MOVE_TICK_RATE
+    next_tick = next_prune = loop.time()
+    while True:
+        next_tick += interval
+        await asyncio.sleep(max(0, next_tick - loop.time()))
+        levels = loaded_levels()
+        try:
+            with fanout_seconds.time("move_tick"), profiler.span("broadcast"):
+                for level in levels:
+                    movement_tick_once(level)
+            if loop.time() >= next_prune:
+                next_prune = loop.time() + CELL_CHANGES_PRUNE_INTERVAL
+                for level in levels:
+                    prune_cell_changes(level)
+        except Exception as e:
+            print(f"[ERROR] Movement tick failed: {e}")
+
+async def block_tick():
+    """Run each level's due block updates BLOCK_TICK_RATE times a second, off the
+    event loop; what a tick changed goes out as one batch per level"""
+    loop = asyncio.get_running_loop()
+    interval = 1 / BLOCK_TICK_RATE
+    next_tick = loop.time()
+    while True:
+        next_tick += interval
+        if loop.time() - next_tick > TICK_MAX_LAG * interval:
+            # Too far behind to catch up: drop the missed ticks rather than run them back to back
+            tick_overruns.inc(int((loop.time() - next_tick) / interval))
+            next_tick = loop.time()
+        await asyncio.sleep(max(0, next_tick - loop.time()))
+        started = time.perf_counter()
+        busy = False
+        for level in loaded_levels():
+            level.block_ticks.advance()
+            if not level.block_ticks.ready(): continue
+            busy = True
+            try:
+                changed = await loop.run_in_executor(None, level.run_ticks, TICK_BUDGET)
+                broadcast_blocks(level, changed)
+            except Exception as e:
+                print(f"[ERROR] Block tick in {level.name} failed: {e}")
+        if busy:
+            tick_seconds.observe(time.perf_counter() - started)
+
+async def serve():
+    server = await asyncio.start_server(handle_client, '0.0.0.0', PORT, backlog=512)
+    profiler.watch_loop(asyncio.get_running_loop())
+    
+    main_level = level_manager.get(DEFAULT_WORLD)
+    print(f"[SERVER] Region Log Server Running")
+    print(f"[SERVER] World: {main_level.X}x{main_level.Y}x{main_level.Z} = "
+          f"{main_level.X * main_level.Y * main_level.Z:,} blocks, {len(world_names())} worlds on disk")
+    print(f"[SERVER] Listening on port {PORT}...")
     
-    print(f"[SERVER] RLE Log Server Running")
-    print(f"[SERVER] World: {X}x{Y}x{Z} = {X*Y*Z:,} blocks")
-    print(f"[SERVER] Listening on port 25565...")
+    asyncio.create_task(movement_tick())
+    asyncio.create_task(block_tick())
+    if PROFILE_SECONDS:
+        asyncio.create_task(run_profile(PROFILE_SECONDS))
+    async with server:
+        await server.serve_forever()
+
+def main():
+    global X, Y, Z, PORT, METRICS_PORT, PROFILE_SECONDS, JOURNAL_COMPACT_BYTES, BACKUP_INTERVAL, SAVE_WORKERS
+    global account_store, level_manager, PHYSICS
+    parser = argparse.ArgumentParser(description="HobbyBuster classic server")
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--size', type=int, nargs=3, default=(X, Y, Z), metavar=('X', 'Y', 'Z'),
+                        help="size of the default world (an existing world file must match)")
+    parser.add_argument('--world-memory-mb', type=float, default=worlds.MEMORY_BUDGET / (1024 * 1024),
+                        help="memory of loaded worlds past which idle ones are unloaded early")
+    parser.add_argument('--world-idle-minutes', type=float, default=worlds.IDLE_SECONDS / 60,
+                        help="minutes an empty world stays loaded")
+    parser.add_argument('--journal-mb', type=float, default=JOURNAL_COMPACT_BYTES / (1024 * 1024),
+                        help="journal size that triggers a save")
+    parser.add_argument('--save-workers', type=int, default=SAVE_WORKERS,
+                        help="processes for whole-file saves, 1 = serial")
+    parser.add_argument('--no-ngrok', action='store_true', help="don't open an ngrok tunnel (offline/benchmarks)")
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                        help="serve Prometheus metrics on 127.0.0.1:PORT/metrics")
+    parser.add_argument('--backup-minutes', type=float, default=BACKUP_INTERVAL / 60,
+                        help="minutes between automatic backups, 0 = only on /backup")
+    parser.add_argument('--profile', type=float, default=PROFILE_SECONDS, metavar='SECONDS',
+                        help="sample the server for its first SECONDS and write a flame graph profile")
+    parser.add_argument('--no-physics', action='store_true', help="no falling sand or flowing water and lava")
+    args = parser.parse_args()
+    X, Y, Z = args.size
+    PHYSICS = not args.no_physics
+    PORT = args.port
+    METRICS_PORT = args.metrics_port
+    PROFILE_SECONDS = args.profile
+    BACKUP_INTERVAL = int(args.backup_minutes * 60)
+    JOURNAL_COMPACT_BYTES = int(args.journal_mb * 1024 * 1024)
+    SAVE_WORKERS = max(1, args.save_workers)
+
+    level_manager = worlds.WorldManager(open_level, int(args.world_memory_mb * 1024 * 1024),
+                                        args.world_idle_minutes * 60)
+    main_level = level_manager.acquire(DEFAULT_WORLD)  # held for good, so it is never unloaded
+    level_manager.start()
+    print(f"[SERVER] {len(main_level.block_history):,} block history rows in {HISTORY_DIR}/")
+    account_store = accounts.AccountStore(USER_DB_FILE)
+    account_store.start()
+    print(f"[SERVER] {len(account_store)} accounts loaded")
     
+    # Start auto-save thread
+    threading.Thread(target=auto_save_task, daemon=True).start()
+    print(f"[SERVER] Journal enabled (compacting every {JOURNAL_COMPACT_BYTES // (1024 * 1024)}MB)")
+    if BACKUP_INTERVAL:
+        threading.Thread(target=auto_backup_task, daemon=True).start()
+        print(f"[BACKUP] Snapshots of loaded worlds every {BACKUP_INTERVAL / 60:g} min into {BACKUP_DIR}/, "
+              f"keeping {BACKUP_KEEP}")
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT)
+        print(f"[METRICS] Prometheus endpoint on http://127.0.0.1:{METRICS_PORT}/metrics")
+
+    if not args.no_ngrok:
+        try:
+            tunnel = ngrok.connect(PORT, "tcp")
+            print(f"[NGROK] Tunnel established: {tunnel.public_url}")
+
+        except Exception as e:
+            print(f"[NGROK ERROR] {e}")
+
     try:
-        while True:
-            client_sock, client_addr = server.accept()
-            thread = threading.Thread(target=handle_client, args=(client_sock, client_addr), daemon=True)
-            thread.start()
+        asyncio.run(serve())
     except KeyboardInterrupt:
         print("\n[SERVER] Shutting down...")
-        if not block_logs: pass
-        
-        print(f"[SERVER] Fast-saving {len(block_logs)} changes in 50MB chunks...")
-        try:
-            with logs_lock:
-                changes_copy = dict(block_logs)
-            
-            CHUNK_SIZE = 50_000_000 
-            new_rle_path = "world.rle.tmp"
-            
-            with open("world.rle", "rb") as f_in, open(new_rle_path, "wb") as f_out:
-                # Read all existing RLE metadata at once (this is small)
-                rle_data = f_in.read()
-                counts = np.frombuffer(rle_data[0::2], dtype=np.uint8)
-                vals = np.frombuffer(rle_data[1::2], dtype=np.uint8)
-                
-                # Reconstruct only the indices we need to find chunk boundaries
-                # Note: We don't reconstruct the world, just the "cumulative" counts
-                cum_counts = np.cumsum(counts, dtype=np.int64)
-                
-                for start in range(0, X*Y*Z, CHUNK_SIZE):
-                    end = min(start + CHUNK_SIZE, X*Y*Z)
-                    
-                    # Find which RLE pairs belong to this 100MB chunk
-                    # This is the "secret sauce" for speed
-                    idx_start = np.searchsorted(cum_counts, start, side='right')
-                    idx_end = np.searchsorted(cum_counts, end, side='left')
-                    
-                    # Materialize just THIS 100MB chunk
-                    chunk_counts = counts[idx_start:idx_end+1].copy()
-                    chunk_vals = vals[idx_start:idx_end+1].copy()
-                    
-                    # Adjust the first and last run if they overlap chunk boundaries
-                    chunk_counts[0] = cum_counts[idx_start] - start
-                    chunk_counts[-1] = end - (cum_counts[idx_end-1] if idx_end > 0 else 0)
-                    
-                    # Expand, patch, and re-compress the chunk using NumPy
-                    temp_chunk = np.repeat(chunk_vals, chunk_counts)
-                    
-                    # Patch logs
-                    for idx in list(changes_copy.keys()):
-                        if start <= idx < end:
-                            temp_chunk[idx - start] = changes_copy.pop(idx)
-                    
-                    # Fast RLE compression for the chunk
-                    if len(temp_chunk) > 0:
-                        diffs = np.concatenate(([True], temp_chunk[1:] != temp_chunk[:-1]))
-                        points = np.where(diffs)[0]
-                        run_vals = temp_chunk[points]
-                        run_lens = np.diff(np.append(points, len(temp_chunk)))
-                        
-                        for c, v in zip(run_lens, run_vals):
-                            while c > 255:
-                                f_out.write(bytes([255, int(v)]))
-                                c -= 255
-                            f_out.write(bytes([int(c), int(v)]))
-
-            os.replace(new_rle_path, "world.rle")
-            with logs_lock:
-                for key in (set(block_logs.keys()) - set(changes_copy.keys())):
-                    block_logs.pop(key, None)
-            print("[SERVER] Fast-save complete.")
-        except Exception as e:
-            print(f"[ERROR] Save failed: {e}")
-        
-        server.close()
+        level_manager.close_all()
+        account_store.flush()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,110 @@
+"""Seeded procedural terrain.
+
+Every block is a pure function of (seed, x, y, z) and the world height, so a
+single region, a whole layer of regions or the full map can be generated in
+any order and always come out the same. Heights are a few octaves of value
+noise on a hashed lattice; columns are then filled with numpy compares:
+
+    bedrock | stone | 3 dirt | grass (sand at the shore) | water up to sea level | air
+"""
+import functools
+import numpy as np
+
+AIR, STONE, GRASS, DIRT, BEDROCK, WATER, SAND = 0, 1, 2, 3, 7, 9, 12
+
+OCTAVES = ((256, 20.0), (64, 8.0), (16, 2.5))  # (wavelength, amplitude) in blocks
+DIRT_DEPTH = 3
+SHORE = 1  # surfaces up to this far above sea level are sand
+
+
+def sea_level(Y):
+    return Y // 2
+
+
+def max_height(Y):
+    """No column is ever solid at or above this y"""
+    return min(Y - 1, sea_level(Y) + 2 + int(sum(amp for _, amp in OCTAVES)) + 1)
+
+
+def _lattice(seed, ix, iz):
+    """Hash lattice points to floats in [0, 1)"""
+    h = (ix.astype(np.uint64) * np.uint64(0x9E3779B1)) ^ (iz.astype(np.uint64) * np.uint64(0x85EBCA77))
+    h ^= np.uint64(seed & 0xffffffffffffffff)
+    # murmur3 finaliser
+    h ^= h >> np.uint64(33)
+    h *= np.uint64(0xff51afd7ed558ccd)
+    h ^= h >> np.uint64(33)
+    h *= np.uint64(0xc4ceb9fe1a85ec53)
+    h ^= h >> np.uint64(33)
+    return (h >> np.uint64(40)).astype(np.float32) / np.float32(1 << 24)
+
+
+def _noise(seed, x0, z0, nx, nz, wavelength):
+    """Smoothed value noise in [0, 1) over a box of columns, shape (nz, nx).
+
+    Only the few lattice points under the box are hashed; interpolation is
+    done along x for each lattice row, then along z.
+    """
+    ix, fx = np.divmod(np.arange(x0, x0 + nx, dtype=np.int64), wavelength)
+    iz, fz = np.divmod(np.arange(z0, z0 + nz, dtype=np.int64), wavelength)
+    lx = np.arange(ix[0], ix[-1] + 2)
+    lz = np.arange(iz[0], iz[-1] + 2)
+    grid = _lattice(seed, lx[None, :], lz[:, None])
+    tx = fx.astype(np.float32) / wavelength
+    tz = fz.astype(np.float32) / wavelength
+    tx = tx * tx * (3 - 2 * tx)
+    tz = (tz * tz * (3 - 2 * tz))[:, None]
+    ox = ix - lx[0]
+    rows = grid[:, ox] * (1 - tx) + grid[:, ox + 1] * tx
+    oz = iz - lz[0]
+    return rows[oz] * (1 - tz) + rows[oz + 1] * tz
+
+
+def column_heights(seed, x0, z0, nx, nz, Y):
+    """Surface height (first air block) of every column, shape (nz, nx)"""
+    h = np.full((nz, nx), sea_level(Y) + 2, dtype=np.float32)
+    for octave, (wavelength, amp) in enumerate(OCTAVES):
+        h += amp * (2 * _noise(seed + octave * 0x632BE5AB, x0, z0, nx, nz, wavelength) - 1)
+    return np.clip(np.rint(h), 1, max_height(Y)).astype(np.int16)
+
+
+# Whole-map heightmaps are reused by every layer of a level stream
+heightmap = functools.lru_cache(maxsize=2)(column_heights)
+
+
+def fill(heights, y0, layers, Y):
+    """Blocks for y0 .. y0+layers over a heightmap, shape (layers, nz, nx)"""
+    sea = sea_level(Y)
+    out = np.zeros((layers,) + heights.shape, dtype=np.uint8)
+    surface = heights - 1
+    solid_below = int(surface.min()) - DIRT_DEPTH  # layers under this are all stone
+    highest = max(int(surface.max()), sea - 1)  # layers above this are all air
+    # Depth under the surface (clipped to 0 = above .. n-1 = stone) indexes a lookup
+    # table; shore columns use a second table with sand on top instead of grass
+    n = DIRT_DEPTH + 3
+    lut = np.full(2 * n, DIRT, dtype=np.uint8)
+    lut[1], lut[n + 1] = GRASS, SAND
+    lut[n - 1] = lut[2 * n - 1] = STONE
+    shifted = heights.astype(np.int16)
+    table = np.where(surface <= sea + SHORE, n, 0).astype(np.int16)
+    depth = np.empty_like(shifted)
+    for k in range(layers):
+        y = y0 + k
+        if y == 0:
+            out[k] = BEDROCK
+        elif y < solid_below:
+            out[k] = STONE
+        elif y <= highest:
+            lut[0] = lut[n] = WATER if y < sea else AIR
+            np.subtract(shifted, y, out=depth)
+            np.clip(depth, 0, n - 1, out=depth)
+            depth += table
+            lut.take(depth, out=out[k])
+    return out
+
+
+def generate(seed, origin, shape, Y):
+    """Blocks of the box at origin (x0, y0, z0) with shape (layers, nz, nx)"""
+    x0, y0, z0 = origin
+    layers, nz, nx = shape
+    return fill(column_heights(seed, x0, z0, nx, nz, Y), y0, layers, Y)
@@ -0,0 +1,88 @@
+"""backups/: snapshot -> prune -> restore reproduces the world as it was."""
+import os, sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import backup, region, rle
+
+DIMS = (48, 32, 40)
+
+
+def read_all(path):
+    world = region.RegionFile(path)
+    blocks = np.concatenate([b for _, b in world.iter_slabs()])
+    world.close()
+    return blocks
+
+
+def random_changes(rng, n=2000):
+    total = DIMS[0] * DIMS[1] * DIMS[2]
+    return dict(zip(rng.integers(0, total, n).tolist(), rng.integers(1, 50, n).tolist()))
+
+
+@pytest.fixture
+def history(tmp_path):
+    """Three snapshots of an edited terrain world -> (store, world, {snapshot: expected blocks})"""
+    rng = np.random.default_rng(0)
+    world = region.RegionFile.create(str(tmp_path / "world.rgn"), DIMS, seed=11)
+    store = backup.BackupStore(str(tmp_path / "backups"))
+    expected = {}
+    state = np.concatenate([b for _, b in world.iter_slabs()])
+    for step in range(3):
+        world.apply_changes(random_changes(rng))  # saved changes
+        pending = rle.sorted_changes(random_changes(rng, 50))  # and ones still only in block_logs
+        n, stored, nbytes = store.create(world.snapshot(), pending, generation=step)
+        state = np.concatenate([b for _, b in world.iter_slabs()])
+        state[pending[0]] = pending[1]
+        expected[n] = state
+    yield store, world, expected
+    world.close()
+
+
+def test_restore_every_snapshot(tmp_path, history):
+    store, world, expected = history
+    for n, blocks in expected.items():
+        info = store.restore(n, str(tmp_path / f"restored-{n}.rgn"))
+        assert info["dims"] == DIMS
+        assert np.array_equal(read_all(str(tmp_path / f"restored-{n}.rgn")), blocks)
+
+
+def test_unchanged_regions_are_not_stored_again(history):
+    store, world, expected = history
+    store.create(world.snapshot(), None)  # drops the last snapshot's pending overlay
+    n, stored, nbytes = store.create(world.snapshot(), None)
+    assert (stored, nbytes) == (0, 0)
+
+
+@pytest.mark.parametrize("repack", [0.0, 1.1])  # never / always rewrite packs that lost snapshots
+def test_restore_after_prune(tmp_path, history, monkeypatch, repack):
+    monkeypatch.setattr(backup, "REPACK_FRACTION", repack)
+    store, world, expected = history
+    dropped = store.prune(keep=2)
+    assert dropped == [min(expected)]
+    assert store.snapshots() == sorted(expected)[1:]
+    if repack > 1:
+        assert min(store._ids('pack')) > max(expected)  # every surviving pack was rewritten
+    for n in store.snapshots():
+        store.restore(n, str(tmp_path / "restored.rgn"))
+        assert np.array_equal(read_all(str(tmp_path / "restored.rgn")), expected[n])
+    # The store is still usable for new snapshots after packs were deleted or rewritten
+    n, stored, nbytes = store.create(world.snapshot(), None)
+    store.restore(n, str(tmp_path / "restored.rgn"))
+    assert np.array_equal(read_all(str(tmp_path / "restored.rgn")),
+                          np.concatenate([b for _, b in world.iter_slabs()]))
+
+
+def test_corrupt_pack_fails_restore(tmp_path, history):
+    store, world, expected = history
+    n = max(expected)
+    pack = store._path('pack', n)
+    with open(pack, 'r+b') as f:
+        f.seek(os.path.getsize(pack) // 2)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xff]))
+    with pytest.raises(ValueError):
+        store.restore(n, str(tmp_path / "restored.rgn"))
+    assert not os.path.exists(tmp_path / "restored.rgn")
@@ -0,0 +1,110 @@
+"""Block changes replayed to clients bringing a cell back into view: changes
+made off the event loop (block ticks, rollbacks) that a client moved away
+from before their broadcast, and cells whose change log was collapsed."""
+import asyncio, os, struct, sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import server
+
+NEAR, FAR = (0, 0), (3, 3)  # grid cells; FAR's neighbourhood doesn't include NEAR
+
+
+class Client:
+    """The parts of a Connection that watch_cells and the broadcasts use"""
+    def __init__(self, level):
+        self.level = level
+        self.cell, self.cells, self.cell_baseline = None, (), {}
+        self.join_seq = level.broadcast_seq
+        self.extensions, self.block_batch = set(), None
+        self.queued_bytes, self.closing = 0, False
+        self.sent = bytearray()
+
+    def send(self, data):
+        self.sent += data
+
+    def blocks(self):
+        """(x, y, z) -> newest block the client was sent"""
+        seen, pos = {}, 0
+        while pos < len(self.sent):
+            if self.sent[pos] == 0x26:  # BulkBlockUpdate: count - 1, 256 indices, 256 blocks
+                count = self.sent[pos + 1] + 1
+                indices = struct.unpack_from('>256i', self.sent, pos + 2)
+                for idx, block in zip(indices[:count], self.sent[pos + 1026:pos + 1026 + count]):
+                    seen[self.level.xyz(idx)] = block
+                pos += 1282
+            else:
+                packet_id, x, y, z, block = struct.unpack_from('>BhhhB', self.sent, pos)
+                assert packet_id == 0x06
+                seen[x, y, z] = block
+                pos += 8
+        return seen
+
+
+@pytest.fixture
+def level(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "GRID_CELL", 16)
+    monkeypatch.setattr(server, "WORLD_SEED", 1)
+    level = server.Level("test", str(tmp_path), (64, 32, 64))
+    yield level
+    level.close()
+
+
+def test_tick_changes_reach_a_client_that_moved_before_their_broadcast(level):
+    client = Client(level)
+    server.watch_cells(client, NEAR)
+    y = level.Y - 2
+    level.set_block(level.index(8, y, 8), server.SAND, "alice")
+    server.broadcast_block(level, 8, y, 8, server.SAND)
+
+    level.block_ticks.advance()
+    changed = level.run_ticks(100)  # in the executor: the sand falls one block
+    assert changed
+    server.watch_cells(client, FAR)  # a movement tick runs before the tick's broadcast
+    server.broadcast_blocks(level, changed)
+    server.watch_cells(client, NEAR)
+
+    seen = client.blocks()
+    assert seen[8, y, 8] == server.AIR
+    assert seen[8, y - 1, 8] == server.SAND
+
+
+def test_rollback_reaches_a_client_that_moved_before_its_broadcast(level):
+    client = Client(level)
+    server.watch_cells(client, NEAR)
+    y = level.Y - 2
+    before = level.get_block(9, y, 9)
+    level.set_block(level.index(9, y, 9), 1, "griefer")
+    server.broadcast_block(level, 9, y, 9, 1)
+
+    reverted, skipped = level.rollback("griefer", 5, "admin")  # run_rollback's executor part
+    assert reverted == [level.index(9, y, 9)]
+    server.watch_cells(client, FAR)
+    server.broadcast_blocks(level, reverted)
+    server.watch_cells(client, NEAR)
+
+    assert client.blocks()[9, y, 9] == before
+
+
+@pytest.mark.parametrize("extensions", [set(), {"BulkBlockUpdate"}])
+def test_collapsed_cell_is_resent_region_by_region(level, monkeypatch, extensions):
+    monkeypatch.setattr(server, "CELL_CHANGES_MAX", 8)
+    monkeypatch.setattr(server, "REPLAY_REGIONS", 1)
+    client = Client(level)
+    client.extensions = extensions
+    y = level.Y - 2
+
+    async def walk_back():
+        server.watch_cells(client, FAR)
+        for x in range(20):
+            level.set_block(level.index(x, y, 3), 1, "alice")
+            server.broadcast_block(level, x, y, 3, 1)
+        assert level.cell_regions[NEAR]  # 16 changes in NEAR went past the cap
+        server.watch_cells(client, NEAR)
+        await asyncio.gather(*(t for t in asyncio.all_tasks() if t is not asyncio.current_task()))
+
+    asyncio.run(walk_back())
+    seen = client.blocks()
+    assert all(seen[x, y, 3] == 1 for x in range(20))
+    # The collapsed region went out whole, as it is now
+    assert all(seen[x, yy, z] == level.get_block(x, yy, z) for x in range(16) for yy in range(16, 32) for z in range(16))
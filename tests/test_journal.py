@@ -0,0 +1,62 @@
+"""world.journal: replay after reopen, torn and corrupted tails, rotation."""
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import journal
+
+
+def write(path, batches):
+    """Commit each {index: block} dict as its own batch -> the journal, still open"""
+    j = journal.Journal(path)
+    for batch in batches:
+        for idx, block in batch.items():
+            j.append(idx, block)
+        j.commit()
+    return j
+
+
+def test_replay_after_reopen(tmp_path):
+    path = str(tmp_path / "world.journal")
+    write(path, [{1: 5, 2: 6}, {2: 7, 4_000_000_000: 9}]).close()
+    assert journal.Journal(path).replay() == {1: 5, 2: 7, 4_000_000_000: 9}
+
+
+def test_torn_tail_is_cut_and_appends_continue(tmp_path):
+    path = str(tmp_path / "world.journal")
+    write(path, [{1: 5}, {2: 6, 3: 7}]).close()
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 3)  # crash halfway through the second batch
+    j = journal.Journal(path)
+    assert j.replay() == {1: 5}
+    assert os.path.getsize(path) == journal.BATCH.size + journal.RECORD.size
+    j.append(8, 1)
+    j.close()
+    assert journal.Journal(path).replay() == {1: 5, 8: 1}
+
+
+def test_corrupted_batch_drops_it_and_everything_after(tmp_path):
+    path = str(tmp_path / "world.journal")
+    write(path, [{1: 5}, {2: 6}, {3: 7}]).close()
+    batch = journal.BATCH.size + journal.RECORD.size
+    with open(path, 'r+b') as f:
+        f.seek(batch + journal.BATCH.size + 4)  # block byte of the second batch
+        f.write(b'\xff')
+    assert journal.Journal(path).replay() == {1: 5}
+    assert os.path.getsize(path) == batch
+
+
+def test_rotation_keeps_both_files_until_dropped(tmp_path):
+    path = str(tmp_path / "world.journal")
+    j = write(path, [{1: 5}])
+    j.rotate()
+    j.append(1, 6)
+    j.append(2, 7)
+    j.commit()
+    assert j.has_rotated()
+    assert journal.Journal(path).replay() == {1: 6, 2: 7}  # newer file wins
+    j.rotate()  # an uncleared rotation keeps its records in front
+    assert journal.Journal(path).replay() == {1: 6, 2: 7}
+    j.drop_rotated()
+    j.close()
+    assert not j.has_rotated()
+    assert journal.Journal(path).replay() == {}
@@ -0,0 +1,33 @@
+"""Block updates: flowing fluid keeps its reach only while it is there."""
+import os, sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import server
+
+
+@pytest.fixture
+def level(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "WORLD_SEED", 1)
+    level = server.Level("test", str(tmp_path), (32, 16, 32))
+    yield level
+    level.close()
+
+
+def run_all(level):
+    changed = set()
+    for _ in range(100):
+        level.block_ticks.advance()
+        changed.update(level.run_ticks(10_000))
+    return changed
+
+
+def test_fluid_reach_is_dropped_with_the_fluid(level):
+    y = level.surface_height(16, 16)
+    level.set_block(level.index(16, y, 16), server.STILL_WATER, "alice")
+    flowed = run_all(level)
+    assert level.fluid_reach and set(level.fluid_reach) <= flowed
+    for i in flowed:  # fill the puddle in
+        level.set_block(i, 1, "alice")
+    run_all(level)
+    assert level.fluid_reach == {}
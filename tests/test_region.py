@@ -0,0 +1,97 @@
+"""world.rgn round trips: write, reopen, compare against a plain array."""
+import os, sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import region, rle
+
+DIMS = (40, 40, 24)  # not multiples of the region size, so edge regions are partial
+
+
+def read_all(world):
+    return np.concatenate([blocks for _, blocks in world.iter_slabs()])
+
+
+def mixed_changes(total, rng):
+    """Changes that leave regions of every codec: a solid run, a noisy patch, a few blocks"""
+    layer = DIMS[0] * DIMS[2] * region.REGION[1]
+    changes = {i: 1 for i in range(layer)}  # the bottom layer of regions all stone -> UNIFORM (where not partial)
+    changes.update(zip(rng.integers(layer, total, 3000).tolist(), rng.integers(0, 50, 3000).tolist()))  # -> ZLIB
+    changes.update({total - 7: 3, total - 1: 4})  # sparse -> RLE
+    return changes
+
+
+@pytest.mark.parametrize("seed", [None, 7])
+def test_apply_changes_survives_reopen(tmp_path, seed):
+    path = str(tmp_path / "world.rgn")
+    world = region.RegionFile.create(path, DIMS, seed=seed)
+    expected = read_all(world)
+    changes = mixed_changes(len(expected), np.random.default_rng(0))
+    world.apply_changes(changes)
+    idx, vals = rle.sorted_changes(changes)
+    expected[idx] = vals
+    assert np.array_equal(read_all(world), expected)
+    world.close()
+
+    world = region.RegionFile(path)
+    assert world.dims() == DIMS
+    assert np.array_equal(read_all(world), expected)
+    codecs = set(world.table['codec'].tolist())
+    assert {region.UNIFORM, region.ZLIB, region.RLE} <= codecs
+    cache = region.RegionCache(world)
+    x, y, z = 5, 3, 11
+    assert cache.get_block(x, y, z) == expected[(y * DIMS[2] + z) * DIMS[0] + x]
+    world.close()
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_rewrite_and_compact_keep_content(tmp_path, workers):
+    path = str(tmp_path / "world.rgn")
+    world = region.RegionFile.create(path, DIMS, seed=3)
+    rng = np.random.default_rng(1)
+    expected = read_all(world)
+    for _ in range(3):  # repeated patches leave dead payloads behind
+        changes = mixed_changes(len(expected), rng)
+        world.apply_changes(changes)
+        idx, vals = rle.sorted_changes(changes)
+        expected[idx] = vals
+    assert world.garbage_bytes() > 0
+    changes = {0: 9, len(expected) // 2: 9}
+    world.rewrite(changes, workers)
+    expected[list(changes)] = 9
+    assert world.garbage_bytes() == 0
+    world.compact(workers)
+    world.close()
+    assert np.array_equal(read_all(region.RegionFile(path)), expected)
+
+
+def test_rewrite_is_identical_serial_and_parallel(tmp_path):
+    world = region.RegionFile.create(str(tmp_path / "world.rgn"), DIMS, seed=5)
+    world.apply_changes(mixed_changes(DIMS[0] * DIMS[1] * DIMS[2], np.random.default_rng(2)))
+    world.rewrite_to(str(tmp_path / "serial.rgn"), workers=1)
+    world.rewrite_to(str(tmp_path / "parallel.rgn"), workers=2)
+    with open(tmp_path / "serial.rgn", 'rb') as a, open(tmp_path / "parallel.rgn", 'rb') as b:
+        assert a.read() == b.read()
+
+
+def test_rle_conversion_round_trip(tmp_path):
+    rng = np.random.default_rng(3)
+    total = DIMS[0] * DIMS[1] * DIMS[2]
+    blocks = np.repeat(rng.integers(0, 50, total // 64).astype(np.uint8), 64)
+    with open(tmp_path / "world.rle", 'wb') as f:
+        f.write(rle.encode(blocks))
+    region.convert_rle(str(tmp_path / "world.rle"), str(tmp_path / "world.rgn"), DIMS)
+    assert np.array_equal(read_all(region.RegionFile(str(tmp_path / "world.rgn"))), blocks)
+    region.export_rle(str(tmp_path / "world.rgn"), str(tmp_path / "back.rle"))
+    with open(tmp_path / "back.rle", 'rb') as f:
+        assert np.array_equal(rle.decode(f.read()), blocks)
+
+
+def test_rejects_truncated_table(tmp_path):
+    path = str(tmp_path / "world.rgn")
+    region.RegionFile.create(path, DIMS).close()
+    with open(path, 'r+b') as f:
+        f.truncate(region.HEADER.size + 10)
+    with pytest.raises(ValueError):
+        region.RegionFile(path)
@@ -0,0 +1,73 @@
+"""Scheduled block updates of one level (falling sand, flowing water...).
+
+An update is a block index due at some tick, plus the player whose change
+caused it (physics changes are recorded in the history under that name, so
+a rollback undoes the flood along with the source). Updates wait in a heap
+ordered by due tick; a dict holds the one live entry per block, so
+scheduling a block twice keeps the earlier update and heap entries it
+superseded are skipped when they surface.
+
+The server advances the tick at a fixed rate and pops at most a budget of
+due updates per tick; the rest stay due and go first on the next tick.
+Scheduled updates are not saved: a restart or an unload forgets them.
+"""
+import heapq, threading
+
+
+class Scheduler:
+    def __init__(self):
+        self.tick = 0
+        self.heap = []  # (due tick, index), may hold superseded entries
+        self.due = {}  # index -> (due tick, cause) of the live update
+        self.lock = threading.Lock()  # schedule() runs on the event loop, pop() on the tick thread
+
+    def __len__(self):
+        return len(self.due)
+
+    def advance(self):
+        with self.lock:
+            self.tick += 1
+
+    def clear(self):
+        with self.lock:
+            self.heap, self.due = [], {}
+
+    def schedule(self, idx, delay, cause):
+        """Update block `idx` `delay` ticks from now, unless it already is sooner"""
+        with self.lock:
+            tick = self.tick + delay
+            current = self.due.get(idx)
+            if current is not None and current[0] <= tick:
+                return
+            self.due[idx] = (tick, cause)
+            heapq.heappush(self.heap, (tick, idx))
+
+    def _drop_stale(self):
+        heap = self.heap
+        while heap and self.due.get(heap[0][1], (None,))[0] != heap[0][0]:
+            heapq.heappop(heap)
+
+    def ready(self):
+        """Whether any update is due"""
+        with self.lock:
+            self._drop_stale()
+            return bool(self.heap) and self.heap[0][0] <= self.tick
+
+    def lag(self):
+        """Ticks the oldest due update has been waiting, 0 if none is overdue"""
+        with self.lock:
+            self._drop_stale()
+            return max(0, self.tick - self.heap[0][0]) if self.heap else 0
+
+    def pop(self, limit):
+        """Up to `limit` due updates, oldest first -> [(index, cause)]"""
+        out = []
+        with self.lock:
+            heap = self.heap
+            while heap and heap[0][0] <= self.tick and len(out) < limit:
+                tick, idx = heapq.heappop(heap)
+                current = self.due.get(idx)
+                if current is None or current[0] != tick: continue  # superseded
+                del self.due[idx]
+                out.append((idx, current[1]))
+        return out
@@ -0,0 +1,127 @@
+"""Named levels hosted by one process.
+
+A level is opened the first time somebody asks for it and stays loaded while
+anyone holds it (acquire/release). Once nobody does, it is closed after
+IDLE_SECONDS, or sooner while the loaded levels together are over the memory
+budget, least recently used first.
+
+The manager only needs three things from a level: `close()` (which saves
+it), `memory_bytes()` and a `name`. Opening and closing run on the calling
+or checker thread, never on the event loop.
+"""
+import collections, threading, time
+
+IDLE_SECONDS = 600  # an empty level is closed after this long
+MEMORY_BUDGET = 1024 * 1024 * 1024  # bytes of loaded levels before idle ones are closed early
+CHECK_INTERVAL = 10
+
+
+class WorldManager:
+    def __init__(self, open_level, budget=MEMORY_BUDGET, idle_seconds=IDLE_SECONDS):
+        self.open_level = open_level  # name -> level, loads it from disk
+        self.budget = budget
+        self.idle_seconds = idle_seconds
+        self.levels = collections.OrderedDict()  # name -> level, least recently used first
+        self.users = collections.Counter()  # name -> holders
+        self.idle_since = {}  # name -> monotonic time the last holder left
+        self.lock = threading.Lock()
+        self.name_locks = collections.defaultdict(threading.Lock)  # one open/close per name at a time
+        self.wake = threading.Event()
+
+    def __len__(self):
+        return len(self.levels)
+
+    def loaded(self):
+        with self.lock:
+            return list(self.levels.values())
+
+    def get(self, name):
+        """The loaded level `name` (None if it isn't loaded), without holding it"""
+        return self.levels.get(name)
+
+    def start(self):
+        threading.Thread(target=self._checker, name="worlds", daemon=True).start()
+
+    def acquire(self, name):
+        """Hold level `name`, opening it first if needed. Blocks while it loads
+        (or while an idle copy finishes closing)."""
+        with self.lock:
+            level = self._hold(name)
+        if level is not None:
+            return level
+        with self.name_locks[name]:
+            with self.lock:
+                level = self._hold(name)
+            if level is not None:
+                return level
+            started = time.time()
+            level = self.open_level(name)
+            with self.lock:
+                self.levels[name] = level
+                self.users[name] += 1
+            print(f"[WORLD] Loaded {name} in {time.time() - started:.1f}s ({len(self.levels)} loaded)")
+        self.wake.set()  # the newcomer may have pushed the rest over budget
+        return level
+
+    def _hold(self, name):
+        level = self.levels.get(name)
+        if level is not None:
+            self.levels.move_to_end(name)
+            self.users[name] += 1
+        return level
+
+    def release(self, level):
+        with self.lock:
+            self.users[level.name] -= 1
+            if self.users[level.name] <= 0:
+                del self.users[level.name]
+                self.idle_since[level.name] = time.monotonic()
+
+    def memory_bytes(self):
+        return sum(level.memory_bytes() for level in self.loaded())
+
+    def evict(self):
+        """Close idle levels: all that sat empty past idle_seconds, then least
+        recently used ones while over budget -> names closed"""
+        now = time.monotonic()
+        over = self.memory_bytes() - self.budget
+        closed = []
+        for level in self.loaded():
+            if level.name in self.users: continue
+            expired = now - self.idle_since.get(level.name, now) >= self.idle_seconds
+            if not expired and over <= 0: continue
+            size = level.memory_bytes()
+            if self.close(level):
+                over -= size
+                closed.append(level.name)
+        return closed
+
+    def close(self, level):
+        """Save and unload `level` unless somebody picked it up meanwhile"""
+        with self.name_locks[level.name]:
+            with self.lock:
+                if level.name in self.users or self.levels.get(level.name) is not level:
+                    return False
+                del self.levels[level.name]
+                self.idle_since.pop(level.name, None)
+            level.close()
+        print(f"[WORLD] Unloaded {level.name} ({len(self.levels)} loaded)")
+        return True
+
+    def close_all(self):
+        """Save and close every level, held or not (shutdown)"""
+        for level in self.loaded():
+            with self.name_locks[level.name]:
+                try:
+                    level.close()
+                except Exception as e:
+                    print(f"[ERROR] Closing {level.name} failed: {e}")
+
+    def _checker(self):
+        while True:
+            self.wake.wait(CHECK_INTERVAL)
+            self.wake.clear()
+            try:
+                self.evict()
+            except Exception as e:
+                print(f"[ERROR] Unloading idle worlds failed: {e}")